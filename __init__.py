@@ -9,7 +9,6 @@ Differentially syncs Anki decks and notes to a specified Obsidian vault folder.
 import os
 import sys
 import time
-import traceback
 
 addon_path = os.path.dirname(__file__)
 vendor_path = os.path.join(addon_path, "vendor")
@@ -27,70 +26,112 @@ if missing_deps:
 
 from aqt import mw
 from aqt.qt import QAction, QMenu, qconnect
-from aqt.utils import showInfo, showWarning
+from aqt.operations import QueryOp
+from aqt.utils import showInfo, showWarning, tooltip
 
-from .config import get_obsidian_path
-from .state_builder import build_anki_state, build_obsidian_state
-from .diff_calculator import calculate_diff
-from .executor import execute_deletions_and_folders, execute_note_writes, execute_moc_generation
+from .config import get_obsidian_path, load_settings, get_auto_sync, set_auto_sync
+from .state_builder import build_anki_state
+from .sync_pipeline import sync_vault
 from .config_ui import show_config_dialog
-
-def sync_to_obsidian():
+from .sync_manifest import rebuild_manifest
+from .sync_progress import progress, SyncCancelled
+from .sync_log import log, errors, configure_logging
+from .sync_stats import stats
+from .sync_profiler import SyncProfiler, profiling_requested, profiled_settings
+from .auto_sync import AutoSync
+
+_profiled = None  # (SyncProfiler, anki_state) of a profiled sync
+
+def sync_to_obsidian(profile: bool = False):
+    """Start a sync in the background.
+
+    The Anki state is extracted on the collection thread (QueryOp), which gives
+    a consistent snapshot; scanning the vault, converting and writing then run
+    on a worker thread, so Anki keeps repainting and the progress window stays
+    responsive. That window is modal for the whole run; closing it cancels the
+    sync between two files.
+
+    With `profile` (or OBSIDIAN_SYNC_PROFILE set) both steps run under a
+    SyncProfiler and the profile folder is named in the final message.
+    """
+    global _profiled
     obsidian_path = get_obsidian_path()
     if not obsidian_path:
         showWarning("Obsidian sync path not configured. Please set it via Tools > Obsidian Sync > Configure...")
         return
+    settings = load_settings()
+    profiler = SyncProfiler() if profile or profiling_requested() else None
+    if profiler: settings = profiled_settings(settings)
+    if not progress.begin(updates_per_second=settings.progress_rate):
+        tooltip("An Obsidian sync is already running.")
+        return
 
     start_time = time.time()
-    mw.progress.start(label="Starting Obsidian Sync...", immediate=True)
-
-    try:
-        anki_state = build_anki_state(mw.col)
-        obsidian_state = build_obsidian_state(obsidian_path)
-        assets_rel_path = obsidian_state.get("assets_folder_rel", "assets")
-
-        actions = calculate_diff(anki_state, obsidian_state)
-        if not any(v for k, v in actions.items() if isinstance(v, (list, set)) and v):
-            deck_count = sum(1 for k in anki_state if k != "_root_")
-            card_count = sum(
-                len(note_data.get("card_ids", []))
-                for deck_data in anki_state.values()
-                if isinstance(deck_data, dict)
-                for note_data in deck_data.get("notes", {}).values()
-            )
-            mw.progress.finish()
-            showInfo(
-                f"Obsidian sync complete. No changes detected.\n\n"
-                f"Scanned {deck_count} deck(s) / {card_count} card(s)."
-            )
-            return
-
-        execute_deletions_and_folders(actions, obsidian_state["base_path"], assets_rel_path)
-        execute_note_writes(actions, obsidian_state["base_path"], assets_rel_path)
-        execute_moc_generation(actions, anki_state, obsidian_state["base_path"])
-
-        # --- Build summary statistics ---
-        deck_count = sum(1 for k in anki_state if k != "_root_")
-        card_count = sum(
-            len(note_data.get("card_ids", []))
-            for deck_data in anki_state.values()
-            if isinstance(deck_data, dict)
-            for note_data in deck_data.get("notes", {}).values()
-        )
-        notes_created = len(actions.get("notes_to_create", []))
-        notes_updated = len(actions.get("notes_to_update", []))
-        notes_deleted = len(actions.get("notes_to_delete", []))
-
-        mw.progress.finish()
-        showInfo(
-            f"Obsidian sync finished successfully in {time.time() - start_time:.2f} seconds.\n\n"
-            f"Exported {deck_count} deck(s) / {card_count} card(s).\n"
-            f"Notes: {notes_created} created, {notes_updated} updated, {notes_deleted} deleted."
-        )
-    except Exception as e:
-        mw.progress.finish()
-        print(traceback.format_exc())
-        showWarning(f"Obsidian sync failed.\nError: {e}\n\nSee console or debug log for details.")
+    configure_logging(settings.log_level); errors.reset(); stats.reset("full")
+    progress.start(label="Starting Obsidian Sync...", immediate=True)
+    _profiled = (profiler, None) if profiler else None
+    if profiler: profiler.start()
+
+    def extract(col):
+        with stats.phase("extract"): return build_anki_state(col, settings=settings), col.media.dir()
+
+    def extracted(result):
+        global _profiled
+        anki_state, media_dir = result
+        if profiler: _profiled = (profiler, anki_state)
+        run = profiler.run if profiler else (lambda fn, *args: fn(*args))
+        mw.taskman.run_in_background(lambda: run(sync_vault, anki_state, media_dir, obsidian_path, settings, start_time),
+                                     _sync_finished)
+
+    if profiler: op = lambda col: profiler.run(extract, col)
+    else: op = extract
+
+    QueryOp(parent=mw, op=op, success=extracted).failure(_sync_failed).run_in_background()
+
+def _sync_finished(future):
+    try: message = future.result()
+    except Exception as e: _sync_failed(e)
+    else: stats.write_report("ok"); showInfo(message + _end_sync())
+
+def _sync_failed(error: Exception):
+    stats.write_report("cancelled" if isinstance(error, SyncCancelled) else "failed")
+    profile_note = _end_sync()
+    if isinstance(error, SyncCancelled):
+        showInfo("Obsidian sync cancelled.\n\nEvery file written so far is complete; the next sync picks up the rest." + profile_note)
+        return
+    log.error("Sync failed", exc_info=error)
+    showWarning(f"Obsidian sync failed.\nError: {error}\n\nSee console or debug log for details.{profile_note}")
+
+def _end_sync() -> str:
+    """Close the run; returns a line naming the profile folder of a profiled sync."""
+    global _profiled
+    progress.end()
+    if _profiled is None: return ""
+    (profiler, anki_state), _profiled = _profiled, None
+    out_dir = profiler.finish(anki_state)
+    return f"\n\nProfile written to {out_dir}" if out_dir else ""
+
+def sync_with_profiling():
+    sync_to_obsidian(profile=True)
+
+def rebuild_sync_manifest():
+    if progress.running:
+        tooltip("Wait for the running Obsidian sync to finish first.")
+        return
+    obsidian_path = get_obsidian_path()
+    if not obsidian_path:
+        showWarning("Obsidian sync path not configured. Please set it via Tools > Obsidian Sync > Configure...")
+        return
+    rebuild_manifest(obsidian_path)
+    showInfo("Sync manifest cleared. The next sync will re-read every note file in the vault.")
+
+def toggle_auto_sync(checked: bool):
+    set_auto_sync(checked)
+    if checked and not get_obsidian_path():
+        showWarning("Obsidian sync path not configured. Please set it via Tools > Obsidian Sync > Configure...")
+
+auto_sync = AutoSync()
+auto_sync.install()
 
 def add_menu_items():
     if not hasattr(mw, "menuObsidianSync"):
@@ -101,6 +142,20 @@ def add_menu_items():
     qconnect(sync_action.triggered, sync_to_obsidian)
     mw.menuObsidianSync.addAction(sync_action)
 
+    profile_action = QAction("Sync with Profiling", mw)
+    qconnect(profile_action.triggered, sync_with_profiling)
+    mw.menuObsidianSync.addAction(profile_action)
+
+    auto_action = QAction("Auto-Sync Edited Notes", mw)
+    auto_action.setCheckable(True)
+    auto_action.setChecked(get_auto_sync())
+    qconnect(auto_action.toggled, toggle_auto_sync)
+    mw.menuObsidianSync.addAction(auto_action)
+
+    rebuild_action = QAction("Rebuild Sync Manifest", mw)
+    qconnect(rebuild_action.triggered, rebuild_sync_manifest)
+    mw.menuObsidianSync.addAction(rebuild_action)
+
     config_action = QAction("Configure...", mw)
     qconnect(config_action.triggered, show_config_dialog)
     mw.menuObsidianSync.addAction(config_action)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in live mode ("autoSync"): keeps the vault up to date while you edit.
+
+Anki hooks (note added, field edited, note/card/deck operations, notes
+deleted) mark notes as dirty and (re)start a single-shot timer. Once nothing
+was edited for `autoSyncDelay` seconds, a targeted sync runs for just those
+notes: the Anki state is extracted as usual (incremental, so only edited notes
+are re-read), but the vault side is looked up through the sync manifest and
+calculate_diff/execute_* only see the dirty notes, their media and their
+decks' MOCs. When the profile closes, pending notes are written right away.
+
+Not every change names its notes (a browser "Change Deck", a sync from
+AnkiWeb), so the notes and cards tables are also queried for rows modified
+since the last run, and notes that still have a file in the vault but are
+gone from the collection are deleted. Renaming, adding or removing decks
+moves whole folders; when the deck structure differs from the one the last
+full sync exported (kept in the sync manifest, so this also holds for the
+first run after Anki starts) a quiet full sync runs instead.
+"""
+
+import time
+from typing import Set
+
+from aqt import mw, gui_hooks
+from aqt.qt import QTimer, qconnect
+from aqt.operations import QueryOp
+from aqt.utils import tooltip
+
+from .config import get_obsidian_path, load_settings, SyncSettings
+from .state_builder import build_anki_state
+from .sync_pipeline import sync_vault, sync_notes, needs_full_sync
+from .sync_progress import progress, SyncCancelled
+from .sync_stats import stats
+from .sync_log import log, errors, configure_logging
+
+try: from anki import hooks as anki_hooks
+except ImportError: anki_hooks = None
+
+
+class AutoSync:
+    """Collects dirty note ids from Anki's hooks and syncs them after an idle period."""
+
+    def __init__(self):
+        self.dirty: Set[int] = set()
+        self.watermarks = None  # (max notes.mod, max cards.mod) as of the last run
+        self.timer = None
+
+    def install(self):
+        gui_hooks.add_cards_did_add_note.append(self.on_note_added)
+        gui_hooks.editor_did_unfocus_field.append(self.on_field_unfocused)
+        gui_hooks.operation_did_execute.append(self.on_operation)
+        gui_hooks.sync_did_finish.append(self.schedule)
+        gui_hooks.profile_did_open.append(self.on_profile_open)
+        gui_hooks.profile_will_close.append(self.flush)
+        if anki_hooks is not None and hasattr(anki_hooks, "notes_will_be_deleted"):
+            anki_hooks.notes_will_be_deleted.append(self.on_notes_deleted)
+
+    @staticmethod
+    def enabled() -> bool:
+        return load_settings().auto_sync and bool(get_obsidian_path())
+
+    # --- hooks ---
+
+    def on_profile_open(self):
+        self.dirty.clear()
+        self.watermarks = self.read_watermarks(mw.col) if mw.col else None
+
+    def on_note_added(self, note):
+        self.mark([note.id])
+
+    def on_field_unfocused(self, changed: bool, note, field_idx: int) -> bool:
+        if note.id: self.mark([note.id])
+        return changed
+
+    def on_operation(self, changes, handler):
+        if any(getattr(changes, name, False) for name in ("note_text", "card", "deck", "notetype")): self.schedule()
+
+    def on_notes_deleted(self, col, ids):
+        self.mark(ids)
+
+    def mark(self, nids):
+        self.dirty.update(int(nid) for nid in nids)
+        self.schedule()
+
+    def schedule(self, *args):
+        if not self.enabled(): return
+        if self.timer is None:
+            self.timer = QTimer(mw); self.timer.setSingleShot(True)
+            qconnect(self.timer.timeout, self.run)
+        self.timer.start(load_settings().auto_sync_delay * 1000)
+
+    # --- running ---
+
+    @staticmethod
+    def read_watermarks(col):
+        return (col.db.scalar("select max(mod) from notes") or 0, col.db.scalar("select max(mod) from cards") or 0)
+
+    def modified_notes(self, col) -> Set[int]:
+        """Notes whose note or card rows changed since the last run (same-second edits included)."""
+        if self.watermarks is None: return set()
+        notes_mod, cards_mod = self.watermarks
+        return set(col.db.list("select id from notes where mod >= ?", notes_mod)) | \
+            set(col.db.list("select distinct nid from cards where mod >= ?", cards_mod))
+
+    def extract(self, col, settings: SyncSettings, nids: Set[int]):
+        with stats.phase("extract"):
+            watermarks = self.read_watermarks(col)
+            nids = nids | self.modified_notes(col)
+            return build_anki_state(col, settings=settings), col.media.dir(), nids, watermarks
+
+    def run(self):
+        """Timer callback (main thread): start a targeted sync of the dirty notes in the background."""
+        obsidian_path = get_obsidian_path()
+        if not self.enabled() or not obsidian_path or not mw.col: return
+        settings = load_settings()
+        if not progress.begin(quiet=True):
+            self.schedule()  # a manual sync is running; try again after it
+            return
+        nids, self.dirty = self.dirty, set()
+        start_time = time.time()
+        configure_logging(settings.log_level); errors.reset(); stats.reset("targeted")
+
+        def extracted(result):
+            anki_state, media_dir, all_nids, watermarks = result
+
+            def work():
+                if needs_full_sync(anki_state, obsidian_path):
+                    stats.kind = "full"
+                    return True, sync_vault(anki_state, media_dir, obsidian_path, settings, start_time)
+                return False, sync_notes(anki_state, media_dir, obsidian_path, settings, all_nids)
+            mw.taskman.run_in_background(work, lambda future: self.finished(future, nids, watermarks, start_time))
+
+        QueryOp(parent=mw, op=lambda col: self.extract(col, settings, nids), success=extracted) \
+            .failure(lambda error: self.failed(error, nids)).run_in_background()
+
+    def finished(self, future, nids, watermarks, start_time):
+        try: full, result = future.result()
+        except Exception as e: self.failed(e, nids); return
+        stats.write_report("ok", notes=len(nids)); progress.end()
+        self.watermarks = watermarks
+        if full:
+            log.info("%s", result)
+            tooltip("Obsidian vault re-synced (deck structure changed).")
+        elif result is None:
+            log.warning("Auto-sync: no sync manifest yet; run Sync Now once.")
+        elif any(result.values()):
+            log.info("Auto-sync: %d created, %d updated, %d deleted in %.3fs.", result["notes_to_create"],
+                     result["notes_to_update"], result["notes_to_delete"], time.time() - start_time)
+        if errors:
+            log.warning("Auto-sync finished with errors.\n%s", errors.summary())
+            tooltip(f"Obsidian auto-sync: {len(errors)} file(s) failed; see the console.")
+        if self.dirty: self.schedule()
+
+    def failed(self, error: Exception, nids: Set[int]):
+        stats.write_report("cancelled" if isinstance(error, SyncCancelled) else "failed"); progress.end()
+        self.dirty |= nids  # retried with the next edit
+        log.error("Auto-sync failed", exc_info=error)
+        tooltip(f"Obsidian auto-sync failed: {error}")
+
+    def flush(self):
+        """Profile is closing: write pending notes now, on the main thread (the collection is still open).
+
+        Deck structure changes are left to the next sync; closing should not wait for a full one.
+        """
+        if self.timer is not None: self.timer.stop()
+        obsidian_path = get_obsidian_path()
+        if not self.enabled() or not obsidian_path or not mw.col: return
+        nids = self.dirty | self.modified_notes(mw.col)
+        if not nids or not progress.begin(quiet=True): return
+        self.dirty = set(); errors.reset(); stats.reset("targeted")
+        try:
+            settings = load_settings()
+            with stats.phase("extract"): anki_state = build_anki_state(mw.col, settings=settings)
+            sync_notes(anki_state, mw.col.media.dir(), obsidian_path, settings, nids)
+            if errors: log.warning("Auto-sync finished with errors.\n%s", errors.summary())
+            stats.write_report("ok", notes=len(nids))
+        except Exception:
+            log.exception("Auto-sync on close failed")
+            stats.write_report("failed")
+        finally:
+            progress.end()
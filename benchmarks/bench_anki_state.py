@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark: per-note cost of build_anki_state, per-note API vs bulk SQL extraction,
+plus the total cost of an incremental extraction when nothing changed.
+
+Usage:
+    python benchmarks/bench_anki_state.py [--notes 1000 10000] [--repeat 3]
+
+The fake collection answers get_note/get_card from an in-process SQLite
+database, which is far cheaper than a real backend round-trip, so the speedup
+measured here is a lower bound of what a real collection sees.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_anki
+
+mw = fake_anki.install()
+state_builder = fake_anki.addon_module("state_builder")
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'notes':>8} {'per-note us':>12} {'bulk us':>10} {'speedup':>8} {'no-change ms':>13}")
+    for n in args.notes:
+        col = fake_anki.make_collection(n)
+        mw.col = col
+        tree = state_builder.DeckTree.from_collection(col, [])
+        legacy_s, legacy_state = _time(lambda: state_builder.build_anki_state(col, bulk=False, deck_tree=tree, incremental=False), args.repeat)
+        bulk_s, bulk_state = _time(lambda: state_builder.build_anki_state(col, bulk=True, deck_tree=tree, incremental=False), args.repeat)
+        if legacy_state != bulk_state:
+            print(f"ERROR: bulk and per-note states differ for {n} notes")
+            return 1
+        state_builder.clear_anki_state_cache()
+        state_builder.build_anki_state(col, incremental=True)
+        noop_s, _ = _time(lambda: state_builder.build_anki_state(col, incremental=True), args.repeat)
+        print(f"{n:>8} {legacy_s / n * 1e6:>12.1f} {bulk_s / n * 1e6:>10.1f} {legacy_s / bulk_s:>7.1f}x {noop_s * 1e3:>13.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark: Markdown conversion of note bodies, in-process vs the conversion
+process pool used by execute_note_writes, and cold vs warm conversion cache.
+
+Usage:
+    python benchmarks/bench_conversion.py [--notes 5000] [--workers 2 4 8] [--repeat 1]
+
+Each note gets a table, a list and some inline formatting so the run is
+dominated by BeautifulSoup/markdownify, as on a real collection. Pool timings
+include worker start-up. Pool and in-process rows start from an empty cache;
+the last two rows re-run in-process with a warm memory tier and with only the
+on-disk tier (a fresh Anki session).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_anki
+
+mw = fake_anki.install()
+state_builder = fake_anki.addon_module("state_builder")
+executor = fake_anki.addon_module("executor")
+html_converter = fake_anki.addon_module("html_converter")
+
+_RICH_BACK = (
+    "<div><b>Answer</b> {i} with <i>emphasis</i> and <a href='https://example.org/{i}'>a link</a>.</div>"
+    "<ul><li>first point {i}</li><li>second <code>point</code></li><li>third point</li></ul>"
+    "<table><tr><th>Key</th><th>Value</th></tr>"
+    "<tr><td>alpha</td><td>{i}</td></tr><tr><td>beta</td><td><b>{i}</b><br>line two</td></tr></table>"
+    "<img src='figure_{i}.png'>"
+)
+
+
+def _note_actions(n):
+    col = fake_anki.make_collection(n)
+    mw.col = col
+    state = state_builder.build_anki_state(col, incremental=False)
+    actions = []
+    for path, deck in state.items():
+        if path == "_root_":
+            continue
+        for record in deck["notes"].values():
+            fields = dict(record["relevant_fields"])
+            if "Back" in fields:
+                fields["Back"] = _RICH_BACK.format(i=record["note_id"])
+            actions.append({"anki_note_data": dict(record, relevant_fields=fields)})
+    return actions
+
+
+def _time(fn, repeat, setup=lambda: None):
+    best = float("inf")
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    actions = _note_actions(args.notes)
+    cold = lambda: html_converter.configure_conversion_cache(None).clear()
+    serial_s, expected = _time(lambda: list(executor.iter_note_bodies(actions, 1)), args.repeat, cold)
+    print(f"{'run':>12} {'seconds':>9} {'notes/s':>9} {'speedup':>8}")
+    print(f"{'1 worker':>12} {serial_s:>9.2f} {len(actions) / serial_s:>9.0f} {1.0:>7.1f}x")
+    for workers in sorted(set(args.workers)):
+        if workers < 2:
+            continue
+        pool_s, bodies = _time(lambda: list(executor.iter_note_bodies(actions, workers)), args.repeat)
+        if bodies != expected:
+            print(f"ERROR: pool output with {workers} workers differs from in-process conversion")
+            return 1
+        print(f"{f'{workers} workers':>12} {pool_s:>9.2f} {len(actions) / pool_s:>9.0f} {serial_s / pool_s:>7.1f}x")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = os.path.join(tmp, "conversion_cache.sqlite")
+        list(executor.iter_note_bodies(actions, 1, disk_path))
+        rows = [("memory warm", lambda: None), ("disk warm", lambda: html_converter.configure_conversion_cache(None))]
+        for label, setup in rows:
+            stats = {}
+            run = lambda: list(executor.iter_note_bodies(actions, 1, disk_path, stats))
+            warm_s, bodies = _time(run, args.repeat, setup)
+            if bodies != expected:
+                print(f"ERROR: cached output ({label}) differs from uncached conversion")
+                return 1
+            print(f"{label:>12} {warm_s:>9.2f} {len(actions) / warm_s:>9.0f} {serial_s / warm_s:>7.1f}x  {stats}")
+        html_converter.configure_conversion_cache(None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
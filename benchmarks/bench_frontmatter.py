@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark: reading note frontmatter from a synthetic vault.
+
+Compares the old approach (read the whole file, yaml.safe_load the header)
+with read_note_frontmatter (read up to the closing '---', fast fixed-schema
+parser with YAML fallback), and checks both return the same dicts.
+
+Usage:
+    python benchmarks/bench_frontmatter.py [--files 100000] [--body-kb 4] [--keep DIR]
+
+Files are written once to a temporary directory (or --keep DIR, reused if it
+already holds the vault); the OS page cache is warm for both passes.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_anki
+
+fake_anki.install()
+import yaml
+state_builder = fake_anki.addon_module("state_builder")
+
+TAGS = ["Geography::Maps", "history", "UPSC-Prelims", "2024", "polity::fundamental_rights", "#revise"]
+
+
+def make_vault(path: str, n_files: int, body_kb: int, seed: int = 0):
+    rng = random.Random(seed)
+    body_line = "| cell | {{c1::cloze}} | <b>bold</b> | $x^2$ |\n"
+    body = body_line * max(1, body_kb * 1024 // len(body_line))
+    per_dir = 1000
+    for i in range(n_files):
+        folder = os.path.join(path, f"Deck_{i // per_dir:03d}")
+        if i % per_dir == 0:
+            os.makedirs(folder, exist_ok=True)
+        frontmatter = {
+            "anki_note_id": 1_600_000_000_000 + i, "anki_card_id": 1_600_000_500_000 + i,
+            "anki_note_mod": 1_700_000_000 + rng.randint(0, 10 ** 6),
+            "anki_tags": rng.sample(TAGS, rng.randint(0, 3)),
+            "anki_card_reps": rng.randint(0, 50), "anki_card_lapses": rng.randint(0, 5),
+            "anki_card_ivl": rng.randint(0, 400), "anki_card_due": rng.randint(-100, 3000),
+            "anki_card_ease": 2500, "anki_card_queue": rng.choice([-1, 0, 2]),
+            "content_hash": "%032x" % rng.getrandbits(128),
+        }
+        fm = yaml.dump(frontmatter, sort_keys=False, allow_unicode=True, default_flow_style=False)
+        with open(os.path.join(folder, f"note_{i}.md"), "w", encoding="utf-8") as f:
+            f.write(f"---\n{fm}---\n\n{body}")
+
+
+def read_full_yaml(path):
+    """The pre-change reader: whole file, pure-Python YAML."""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if not content.startswith("---"):
+        return None
+    end = content.find("---", 3)
+    if end == -1:
+        return None
+    return yaml.safe_load(content[3:end].strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--body-kb", type=int, default=4)
+    parser.add_argument("--keep", metavar="DIR", help="write the vault here and keep it")
+    args = parser.parse_args()
+
+    vault = args.keep or tempfile.mkdtemp(prefix="bench_vault_")
+    try:
+        if not os.listdir(vault):
+            start = time.perf_counter()
+            make_vault(vault, args.files, args.body_kb)
+            print(f"Generated {args.files} files ({args.body_kb} KB bodies) in {time.perf_counter() - start:.1f}s")
+        paths = [os.path.join(root, fn) for root, _, files in os.walk(vault) for fn in files]
+
+        results = {}
+        for name, reader in (("full read + yaml", read_full_yaml),
+                             ("header-only + fast parser", state_builder.read_note_frontmatter)):
+            start = time.perf_counter()
+            results[name] = [reader(p) for p in paths]
+            elapsed = time.perf_counter() - start
+            print(f"{name:<28} {elapsed:8.2f}s  {elapsed / len(paths) * 1e6:8.1f} us/file")
+
+        old, new = results.values()
+        if old != new:
+            print("ERROR: readers disagree")
+            return 1
+        return 0
+    finally:
+        if not args.keep:
+            shutil.rmtree(vault, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark: rendering a very large deck MOC as one file vs as pages.
+
+Usage:
+    python benchmarks/bench_moc.py [--notes 20000] [--page-size 500 1000 2000] [--repeat 5]
+
+All notes go into one deck. "full" renders every MOC file of the deck
+(what a first sync writes); "one note" is what a sync after editing a
+single note renders and writes: the whole single-file MOC, or the one page
+holding that note. Display texts are warmed first, as they are on every
+sync after the first with incremental extraction.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_anki
+
+mw = fake_anki.install()
+state_builder = fake_anki.addon_module("state_builder")
+executor = fake_anki.addon_module("executor")
+
+
+def _best(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    col = fake_anki.make_collection(args.notes, n_decks=1)
+    mw.col = col
+    state = state_builder.build_anki_state(col, incremental=False)
+    deck_path = next(p for p in state if p != "_root_" and state[p]["notes"])
+    deck_moc = state["_root_"]["deck_tree"].moc_rel_path(deck_path)
+    moc_dir, _, moc_filename = deck_moc.rpartition("/")
+    some_nid = next(iter(state[deck_path]["notes"]))
+    render = lambda path, page_size: executor.generate_moc_content(path, state, None, page_size)
+    render(deck_moc, 0)  # warm display texts
+
+    print(f"{len(state[deck_path]['notes'])} notes in one deck")
+    print(f"{'layout':>14} {'files':>6} {'full ms':>9} {'one note ms':>12} {'bytes written':>14}")
+    full_s, text = _best(lambda: render(deck_moc, 0), args.repeat)
+    single_bytes = len(text.encode("utf-8"))
+    print(f"{'single file':>14} {1:>6} {full_s * 1e3:>9.1f} {full_s * 1e3:>12.1f} {single_bytes:>14}")
+
+    for page_size in args.page_size:
+        page_count = state_builder.moc_page_count(len(state[deck_path]["notes"]), page_size)
+        if not page_count:
+            continue
+        pages = [f"{moc_dir}/{state_builder.moc_page_filename(moc_filename, p)}" for p in range(page_count)]
+        def full():
+            state[deck_path].pop("moc_pages", None)
+            return [render(path, page_size) for path in [deck_moc] + pages]
+        full_s, texts = _best(full, args.repeat)
+        if sum(t.count("\n- [[") for t in texts[1:]) != len(state[deck_path]["notes"]):
+            print(f"ERROR: pages of size {page_size} do not list every note exactly once")
+            return 1
+        page = pages[state_builder.moc_page_of(some_nid, page_count)]
+        one_s, text = _best(lambda: render(page, page_size), args.repeat)
+        label = f"pages of {page_size}"
+        print(f"{label:>14} {page_count + 1:>6} {full_s * 1e3:>9.1f} {one_s * 1e3:>12.1f} {len(text.encode('utf-8')):>14}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
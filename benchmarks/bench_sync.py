@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark: the whole sync pipeline, phase by phase, on generated collections.
+
+Usage:
+    python benchmarks/bench_sync.py [--notes 1000 10000 100000] [--decks 200] [--depth 3]
+                                    [--field-chars 200] [--tables 10] [--math 10] [--media 20]
+                                    [--delta 20] [--workers 1]
+
+For each size a collection is generated (see fake_anki.make_collection:
+every --tables/--math/--media-th note gets a table/MathJax/an image and a
+sound) and synced into an empty temporary vault, then:
+
+    cold        first sync: empty vault, manifest and caches
+    no-change   the same sync again
+    delta       --delta notes edited, one added, one deleted, full sync
+    targeted    --delta other notes edited, auto-sync's sync_notes for them
+
+Each row shows the wall time (ms) of every phase in sync_stats plus the
+total. The fake collection answers from in-process SQLite, so "extract" is
+cheaper than against a real collection; everything after it is the add-on's
+real code against a real file system.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_anki
+
+mw = fake_anki.install()
+mw.taskman = type("TaskManager", (), {"run_on_main": staticmethod(lambda fn: fn())})()
+config = fake_anki.addon_module("config")
+state_builder = fake_anki.addon_module("state_builder")
+html_converter = fake_anki.addon_module("html_converter")
+sync_pipeline = fake_anki.addon_module("sync_pipeline")
+stats = fake_anki.addon_module("sync_stats").stats
+
+PHASES = ("extract", "vault_scan", "media_scan", "diff", "deletions_and_folders", "media_copy", "note_writes", "mocs")
+HEADERS = ("extract", "scan", "media", "diff", "delete", "copy", "write", "mocs")
+
+
+def _next_mod(col):
+    """A modification time after every existing one, as a real edit would get."""
+    return col.db.scalar("SELECT max(mod) FROM notes") + 1
+
+
+def _edit_notes(col, nids, tag):
+    mod = _next_mod(col)
+    for nid in nids:
+        col._conn.execute("UPDATE notes SET flds = replace(replace(flds, '</b>', ?), '}}', ?), mod = ? WHERE id = ?",
+                          (f"</b> {tag}", f" {tag}}}}}", mod, nid))
+
+
+def _run(kind, fn):
+    stats.reset(kind)
+    start = time.perf_counter()
+    fn()
+    total = time.perf_counter() - start
+    return [stats.phases.get(name, {}).get("wall_s", 0.0) for name in PHASES] + [total]
+
+
+def bench(n, args):
+    settings = config.SyncSettings(conversion_workers=args.workers, persistent_conversion_cache=False)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        media_dir, vault = os.path.join(tmp, "media"), os.path.join(tmp, "vault")
+        os.makedirs(media_dir); os.makedirs(vault)
+        manifest_path = os.path.join(tmp, "manifest.sqlite")
+        col = fake_anki.make_collection(n, n_decks=args.decks, depth=args.depth, media_dir=media_dir,
+                                        field_chars=args.field_chars, table_every=args.tables,
+                                        math_every=args.math, media_every=args.media)
+        mw.col = col
+        state_builder.clear_anki_state_cache()
+        html_converter.configure_conversion_cache().clear()
+
+        def extract():
+            with stats.phase("extract"): return state_builder.build_anki_state(col, settings=settings)
+
+        def full_sync():
+            sync_pipeline.sync_vault(extract(), media_dir, vault, settings, time.time(), manifest_path=manifest_path)
+
+        rows.append(("cold", _run("full", full_sync)))
+        rows.append(("no-change", _run("full", full_sync)))
+
+        nids = col.db.list("SELECT id FROM notes ORDER BY id")
+        step = max(1, len(nids) // (2 * args.delta + 2))
+        edited, targeted = nids[1::step][:args.delta], nids[2::step][:args.delta]
+        _edit_notes(col, edited, "delta")
+        col._conn.execute("DELETE FROM cards WHERE nid = ?", (nids[-1],)); col._conn.execute("DELETE FROM notes WHERE id = ?", (nids[-1],))
+        mid, did = col.db.first("SELECT n.mid, c.did FROM notes n JOIN cards c ON c.nid = n.id WHERE n.id = ?", nids[0])
+        col.add_note(mid, did, ["New question?", "<b>New</b> answer", ""], mod=_next_mod(col))
+        rows.append(("delta", _run("full", full_sync)))
+
+        _edit_notes(col, targeted, "targeted")
+        rows.append(("targeted", _run("targeted", lambda: sync_pipeline.sync_notes(
+            extract(), media_dir, vault, settings, set(targeted), manifest_path=manifest_path))))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--decks", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--field-chars", type=int, default=200)
+    parser.add_argument("--tables", type=int, default=10)
+    parser.add_argument("--math", type=int, default=10)
+    parser.add_argument("--media", type=int, default=20)
+    parser.add_argument("--delta", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1, help="conversion workers (1 = in-process)")
+    args = parser.parse_args()
+
+    print(f"{'notes':>7} {'run':<10}" + "".join(f"{h:>9}" for h in HEADERS) + f"{'total':>10}   (ms)")
+    for n in args.notes:
+        for name, times in bench(n, args):
+            print(f"{n:>7} {name:<10}" + "".join(f"{t * 1e3:>9.1f}" for t in times[:-1]) + f"{times[-1] * 1e3:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Golden corpus and throughput gate for convert_html_to_markdown.
+
+The corpus (benchmarks/golden/converter_corpus.json) holds field HTML with
+the conversion options and the exact Markdown the converter produced when
+the corpus was recorded. Any rewrite of the converter must reproduce it byte
+for byte. --check also converts every case with the fast tiers disabled and
+reports any field where a fast tier disagrees with the full path.
+
+--check then times the converter (cache bypassed) per case category,
+reports fields/s and MB/s and compares them with the baseline in
+benchmarks/golden/converter_throughput.json; a category more than
+--threshold slower than recorded fails the check. The comparison is
+relative to a reference workload timed alongside (see measure()), but
+record the baseline on the machine where the gate runs (--record-throughput)
+and re-record it when a speedup lands.
+
+Usage:
+    python benchmarks/converter_corpus.py --check         # compare, exit 1 on any difference or slowdown
+    python benchmarks/converter_corpus.py --check --no-timing
+    python benchmarks/converter_corpus.py --record        # (re)record expected outputs
+    python benchmarks/converter_corpus.py --record --random 2000 --seed 7
+    python benchmarks/converter_corpus.py --record-throughput [--repeat 7]
+
+Inputs, by category: the cases from test_enhanced_converter.py ("unit"),
+hand-written edge cases (math delimiters, nested tables, clozes with hints,
+media, entities), anonymized fields as real decks write them (nested
+tables, MathJax, clozes with hints, image occlusion, multiple choice),
+generated large fields and randomized fields assembled from the building
+blocks below.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_anki
+
+fake_anki.install()
+html_converter = fake_anki.addon_module("html_converter")
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+CORPUS_PATH = os.path.join(GOLDEN_DIR, "converter_corpus.json")
+THROUGHPUT_PATH = os.path.join(GOLDEN_DIR, "converter_throughput.json")
+OPTIONS = [(True, True), (False, True), (True, False)]  # (preserve_tables, remove_hints)
+DEFAULT_THRESHOLD = 0.25  # fail when a category is more than 25% slower than the baseline
+MIN_ROUND_SECONDS = 0.05  # each timing round converts a category's fields this long at least
+
+_TEST_CASES = [
+    """<div><u></u><table class="table_class_basic_full_width" style="font-size: 85%; width: 100%; border-collapse: collapse; border: 1px solid;"><tbody><tr><td style="width: 33%; padding: 2px; border: 1px solid;"><br>WHAT IS GEOGRAPHY? (1:20:14)</td><td style="width: 33%; padding: 2px; border: 1px solid;">Definition &amp; History</td><td style="width: 33%; padding: 2px; border: 1px solid;"><ul>
+<li>GEOGRAPHY: {{c1::Description of Earth::DiscOE}}</li>
+<li>{{c1::ERATOSTHENES::E}}: Father of Geography, coined the term</li>
+<li>Study of PLACES &amp; RELATIONSHIP BETWEEN PEOPLE AND THEIR ENVIRONMENT</li></ul></td></tr></tbody></table></div>""",
+    """<img src="paste-3d0da76d8d30ea27ff59b2d1b43059a6babe556f.jpg" width="115">
+[sound:pronunciation.mp3]
+<video src="demo.mp4"></video>""",
+]
+
+_EDGE_CASES = [
+    "plain text", "", " ", "line one<br>line two<br/>line three", "a &amp; b &lt;c&gt; &nbsp; d",
+    r"Inline \(x^2\) and block \[\int_0^1 f\]", "[$]a+b[/$] and [$$]c[/$$]",
+    '<anki-mathjax>e^{i\\pi}</anki-mathjax> <anki-mathjax block="true">\\sum_i i</anki-mathjax>',
+    "$a$ and $$b$$", "costs $5 today", "costs $5 and $6", r"\(a\)\(b\)\(c\)", r"\(\) then \[b\]",
+    r"$a $$b$$ c$", r"\[ a \( b \) \]", "$$$$", "$$x$ y$$", r"\(a\) \(b\)", "price\\] stray \\(",
+    "{{c1::cloze}} and {{c2::with::hint}}", "{{c1::$x$}} math in cloze", "{{c1::<b>bold</b>::h}}",
+    "<b>bold</b> <i>it</i> <u>u</u> <s>s</s> <sup>1</sup><sub>2</sub> <span style='color:red'>red</span>",
+    "<ul><li>one</li><li>two<ul><li>nested</li></ul></li></ul><ol><li>first</li></ol>",
+    "<table><tr><td>outer<table><tr><td>inner {{c1::x}}</td></tr></table></td></tr></table>",
+    "<table><tr><td>$a$ [sound:x.mp3]</td></tr></table> after <table><tr><td>2</td></tr></table>",
+    "<TABLE><TR><TD>upper</TD></TR></TABLE>", "<img src=unquoted.png>", "<IMG SRC='UPPER.PNG'>",
+    "<img src='a.jpg'><img src=\"b.webp\"><img src='c.bin'>", "![[already embedded.png]] text",
+    "{{c1::![[img.png]]}}", "<h1>Head</h1><h2>Sub</h2><p>para</p><blockquote>quote</blockquote>",
+    "<a href='https://example.org'>link</a> <code>x_y*z</code> snake_case_word *star*",
+    "MATHPLACEHOLDER0ENDMATH literal", "<div>\n\n\n\n</div>many\n\n\n\nnewlines",
+    "<pre>pre\n  formatted</pre>", "<font color='blue'>font</font>", "<del>gone</del>",
+]
+
+# Anonymized fields as common note types and add-ons write them.
+_REAL_WORLD_CASES = {
+    "nested_tables": [
+        """<table style="width:100%; border-collapse:collapse"><thead><tr><th>Drug class</th><th>Examples</th></tr></thead><tbody><tr><td><b>ACE inhibitors</b></td><td><table><tr><td>{{c1::Lisinopril::-pril}}</td><td>{{c2::Enalapril}}</td></tr><tr><td colspan="2"><i>Side effect:</i> dry cough</td></tr></table></td></tr><tr><td rowspan="2">Beta blockers</td><td><ul><li>Metoprolol</li><li>Atenolol&nbsp;(β<sub>1</sub>)</li></ul></td></tr><tr><td>[sound:beta_blockers.mp3]</td></tr></tbody></table>""",
+        """<div><table class="comparison"><tr><td style="vertical-align: top"><table><tr><th>Left</th></tr><tr><td><table><tr><td>deep <b>cell</b></td></tr></table></td></tr></table></td><td><img src="paste-8f14e45fceea167a5a36dedd4bea2543.png" style="max-width: 200px"></td></tr></table></div><div><br></div><div>Source: lecture 4</div>""",
+        """<table><tbody><tr><td>\\(\\Delta G = \\Delta H - T\\Delta S\\)</td><td>{{c1::spontaneous if \\(\\Delta G &lt; 0\\)::sign}}</td></tr><tr><td>Units</td><td>kJ&nbsp;mol<sup>-1</sup></td></tr></tbody></table>""",
+    ],
+    "mathjax": [
+        """The roots of \\(ax^2 + bx + c = 0\\) are<br>\\[x = \\frac{-b \\pm \\sqrt{b^2 - 4ac}}{2a}\\]<div>valid for \\(a \\neq 0\\)</div>""",
+        """\\[\\begin{pmatrix} 1 &amp; 2 \\\\ 3 &amp; 4 \\end{pmatrix}^{-1} = \\frac{1}{-2}\\begin{pmatrix} 4 &amp; -2 \\\\ -3 &amp; 1 \\end{pmatrix}\\]""",
+        """<anki-mathjax>\\sum_{i=1}^{n} i = \\frac{n(n+1)}{2}</anki-mathjax> and <anki-mathjax block="true">\\int_a^b f'(x)\\,dx = f(b) - f(a)</anki-mathjax>""",
+        """If \\(p &lt; 0.05\\) and \\(n &gt; 30\\), use \\(z = \\frac{\\bar{x} - \\mu}{\\sigma / \\sqrt{n}}\\); costs $5 per test.""",
+        """<div>\\(\\ce{2H2 + O2 -&gt; 2H2O}\\)</div><div>\\(\\text{pH} = -\\log_{10}[\\ce{H+}]\\)</div>""",
+    ],
+    "cloze_hints": [
+        """{{c1::Mitochondria::organelle}} are the site of {{c2::oxidative phosphorylation::process}} in the {{c3::cell}}.""",
+        """<div>The French Revolution began in {{c1::<b>1789</b>::year}} with the storming of the {{c2::Bastille::fortress}} at {{c3::12:30::time}}.</div>""",
+        """<ul><li>{{c1::Na<sup>+</sup>}} out, {{c1::K<sup>+</sup>}} in</li><li>ratio {{c2::3:2::out:in}}</li><li>{{c3::\\(E = mc^2\\)::formula}}</li></ul>""",
+        """{{c1::Paris}}, {{c1::Lyon}} and {{c2::Marseille::largest port}}<br><br>{{c3::<img src="map_france.jpg">::map}}""",
+    ],
+    "image_occlusion": [
+        """{{c1::image-occlusion:rect:left=.1234:top=.2345:width=.3012:height=.0581:oi=1}}<br>{{c2::image-occlusion:ellipse:left=.5:top=.5:rx=.1:ry=.05:oi=1}}<br>{{c3::image-occlusion:polygon:points=.1,.1 .2,.3 .4,.2:oi=1}}""",
+        """<img src="io-heart-diagram-2f1e.png">""",
+        """<div><img src="oe-7c5d3a9b-ao-3-Q.svg" class="io-overlay"></div><div><img src="oe-7c5d3a9b-ao-3-Original.png"></div>""",
+        """<b>Left ventricle</b><br><i>Label the chambers</i><div class="io-comments">From <a href="https://example.org/atlas">atlas</a>, fig. 12</div>""",
+    ],
+    "mcq": [
+        """<div class="question">Which of the following are noble gases?</div><ol type="A"><li>Neon</li><li>Nitrogen</li><li>Argon</li><li>Oxygen</li></ol>""",
+        """Q: Which enzyme unwinds DNA?<br>1. Ligase<br>2. Helicase<br>3. Primase<br>4. Topoisomerase<br><br><div class="answers">0 1 0 0</div>""",
+        """<table class="mcq"><tr><td><input type="checkbox" disabled> 2 &lt; 3</td><td>true</td></tr><tr><td><input type="checkbox" disabled> \\(\\sqrt{2} \\in \\mathbb{Q}\\)</td><td>false</td></tr></table>""",
+        """<div>Kprim: mark each statement</div><ul><li>(1) Insulin lowers blood glucose</li><li>(2) Glucagon is made in \u03b2-cells</li><li>(3) Both are peptides</li><li>(4) Both act via GPCRs</li></ul><div><span class="kprim-answer">1 0 1 0</span></div>""",
+    ],
+}
+
+
+def large_cases():
+    """Generated fields far bigger than usual: long tables, lists, prose and many math spans or clozes."""
+    rows = "".join(f"<tr><td>row {i}</td><td><b>{i * 7}</b></td><td>{{{{c1::value {i}::hint}}}}</td></tr>" for i in range(300))
+    prose = "".join(f"<div>Paragraph {i}: <i>lorem</i> ipsum dolor sit amet, <u>consectetur</u> adipiscing elit &amp; more.</div>"
+                    for i in range(400))
+    return [
+        f"<table><tr><th>Row</th><th>Value</th><th>Cloze</th></tr>{rows}</table>",
+        prose,
+        " ".join(f"term {i} \\(x_{{{i}}}^2 + y_{{{i}}}\\)" for i in range(500)),
+        "<ul>" + "".join(f"<li>item {i} {{{{c{i % 9 + 1}::answer {i}::h{i}}}}}</li>" for i in range(500)) + "</ul>",
+        "<br>".join(f"line {i} with plain text only" for i in range(2000)),
+    ]
+
+
+_BLOCKS = [
+    "<b>{w}</b>", "<i>{w}</i>", "<u>{w}</u>", "{w}", "{w} {w}", "<br>", "<div>{w}</div>", "<p>{w}</p>",
+    "{{{{c{n}::{w}}}}}", "{{{{c{n}::{w}::{w}}}}}", r"\({w}^{n}\)", r"\[{w}_{n}\]", "${w}$", "$${w}$$",
+    "[$]{w}[/$]", "[$$]{w}[/$$]", "<anki-mathjax>{w}</anki-mathjax>", '<anki-mathjax block="true">{w}</anki-mathjax>',
+    "<img src='paste-{n}.png'>", "<img src=\"fig_{n}.jpg\" width=\"100\">", "[sound:audio_{n}.mp3]",
+    "<video src='clip_{n}.mp4'></video>", "<ul><li>{w}</li><li>{w}</li></ul>", "<ol><li>{w}</li></ol>",
+    "<table><tr><td>{w}</td><td>{{{{c1::{w}}}}}</td></tr></table>", "<span style='color: red'>{w}</span>",
+    "&amp;", "&nbsp;", "&lt;tag&gt;", "$", "_", "*", "\n", "\n\n\n", "<sup>{n}</sup>", "<a href='http://x/{n}'>{w}</a>",
+]
+_WORDS = ["alpha", "beta", "Gamma", "x", "y_1", "a*b", "GDP", "{{", "}}", "::", "émigré", "数学", "1:20", "#tag"]
+
+
+def random_cases(count: int, seed: int):
+    rng = random.Random(seed)
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 12)):
+            parts.append(rng.choice(_BLOCKS).format(w=rng.choice(_WORDS), n=rng.randint(1, 3)))
+        yield "".join(parts)
+
+
+def corpus_inputs(random_count: int, seed: int):
+    """(category, html, preserve_tables, remove_hints) for every corpus case."""
+    inputs = [("unit", html) for html in _TEST_CASES] + [("edge", html) for html in _EDGE_CASES]
+    inputs += [("random", html) for html in random_cases(random_count, seed)]
+    inputs += [(category, html) for category, cases in _REAL_WORLD_CASES.items() for html in cases]
+    inputs += [("large", html) for html in large_cases()]
+    return [(category, html, pt, rh) for i, (category, html) in enumerate(inputs)
+            for pt, rh in OPTIONS if pt and rh or i % 5 == 0]
+
+
+def convert(html, preserve_tables, remove_hints):
+    return html_converter.convert_html_to_markdown(html, preserve_tables=preserve_tables, remove_hints=remove_hints)
+
+
+def load_corpus(path: str = CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["cases"]
+
+
+def check(cases) -> int:
+    """Return the number of cases whose output differs from the recorded one or from the full path."""
+    html_converter.configure_conversion_cache(None).clear()
+    failures = 0
+    for case in cases:
+        actual = convert(case["input"], case["preserve_tables"], case["remove_hints"])
+        counted = dict(html_converter.tier_counters)  # keep the reference run out of the tier counts
+        full = html_converter._convert_html_to_markdown(case["input"], case["preserve_tables"], case["remove_hints"],
+                                                        fast_paths=False) if case["input"] else ""
+        html_converter.tier_counters.update(counted)
+        if actual != full:
+            failures += 1
+            print(f"TIER MISMATCH for {case['input']!r}:\n  full path {full!r}\n  fast tier {actual!r}")
+        elif actual != case["expected"]:
+            failures += 1
+            if failures <= 5:
+                print(f"MISMATCH for {case['input']!r} (preserve_tables={case['preserve_tables']}, "
+                      f"remove_hints={case['remove_hints']}):\n  expected {case['expected']!r}\n  actual   {actual!r}")
+    return failures
+
+
+def _reference_work():
+    """A fixed stdlib HTML parse, timed next to the converter to factor out machine speed."""
+    parser = HTMLParser(); parser.feed(_REFERENCE_DOC); parser.close()
+
+
+_REFERENCE_DOC = "".join(f"<div class='x'><b>item {i}</b> &amp; <i>more</i><br><table><tr><td>{i}</td></tr></table></div>"
+                         for i in range(300))
+
+
+def _per_call(fn, loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops): fn()
+    return (time.perf_counter() - start) / loops
+
+
+def measure(cases, repeat: int):
+    """Throughput of the uncached converter per case category.
+
+    fields/s and MB/s are the best of *repeat* rounds. Shared or throttled
+    machines vary far more than that between runs, so each round also times
+    _reference_work() around the category; the gate compares the median
+    ratio of the two ("relative_cost"), which stays put when the whole
+    machine is slower.
+    """
+    by_category = {}
+    for case in cases:
+        if case["input"]: by_category.setdefault(case.get("category", "unknown"), []).append(case)
+    counted = dict(html_converter.tier_counters)  # timing runs stay out of the tier counts
+    results = {}
+    for category, group in sorted(by_category.items()):
+        def run():
+            for case in group:
+                html_converter._convert_html_to_markdown(case["input"], case["preserve_tables"], case["remove_hints"])
+        loops = max(1, int(MIN_ROUND_SECONDS / max(_per_call(run, 1), 1e-9)))
+        times, ratios = [], []
+        for _ in range(repeat):
+            before = _per_call(_reference_work, 3)
+            elapsed = _per_call(run, loops)
+            reference = (before + _per_call(_reference_work, 3)) / 2
+            times.append(elapsed); ratios.append(elapsed / reference)
+        best = min(times)
+        size = sum(len(case["input"].encode("utf-8")) for case in group)
+        results[category] = {"fields": len(group), "bytes": size,
+                             "fields_per_s": round(len(group) / best, 1), "mb_per_s": round(size / best / 1e6, 3),
+                             "relative_cost": round(statistics.median(ratios), 5)}
+    html_converter.tier_counters.update(counted)
+    return results
+
+
+def load_throughput(path: str = THROUGHPUT_PATH):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["categories"]
+    except FileNotFoundError:
+        return None
+
+
+def compare_throughput(results, baseline, threshold: float) -> int:
+    """Print throughput against the baseline; return the number of categories slower than allowed."""
+    regressions = 0
+    print(f"{'category':<16} {'fields':>7} {'fields/s':>10} {'MB/s':>8} {'baseline MB/s':>14} {'relative':>9}")
+    for category, r in results.items():
+        base = (baseline or {}).get(category)
+        line = f"{category:<16} {r['fields']:>7} {r['fields_per_s']:>10.1f} {r['mb_per_s']:>8.3f}"
+        if base:
+            change = base["relative_cost"] / r["relative_cost"] - 1  # > 0: faster than the baseline
+            slow = change < -threshold
+            regressions += slow
+            line += f" {base['mb_per_s']:>14.3f} {change:>+8.0%}" + ("  REGRESSION" if slow else "")
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--random", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--record-throughput", action="store_true")
+    parser.add_argument("--no-timing", action="store_true", help="check outputs only")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.record:
+        html_converter.configure_conversion_cache(None).clear()
+        cases = [{"category": category, "input": html, "preserve_tables": pt, "remove_hints": rh,
+                  "expected": convert(html, pt, rh)}
+                 for category, html, pt, rh in corpus_inputs(args.random, args.seed)]
+        os.makedirs(os.path.dirname(CORPUS_PATH), exist_ok=True)
+        with open(CORPUS_PATH, "w", encoding="utf-8") as f:
+            json.dump({"seed": args.seed, "cases": cases}, f, ensure_ascii=False, indent=0)
+            f.write("\n")
+        print(f"Recorded {len(cases)} cases to {CORPUS_PATH}")
+    if args.record_throughput:
+        results = measure(load_corpus(), args.repeat)
+        with open(THROUGHPUT_PATH, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "categories": results}, f, indent=1)
+            f.write("\n")
+        compare_throughput(results, None, args.threshold)
+        print(f"Recorded throughput baseline to {THROUGHPUT_PATH}")
+    if args.check or not (args.record or args.record_throughput):
+        cases = load_corpus()
+        html_converter.tier_counters.update(dict.fromkeys(html_converter.TIER_COUNTERS, 0))
+        failures = check(cases)
+        print(f"{len(cases) - failures}/{len(cases)} cases match the golden corpus")
+        print("Conversion tiers:", html_converter.tier_counters)
+        regressions = 0
+        if not args.no_timing:
+            baseline = load_throughput()
+            if baseline is None: print(f"No throughput baseline at {THROUGHPUT_PATH}; run --record-throughput.")
+            regressions = compare_throughput(measure(cases, args.repeat), baseline, args.threshold)
+            if regressions: print(f"{regressions} categor{'y is' if regressions == 1 else 'ies are'} more than {args.threshold:.0%} slower than the baseline")
+        return 1 if failures or regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-memory stand-ins for the parts of Anki the add-on touches, for running it
+outside the Anki GUI.
+
+install() registers stub `aqt`/`anki` modules (only when the real ones are not
+importable), puts vendor/ on sys.path and exposes the add-on as the package
+`anki_obsidian_sync` without running its __init__.py (which builds Qt menus).
+
+FakeCollection keeps the notes/cards tables in SQLite using the same column
+names as a real collection, so both the per-note Note/Card API and raw
+`col.db` queries behave like the real thing.
+"""
+
+import importlib
+import os
+import random
+import sqlite3
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "anki_obsidian_sync"
+
+
+# ═══════════════════ Module stubs ═══════════════════
+
+class _FakeProgress:
+    def start(self, *args, **kwargs): pass
+    def update(self, *args, **kwargs): pass
+    def finish(self, *args, **kwargs): pass
+
+
+class _FakeMainWindow:
+    def __init__(self):
+        self.progress = _FakeProgress()
+        self.col = None
+
+
+def install():
+    """Register the stubs and return the fake `mw`."""
+    vendor = os.path.join(ROOT, "vendor")
+    if vendor not in sys.path:
+        sys.path.insert(0, vendor)
+
+    try:
+        import aqt
+        mw = aqt.mw
+    except ImportError:
+        mw = _FakeMainWindow()
+        aqt = types.ModuleType("aqt")
+        aqt.mw = mw
+        utils = types.ModuleType("aqt.utils")
+        utils.showInfo = utils.showWarning = utils.showCritical = lambda *a, **k: None
+        aqt.utils = utils
+        sys.modules.update({"aqt": aqt, "aqt.utils": utils})
+
+        anki = types.ModuleType("anki")
+        collection = types.ModuleType("anki.collection")
+        collection.Collection = FakeCollection
+        notes = types.ModuleType("anki.notes")
+        notes.Note = FakeNote
+        anki.collection, anki.notes = collection, notes
+        sys.modules.update({"anki": anki, "anki.collection": collection, "anki.notes": notes})
+
+    if PACKAGE not in sys.modules:
+        pkg = types.ModuleType(PACKAGE)
+        pkg.__path__ = [ROOT]
+        sys.modules[PACKAGE] = pkg
+    return mw
+
+
+def addon_module(name: str):
+    """Import an add-on submodule, e.g. addon_module("state_builder")."""
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+
+# ═══════════════════ Fake collection ═══════════════════
+
+_SCHEMA = """
+CREATE TABLE notes (id INTEGER PRIMARY KEY, guid TEXT, mid INTEGER, mod INTEGER, usn INTEGER,
+                    tags TEXT, flds TEXT, sfld TEXT, csum INTEGER, flags INTEGER, data TEXT);
+CREATE TABLE cards (id INTEGER PRIMARY KEY, nid INTEGER, did INTEGER, ord INTEGER, mod INTEGER,
+                    usn INTEGER, type INTEGER, queue INTEGER, due INTEGER, ivl INTEGER,
+                    factor INTEGER, reps INTEGER, lapses INTEGER, left INTEGER, odue INTEGER,
+                    odid INTEGER, flags INTEGER, data TEXT);
+CREATE INDEX ix_cards_nid ON cards (nid);
+"""
+
+
+class FakeDB:
+    """Mirrors the DBProxy helpers of `col.db` (all/list/scalar/first/execute)."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+
+    def all(self, sql, *args):
+        return [list(r) for r in self._conn.execute(sql, args)]
+
+    execute = all
+
+    def list(self, sql, *args):
+        return [r[0] for r in self._conn.execute(sql, args)]
+
+    def first(self, sql, *args):
+        row = self._conn.execute(sql, args).fetchone()
+        return list(row) if row else None
+
+    def scalar(self, sql, *args):
+        row = self._conn.execute(sql, args).fetchone()
+        return row[0] if row else None
+
+
+class _NameId:
+    __slots__ = ("name", "id")
+
+    def __init__(self, name, id):
+        self.name, self.id = name, id
+
+
+class FakeDecks:
+    def __init__(self):
+        self._decks = {}
+
+    def add(self, name: str) -> int:
+        """Register *name* and any missing parents; return its id."""
+        did = None
+        parts = name.split("::")
+        for i in range(len(parts)):
+            partial = "::".join(parts[:i + 1])
+            if partial not in self._decks:
+                self._decks[partial] = len(self._decks) + 1
+            did = self._decks[partial]
+        return did
+
+    def all_names_and_ids(self):
+        return [_NameId(n, i) for n, i in self._decks.items()]
+
+    def all_names(self):
+        return list(self._decks)
+
+
+class FakeModels:
+    def __init__(self):
+        self._models = {}
+
+    def add(self, name: str, field_names) -> int:
+        mid = 1000 + len(self._models)
+        self._models[mid] = {"id": mid, "name": name,
+                             "flds": [{"name": f, "ord": i} for i, f in enumerate(field_names)]}
+        return mid
+
+    def get(self, mid):
+        return self._models.get(mid)
+
+    def all(self):
+        return list(self._models.values())
+
+
+class FakeNote:
+    def __init__(self, col, nid):
+        row = col.db.first("SELECT mid, mod, tags, flds FROM notes WHERE id = ?", nid)
+        if row is None:
+            raise KeyError(nid)
+        self.col, self.id = col, nid
+        self.mid, self.mod, tags, flds = row
+        self.tags = tags.split()
+        self.fields = flds.split("\x1f")
+
+    def note_type(self):
+        return self.col.models.get(self.mid)
+
+    def card_ids(self):
+        return self.col.db.list("SELECT id FROM cards WHERE nid = ? ORDER BY ord", self.id)
+
+    def _ord(self, key):
+        for f in self.note_type()["flds"]:
+            if f["name"] == key:
+                return f["ord"]
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        return self.fields[self._ord(key)]
+
+    def values(self):
+        return list(self.fields)
+
+
+class FakeCard:
+    _COLS = ("nid", "did", "ord", "reps", "lapses", "ivl", "due", "factor", "queue")
+
+    def __init__(self, col, cid):
+        row = col.db.first(f"SELECT {', '.join(self._COLS)} FROM cards WHERE id = ?", cid)
+        if row is None:
+            raise KeyError(cid)
+        self.id = cid
+        for k, v in zip(self._COLS, row):
+            setattr(self, k, v)
+
+
+class FakeMedia:
+    def __init__(self, path):
+        self._path = path
+
+    def dir(self):
+        return self._path
+
+
+class FakeCollection:
+    def __init__(self, media_dir: str = ""):
+        conn = sqlite3.connect(":memory:")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+        self.db = FakeDB(conn)
+        self.decks = FakeDecks()
+        self.models = FakeModels()
+        self.media = FakeMedia(media_dir)
+        self._next_id = 1_600_000_000_000
+
+    def add_note(self, mid: int, deck_id: int, fields, tags=(), mod: int = 1_700_000_000, n_cards: int = 1) -> int:
+        self._next_id += 1
+        nid = self._next_id
+        self._conn.execute("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                           (nid, str(nid), mid, mod, -1, f" {' '.join(tags)} " if tags else "",
+                            "\x1f".join(fields), fields[0] if fields else "", 0, 0, ""))
+        for ord_ in range(n_cards):
+            self._next_id += 1
+            self._conn.execute("INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                               (self._next_id, nid, deck_id, ord_, mod, -1, 2, 2, 100, 10,
+                                2500, 5, 1, 0, 0, 0, 0, ""))
+        return nid
+
+    def find_notes(self, query: str):
+        return self.db.list("SELECT id FROM notes")
+
+    def get_note(self, nid):
+        return FakeNote(self, nid)
+
+    def get_card(self, cid):
+        return FakeCard(self, cid)
+
+
+_FILLER = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor ".split()
+
+
+def _deck_name(i: int, depth: int) -> str:
+    """Deck i at the given nesting depth; depth 2 is "Subject s::Topic i"."""
+    parts = [f"Subject {i % 7}"] + [f"Unit {i % (7 * 3 ** level)}" for level in range(1, depth - 1)]
+    return "::".join((parts + [f"Topic {i}"])[-depth:]) if depth > 1 else f"Topic {i}"
+
+
+def _filler(rng: random.Random, n_chars: int) -> str:
+    words, size = [], 0
+    while size < n_chars:
+        word = rng.choice(_FILLER)
+        words.append(word); size += len(word) + 1
+    return " ".join(words)
+
+
+def _table(i: int) -> str:
+    rows = "".join(f"<tr><td>row {r}</td><td><b>{i * r}</b><br>detail</td></tr>" for r in range(5))
+    return f"<table><tr><th>Key</th><th>Value</th></tr>{rows}</table>"
+
+
+def make_collection(n_notes: int, n_decks: int = 50, seed: int = 0, media_dir: str = "", depth: int = 2,
+                    cloze_every: int = 3, field_chars: int = 0, table_every: int = 0, media_every: int = 0,
+                    math_every: int = 0) -> FakeCollection:
+    """Generate a collection with Basic and Cloze notes spread over nested decks.
+
+    Every `cloze_every`-th note is a Cloze note, the others Basic. Decks are
+    nested `depth` levels deep. The other knobs are off by default: Back/Text
+    fields padded with about `field_chars` characters of prose, and every
+    `table_every`-th note gets a table, every `math_every`-th MathJax and every
+    `media_every`-th an image and a sound (files created in `media_dir` if given).
+    """
+    rng = random.Random(seed)
+    content_rng = random.Random(seed + 1)
+    col = FakeCollection(media_dir)
+    basic = col.models.add("Basic", ["Front", "Back", "Extra"])
+    cloze = col.models.add("Cloze", ["Title", "Text", "Extra"])
+    deck_ids = [col.decks.add(_deck_name(i, depth)) for i in range(n_decks)]
+    for i in range(n_notes):
+        did = rng.choice(deck_ids)
+        mod = 1_700_000_000 + i
+        extra = []
+        if field_chars: extra.append(f" {_filler(content_rng, field_chars)}")
+        if table_every and i % table_every == 0: extra.append(_table(i))
+        if math_every and i % math_every == 0: extra.append(f" \\(x_{{{i}}}^2\\) and \\[\\sum_{{k=1}}^{{{i}}} k\\]")
+        if media_every and i % media_every == 0:
+            extra.append(f"<img src=\"figure_{i}.png\"> [sound:audio_{i}.mp3]")
+            if media_dir:
+                for name in (f"figure_{i}.png", f"audio_{i}.mp3"):
+                    with open(os.path.join(media_dir, name), "wb") as f: f.write(name.encode())
+        extra = "".join(extra)
+        if not cloze_every or i % cloze_every:
+            col.add_note(basic, did, [f"Question {i}?", f"<b>Answer</b> {i}{extra}", ""], tags=["bench"], mod=mod)
+        else:
+            col.add_note(cloze, did, ["", f"Fact {{{{c1::{i}}}}} and {{{{c2::more}}}}{extra}", ""], mod=mod, n_cards=2)
+    return col
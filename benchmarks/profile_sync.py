@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Profile a full sync headless: the same SyncProfiler as "Sync with Profiling",
+run on a generated collection and a temporary vault.
+
+Usage:
+    python benchmarks/profile_sync.py [--notes 5000] [--decks 50] [--out profiles] [--top 10] [--resync]
+
+Writes sync.prof, sync.collapsed (flamegraph.pl / speedscope input),
+summary.txt and slowest_notes.json to a timestamped folder under --out and
+prints the top of summary.txt. --resync profiles a second, no-change sync
+instead of the first one.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_anki
+
+mw = fake_anki.install()
+mw.taskman = type("TaskManager", (), {"run_on_main": staticmethod(lambda fn: fn())})()
+config = fake_anki.addon_module("config")
+state_builder = fake_anki.addon_module("state_builder")
+sync_pipeline = fake_anki.addon_module("sync_pipeline")
+sync_profiler = fake_anki.addon_module("sync_profiler")
+stats = fake_anki.addon_module("sync_stats").stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--decks", type=int, default=50)
+    parser.add_argument("--out", default="profiles")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--resync", action="store_true")
+    args = parser.parse_args()
+
+    settings = sync_profiler.profiled_settings(config.SyncSettings())
+    with tempfile.TemporaryDirectory() as tmp:
+        media_dir, vault = os.path.join(tmp, "media"), os.path.join(tmp, "vault")
+        os.makedirs(media_dir); os.makedirs(vault)
+        manifest_path = os.path.join(tmp, "manifest.sqlite")
+        col = fake_anki.make_collection(args.notes, n_decks=args.decks, media_dir=media_dir)
+        mw.col = col
+
+        def sync():
+            anki_state = state_builder.build_anki_state(col, settings=settings)
+            sync_pipeline.sync_vault(anki_state, media_dir, vault, settings, time.time(), manifest_path=manifest_path)
+            return anki_state
+
+        if args.resync: sync()
+        stats.reset("full")
+        profiler = sync_profiler.SyncProfiler(out_root=os.path.abspath(args.out))
+        profiler.start()
+        start = time.perf_counter()
+        anki_state = profiler.run(sync)
+        elapsed = time.perf_counter() - start
+        out_dir = profiler.finish(anki_state, top_notes=args.top)
+
+    print(f"{args.notes} notes synced in {elapsed:.2f}s (profiled); profile written to {out_dir}\n")
+    with open(os.path.join(out_dir, "summary.txt"), encoding="utf-8") as f:
+        print("\n".join(f.read().splitlines()[:30]))
+    with open(os.path.join(out_dir, "slowest_notes.json"), encoding="utf-8") as f:
+        slowest = json.load(f)
+    print(f"\nSlowest {len(slowest)} note conversions:")
+    for row in slowest:
+        print(f"  {row['conversion_ms']:>9.3f} ms  {row.get('html_chars', 0):>7} chars  {row.get('deck')}/{row.get('filename')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
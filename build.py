@@ -19,6 +19,7 @@ ROOT = os.path.dirname(os.path.abspath(__file__))
 
 INCLUDE = {
     "__init__.py",
+    "auto_sync.py",
     "config.py",
     "config_ui.py",
     "config.json",
@@ -26,6 +27,12 @@ INCLUDE = {
     "executor.py",
     "html_converter.py",
     "state_builder.py",
+    "sync_manifest.py",
+    "sync_log.py",
+    "sync_pipeline.py",
+    "sync_profiler.py",
+    "sync_progress.py",
+    "sync_stats.py",
     "meta.json",
     "LICENSE",
 }
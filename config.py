@@ -10,24 +10,68 @@ Config file schema:
             "<profile_name>": {
                 "obsidianSyncPath": "...",
                 "excludedDecks": [...],
-                "filenameSuffix": "..."
+                "filenameSuffix": "...",
+                "scanWorkers": 8,
+                "incrementalExtraction": true,
+                "conversionWorkers": 1,
+                "persistentConversionCache": true,
+                "mediaWorkers": 8,
+                "mediaLinkMode": "copy",
+                "mocPageSize": 0,
+                "autoSync": false,
+                "autoSyncDelay": 3,
+                "logLevel": "WARNING",
+                "progressUpdatesPerSecond": 10
             }
         },
         "lastProfile": "<profile_name>"
     }
 
 Auto-migrates old flat config.json into the nested format on first read.
+
+Reads go through an immutable SyncSettings snapshot that is cached for the
+whole process and reloaded only when config.json's mtime/size or the active
+profile changes, or after one of the set_* writers ran.
 """
 
 import os
 import json
-from typing import Optional, List
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Optional, List, Tuple, Mapping, Any
 from aqt import mw
 
+from .sync_log import LOG_LEVELS, DEFAULT_LOG_LEVEL
+
 # --- config key names (used inside profile dicts) ---
 CONFIG_KEY_OBSIDIAN_PATH = "obsidianSyncPath"
 CONFIG_KEY_EXCLUDED_DECKS = "excludedDecks"
 CONFIG_KEY_FILENAME_SUFFIX = "filenameSuffix"
+CONFIG_KEY_SCAN_WORKERS = "scanWorkers"
+CONFIG_KEY_INCREMENTAL = "incrementalExtraction"
+CONFIG_KEY_CONVERSION_WORKERS = "conversionWorkers"
+CONFIG_KEY_PERSISTENT_CONVERSION_CACHE = "persistentConversionCache"
+CONFIG_KEY_MEDIA_WORKERS = "mediaWorkers"
+CONFIG_KEY_MEDIA_LINK_MODE = "mediaLinkMode"
+CONFIG_KEY_MOC_PAGE_SIZE = "mocPageSize"
+CONFIG_KEY_AUTO_SYNC = "autoSync"
+CONFIG_KEY_AUTO_SYNC_DELAY = "autoSyncDelay"
+CONFIG_KEY_LOG_LEVEL = "logLevel"
+CONFIG_KEY_PROGRESS_RATE = "progressUpdatesPerSecond"
+
+DEFAULT_SCAN_WORKERS = 8
+DEFAULT_CONVERSION_WORKERS = 1  # 1 = convert in-process; >1 = size of the conversion process pool
+DEFAULT_MEDIA_WORKERS = 8
+DEFAULT_MOC_PAGE_SIZE = 0  # 0 = one MOC file per deck; N = split decks with more than N notes into pages
+DEFAULT_AUTO_SYNC_DELAY = 3  # seconds without edits before auto-sync writes the edited notes
+DEFAULT_PROGRESS_RATE = 10  # progress dialog updates per second at most
+
+# How media reaches the vault. Hardlinks share the file with collection.media
+# (editing one edits both); reflinks are copy-on-write clones. Both fall back to copying.
+MEDIA_LINK_COPY = "copy"
+MEDIA_LINK_REFLINK = "reflink"
+MEDIA_LINK_HARDLINK = "hardlink"
+MEDIA_LINK_MODES = (MEDIA_LINK_COPY, MEDIA_LINK_REFLINK, MEDIA_LINK_HARDLINK)
 
 # --- root-level keys for profile isolation ---
 _ROOT_PROFILES = "profiles"
@@ -58,6 +102,32 @@ def _get_config_path() -> Optional[str]:
     return os.path.join(addon_dir, "config.json") if addon_dir else None
 
 
+def get_user_files_dir() -> Optional[str]:
+    """Return the add-on's user_files folder (kept by Anki across add-on updates)."""
+    addon_dir = _get_addon_dir()
+    return os.path.join(addon_dir, "user_files") if addon_dir else None
+
+
+def get_conversion_cache_path() -> Optional[str]:
+    """SQLite file holding the on-disk tier of the HTML conversion cache."""
+    data_dir = get_user_files_dir()
+    return os.path.join(data_dir, "conversion_cache.sqlite") if data_dir else None
+
+
+def get_sync_report_path() -> Optional[str]:
+    """JSON timing report of the last sync (its history sits next to it)."""
+    data_dir = get_user_files_dir()
+    return os.path.join(data_dir, "sync_report.json") if data_dir else None
+
+
+def get_addon_version() -> str:
+    try:
+        with open(os.path.join(os.path.dirname(__file__), "meta.json"), encoding="utf-8") as f:
+            return str(json.load(f).get("version", "unknown"))
+    except (OSError, ValueError):
+        return "unknown"
+
+
 def _read_raw() -> dict:
     """Read the full config.json as-is."""
     config_path = _get_config_path()
@@ -81,11 +151,17 @@ def _write_raw(config: dict):
     except OSError as e:
         from aqt.utils import showWarning
         showWarning(f"Could not write addon configuration.\nError: {e}")
+    finally:
+        invalidate_settings()
 
 
 # ═══════════════════ Profile resolution ═══════════════════
 
-ALL_KEYS = {CONFIG_KEY_OBSIDIAN_PATH, CONFIG_KEY_EXCLUDED_DECKS, CONFIG_KEY_FILENAME_SUFFIX}
+ALL_KEYS = {CONFIG_KEY_OBSIDIAN_PATH, CONFIG_KEY_EXCLUDED_DECKS, CONFIG_KEY_FILENAME_SUFFIX,
+            CONFIG_KEY_SCAN_WORKERS, CONFIG_KEY_INCREMENTAL, CONFIG_KEY_CONVERSION_WORKERS,
+            CONFIG_KEY_PERSISTENT_CONVERSION_CACHE, CONFIG_KEY_MEDIA_WORKERS, CONFIG_KEY_MEDIA_LINK_MODE,
+            CONFIG_KEY_MOC_PAGE_SIZE, CONFIG_KEY_AUTO_SYNC, CONFIG_KEY_AUTO_SYNC_DELAY,
+            CONFIG_KEY_LOG_LEVEL, CONFIG_KEY_PROGRESS_RATE}
 
 
 def _current_profile() -> str:
@@ -146,8 +222,101 @@ def _write_profile(profile_cfg: dict):
 
 
 def _read_profile_field(key: str, default=None):
-    """Read *key* from the current profile's config."""
-    return _profile_config().get(key, default)
+    """Read *key* from the current profile's (cached) settings snapshot."""
+    return load_settings().options.get(key, default)
+
+
+# ═══════════════════ Settings snapshot ═══════════════════
+
+@dataclass(frozen=True)
+class SyncSettings:
+    """Immutable snapshot of the current profile's configuration.
+
+    Loaded once per sync and passed down the pipeline instead of re-reading
+    config.json for every note. `options` is a read-only view of the whole
+    profile dict, for settings without a dedicated attribute.
+    """
+    profile: str = _DEFAULT_PROFILE
+    obsidian_path: Optional[str] = None
+    excluded_decks: Tuple[str, ...] = ()
+    filename_suffix: str = "nid"
+    scan_workers: int = DEFAULT_SCAN_WORKERS
+    incremental_extraction: bool = True
+    conversion_workers: int = DEFAULT_CONVERSION_WORKERS
+    persistent_conversion_cache: bool = True
+    media_workers: int = DEFAULT_MEDIA_WORKERS
+    media_link_mode: str = MEDIA_LINK_COPY
+    moc_page_size: int = DEFAULT_MOC_PAGE_SIZE
+    auto_sync: bool = False
+    auto_sync_delay: int = DEFAULT_AUTO_SYNC_DELAY
+    log_level: str = DEFAULT_LOG_LEVEL
+    progress_rate: int = DEFAULT_PROGRESS_RATE
+    options: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+    def option(self, key: str, default=None):
+        return self.options.get(key, default)
+
+
+_settings_cache: Optional[Tuple[tuple, SyncSettings]] = None
+
+
+def _settings_stamp() -> tuple:
+    """Identify the config state a snapshot was built from."""
+    config_path = _get_config_path()
+    try:
+        st = os.stat(config_path) if config_path else None
+    except OSError:
+        st = None
+    return (config_path, st.st_mtime_ns if st else None, st.st_size if st else None, _current_profile())
+
+
+def _positive_int(value, default: int) -> int:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def _log_level(value) -> str:
+    value = str(value or "").upper()
+    return value if value in LOG_LEVELS else DEFAULT_LOG_LEVEL
+
+
+def load_settings() -> SyncSettings:
+    """Return the cached SyncSettings, reloading config.json only if it changed."""
+    global _settings_cache
+    stamp = _settings_stamp()
+    if _settings_cache is not None and _settings_cache[0] == stamp:
+        return _settings_cache[1]
+
+    cfg = _profile_config()
+    settings = SyncSettings(
+        profile=stamp[3],
+        obsidian_path=cfg.get(CONFIG_KEY_OBSIDIAN_PATH),
+        excluded_decks=tuple(cfg.get(CONFIG_KEY_EXCLUDED_DECKS) or ()),
+        filename_suffix=cfg.get(CONFIG_KEY_FILENAME_SUFFIX, "nid"),
+        scan_workers=_positive_int(cfg.get(CONFIG_KEY_SCAN_WORKERS), DEFAULT_SCAN_WORKERS),
+        incremental_extraction=bool(cfg.get(CONFIG_KEY_INCREMENTAL, True)),
+        conversion_workers=_positive_int(cfg.get(CONFIG_KEY_CONVERSION_WORKERS), DEFAULT_CONVERSION_WORKERS),
+        persistent_conversion_cache=bool(cfg.get(CONFIG_KEY_PERSISTENT_CONVERSION_CACHE, True)),
+        media_workers=_positive_int(cfg.get(CONFIG_KEY_MEDIA_WORKERS), DEFAULT_MEDIA_WORKERS),
+        media_link_mode=cfg.get(CONFIG_KEY_MEDIA_LINK_MODE) if cfg.get(CONFIG_KEY_MEDIA_LINK_MODE) in MEDIA_LINK_MODES else MEDIA_LINK_COPY,
+        moc_page_size=_positive_int(cfg.get(CONFIG_KEY_MOC_PAGE_SIZE), DEFAULT_MOC_PAGE_SIZE),
+        auto_sync=bool(cfg.get(CONFIG_KEY_AUTO_SYNC, False)),
+        auto_sync_delay=_positive_int(cfg.get(CONFIG_KEY_AUTO_SYNC_DELAY), DEFAULT_AUTO_SYNC_DELAY),
+        log_level=_log_level(cfg.get(CONFIG_KEY_LOG_LEVEL)),
+        progress_rate=_positive_int(cfg.get(CONFIG_KEY_PROGRESS_RATE), DEFAULT_PROGRESS_RATE),
+        options=MappingProxyType(cfg),
+    )
+    _settings_cache = (stamp, settings)
+    return settings
+
+
+def invalidate_settings():
+    """Drop the cached snapshot; the next read reloads config.json."""
+    global _settings_cache
+    _settings_cache = None
 
 
 # ═══════════════════ Public API ═══════════════════
@@ -168,7 +337,7 @@ def set_obsidian_path(path: str):
 
 
 def get_excluded_decks() -> List[str]:
-    return _read_profile_field(CONFIG_KEY_EXCLUDED_DECKS, [])
+    return list(load_settings().excluded_decks)
 
 
 def set_excluded_decks(decks: List[str]):
@@ -178,10 +347,20 @@ def set_excluded_decks(decks: List[str]):
 
 
 def get_filename_suffix() -> str:
-    return _read_profile_field(CONFIG_KEY_FILENAME_SUFFIX, "nid")
+    return load_settings().filename_suffix
 
 
 def set_filename_suffix(value: str):
     cfg = _profile_config()
     cfg[CONFIG_KEY_FILENAME_SUFFIX] = value
     _write_profile(cfg)
+
+
+def get_auto_sync() -> bool:
+    return load_settings().auto_sync
+
+
+def set_auto_sync(enabled: bool):
+    cfg = _profile_config()
+    cfg[CONFIG_KEY_AUTO_SYNC] = bool(enabled)
+    _write_profile(cfg)
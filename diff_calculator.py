@@ -6,34 +6,50 @@ to determine the necessary filesystem actions (Create, Update, Delete).
 Uses custom MOC naming convention and links MOCs hierarchically.
 """
 
-from typing import Dict, Any, Set, List, Tuple
+from typing import Dict, Any, Set, List, Tuple, Optional
 from pathlib import Path
 import os
 
 # Local import for root MOC filename constant
-from .state_builder import ROOT_MOC_FILENAME
+from .state_builder import ROOT_MOC_FILENAME, MOC_PAGE_FILENAME, moc_page_count, moc_page_of, moc_page_filename
+from .sync_log import log
 
-def calculate_diff(anki_state: Dict[str, Any], obsidian_state: Dict[str, Any]) -> Dict[str, Any]:
+def calculate_diff(anki_state: Dict[str, Any], obsidian_state: Dict[str, Any],
+                   media_state: Optional[Dict[str, Any]] = None, moc_page_size: int = 0,
+                   only_note_ids: Optional[Set[int]] = None, pending_mocs: Optional[Set[str]] = None) -> Dict[str, Any]:
     """
     Compares the note-centric Anki and Obsidian states and returns actions.
     Uses custom MOC naming convention and links MOCs hierarchically.
+    With a *media_state* (see build_media_state), assets whose source was edited
+    in Anki are re-copied and media missing from collection.media is not queued.
+    Decks with more than *moc_page_size* notes get paginated MOCs (0 = never).
+    With *only_note_ids* (targeted sync, see build_partial_obsidian_state) only
+    those notes, their folders, media and decks' MOCs are compared; *anki_state*
+    is still the whole collection so MOCs are rendered from complete decks.
+    *pending_mocs* (see SyncManifest.pending_mocs) are MOCs an interrupted sync
+    left stale; those still expected are rewritten.
     """
-    print("Calculating differences between Anki and Obsidian states (Note-Centric)...")
+    log.info("Calculating differences between Anki and Obsidian states (Note-Centric)...")
 
     actions = {
         "folders_to_create": [], "folders_to_delete": [],
         "notes_to_create": [], "notes_to_update": [], "notes_to_delete": [],
-        "images_to_copy": set(), "images_to_delete": set(),
+        "images_to_copy": set(), "images_to_update": set(), "images_to_delete": set(),
         "mocs_to_create": set(), # MOCs that need to be created
         "mocs_to_update": set(), # Existing MOCs that need content update
-        "mocs_to_delete": set()  # MOCs that should no longer exist
+        "mocs_to_delete": set(),  # MOCs that should no longer exist
+        "dirty_decks": {}        # Deck path -> nids whose MOC entry changed (see below)
     }
 
+    deck_tree = anki_state["_root_"].get("deck_tree")
+
     # --- Folder Diff ---
-    anki_folders = set(anki_state.keys()) - {"_root_"}
+    anki_folders = set(deck_tree.exported) if deck_tree else set(anki_state.keys()) - {"_root_"}
+    if only_note_ids is not None:
+        anki_folders = {p for p in anki_folders if p in anki_state and not anki_state[p]["notes"].keys().isdisjoint(only_note_ids)}
     obs_folders = obsidian_state.get("folders", set())
     actions["folders_to_create"] = list(anki_folders - obs_folders)
-    print(f"Folders to create: {len(actions['folders_to_create'])}")
+    log.info("Folders to create: %d", len(actions['folders_to_create']))
 
     # --- Note Diff ---
     obs_notes_by_anki_id: Dict[int, Dict] = {}
@@ -46,6 +62,7 @@ def calculate_diff(anki_state: Dict[str, Any], obsidian_state: Dict[str, Any]) -
             # else: print(f"Warning: Duplicate Obsidian file found for Anki Note ID {anki_note_id}. Ignoring {rel_path}")
 
     all_required_anki_images = set()
+    dirty_decks: Dict[str, Set[int]] = {} # Deck path -> nids created, moved, retitled or deleted there
     anki_note_id_to_deck_path = {}
     decks_with_notes = set() # Track decks that directly contain notes
 
@@ -56,7 +73,10 @@ def calculate_diff(anki_state: Dict[str, Any], obsidian_state: Dict[str, Any]) -
         if deck_has_notes:
             decks_with_notes.add(deck_path)
 
-        for note_id, anki_note_data in deck_data.get("notes", {}).items():
+        deck_notes = deck_data.get("notes", {})
+        if only_note_ids is not None:
+            deck_notes = {nid: deck_notes[nid] for nid in only_note_ids if nid in deck_notes}
+        for note_id, anki_note_data in deck_notes.items():
             anki_note_id_to_deck_path[note_id] = deck_path
             all_required_anki_images.update(anki_note_data.get("required_images", set()))
             target_rel_path = os.path.join(deck_path, anki_note_data['target_filename']).replace('\\', '/')
@@ -71,12 +91,16 @@ def calculate_diff(anki_state: Dict[str, Any], obsidian_state: Dict[str, Any]) -
                 needs_update = (anki_mod_time is None or obs_mod_time is None or anki_mod_time > obs_mod_time)
 
                 if needs_update or needs_move:
+                    # An edited note may have a new title, so its deck's MOC is regenerated (and only written if it differs).
+                    dirty_decks.setdefault(deck_path, set()).add(note_id)
+                    if needs_move: dirty_decks.setdefault(os.path.dirname(obs_rel_path), set()).add(note_id)
                     actions["notes_to_update"].append({
                         "anki_note_data": anki_note_data, "deck_path": deck_path,
                         "target_rel_path": target_rel_path, "obs_note_data": obs_note_match,
                         "needs_move": needs_move
                     })
             else: # Note needs to be created
+                dirty_decks.setdefault(deck_path, set()).add(note_id)
                 actions["notes_to_create"].append({
                     "anki_note_data": anki_note_data, "deck_path": deck_path,
                     "target_rel_path": target_rel_path
@@ -88,51 +112,95 @@ def calculate_diff(anki_state: Dict[str, Any], obsidian_state: Dict[str, Any]) -
     for rel_path in notes_to_delete_paths:
         obs_note_data = obsidian_state["note_files"][rel_path]
         if obs_note_data.get("anki_note_id") is not None:
+            dirty_decks.setdefault(os.path.dirname(rel_path), set()).add(obs_note_data["anki_note_id"])
             actions["notes_to_delete"].append({
                 "obs_note_data": obs_note_data, "target_rel_path": rel_path
             })
 
-    print(f"Notes to create: {len(actions['notes_to_create'])}")
-    print(f"Notes to update/move: {len(actions['notes_to_update'])}")
-    print(f"Notes to delete: {len(actions['notes_to_delete'])}")
+    log.info("Notes to create: %d", len(actions['notes_to_create']))
+    log.info("Notes to update/move: %d", len(actions['notes_to_update']))
+    log.info("Notes to delete: %d", len(actions['notes_to_delete']))
 
     # --- Image Diff (Same) ---
     obs_assets = obsidian_state.get("asset_files", set())
     actions["images_to_copy"] = all_required_anki_images - obs_assets
     actions["images_to_delete"] = obs_assets - all_required_anki_images
-    print(f"Images to copy: {len(actions['images_to_copy'])}")
-    print(f"Images to delete: {len(actions['images_to_delete'])}")
+    if media_state is not None:
+        actions["images_to_copy"] -= media_state["missing"]
+        actions["images_to_update"] = media_state["changed"] & obs_assets
+    log.info("Images to copy: %d", len(actions['images_to_copy']))
+    log.info("Images to update: %d", len(actions['images_to_update']))
+    log.info("Images to delete: %d", len(actions['images_to_delete']))
 
     # --- MOC Diff ---
     # Identify which MOCs *should* exist based on Anki state
     expected_mocs = {ROOT_MOC_FILENAME} # Root MOC always expected (will be updated if changes)
+    deck_mocs = {} # deck path -> its MOC's rel path
     for deck_path, deck_data in anki_state.items():
         if deck_path == "_root_": continue
         # Only expect a deck MOC if the deck directly contains notes
         if deck_path in decks_with_notes:
-            moc_filename = deck_data.get("moc_filename")
-            if moc_filename:
-                expected_mocs.add(os.path.join(deck_path, moc_filename).replace('\\', '/'))
+            if deck_tree and deck_path in deck_tree.exported:
+                deck_mocs[deck_path] = deck_tree.moc_rel_path(deck_path)
+            elif deck_data.get("moc_filename"):
+                deck_mocs[deck_path] = os.path.join(deck_path, deck_data["moc_filename"]).replace('\\', '/')
+    if only_note_ids is not None:
+        affected = set(dirty_decks) | set(anki_note_id_to_deck_path.values())
+        deck_mocs = {d: moc for d, moc in deck_mocs.items() if d in affected}
+    expected_mocs.update(deck_mocs.values())
+    # Paginated decks: deck path -> page MOC paths (the deck MOC above becomes their index)
+    deck_pages = {}
+    for deck_path, moc_rel_path in deck_mocs.items():
+        page_count = moc_page_count(len(anki_state[deck_path].get("notes", {})), moc_page_size)
+        if page_count:
+            moc_dir, _, moc_filename = moc_rel_path.rpartition('/')
+            deck_pages[deck_path] = [f"{moc_dir}/{moc_page_filename(moc_filename, p)}" if moc_dir else moc_page_filename(moc_filename, p)
+                                     for p in range(page_count)]
+            expected_mocs.update(deck_pages[deck_path])
 
     # Compare with MOCs found in Obsidian
     obs_mocs = obsidian_state.get("moc_files", set())
     actions["mocs_to_create"] = expected_mocs - obs_mocs
     actions["mocs_to_delete"] = obs_mocs - expected_mocs
-    # All expected MOCs that also exist in Obsidian might need an update
-    actions["mocs_to_update"] = expected_mocs.intersection(obs_mocs)
+    obs_pages: Dict[str, Set[str]] = {} # deck MOC path -> its page files in Obsidian
+    for moc_rel_path in obs_mocs:
+        match = MOC_PAGE_FILENAME.fullmatch(moc_rel_path.rpartition('/')[2])
+        if match: obs_pages.setdefault(moc_rel_path[:-len(match.group(1)) - 4] + ".md", set()).add(moc_rel_path)
+    # A deck whose page layout differs from the vault's (page count changed, or
+    # mocPageSize turned on/off) gets its index and every page rewritten, even
+    # without note edits: every note may have moved to another page.
+    actions["mocs_to_update"] = set()
+    relaid_decks = set()
+    for deck_path, moc_rel_path in deck_mocs.items():
+        pages = deck_pages.get(deck_path, [])
+        if obs_pages.get(moc_rel_path, set()) != set(pages):
+            relaid_decks.add(deck_path)
+            actions["mocs_to_update"].update(pages); actions["mocs_to_update"].add(moc_rel_path)
+    # Otherwise existing deck MOCs only need regenerating if one of their notes changed
+    for deck_path, nids in dirty_decks.items():
+        if deck_path not in deck_mocs or deck_path in relaid_decks: continue
+        pages = deck_pages.get(deck_path)
+        if not pages:
+            actions["mocs_to_update"].add(deck_mocs[deck_path])
+        else:
+            actions["mocs_to_update"].update(pages[moc_page_of(nid, len(pages))] for nid in nids)
+    # MOCs queued by an earlier sync that stopped before writing them
+    if pending_mocs: actions["mocs_to_update"].update(pending_mocs & expected_mocs)
+    actions["mocs_to_update"] &= obs_mocs
 
     # Always update root MOC if there were *any* changes to notes/folders/images
-    # This is simpler than tracking exact hierarchy changes.
+    # This is simpler than tracking exact hierarchy changes; the root MOC is
+    # cheap to render and only rewritten when its bytes differ.
     if any(act for k, act_list in actions.items() if k != "mocs_to_update" for act in act_list):
          actions["mocs_to_update"].add(ROOT_MOC_FILENAME)
          # Ensure root isn't also marked for creation if it exists
          if ROOT_MOC_FILENAME in actions["mocs_to_create"]:
              actions["mocs_to_create"].discard(ROOT_MOC_FILENAME)
+    actions["dirty_decks"] = dirty_decks
 
+    log.info("MOCs to create: %d", len(actions['mocs_to_create']))
+    log.info("MOCs to update: %d", len(actions['mocs_to_update']))
+    log.info("MOCs to delete: %d", len(actions['mocs_to_delete']))
 
-    print(f"MOCs to create: {len(actions['mocs_to_create'])}")
-    print(f"MOCs to update: {len(actions['mocs_to_update'])}")
-    print(f"MOCs to delete: {len(actions['mocs_to_delete'])}")
-
-    print("Difference calculation complete.")
+    log.info("Difference calculation complete.")
     return actions
\ No newline at end of file
@@ -7,20 +7,34 @@ Uses custom MOC naming convention and generates hierarchical root MOC linking to
 """
 
 import os
+import time
 import shutil
 import hashlib
 from pathlib import Path
-from typing import Dict, Any, List, Set, Optional
+from typing import Dict, Any, List, Optional, Iterator
 import html
 import re
 import sys # <-- Added import for maxint fallback
+import errno
+import importlib
+import multiprocessing
+import site
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 
 # Anki imports
 from aqt import mw
 
 # Local imports
-from .html_converter import combine_fields_to_markdown, convert_html_to_markdown, CLOZE_REGEX
-from .state_builder import sanitize_filename, YAML_AVAILABLE, yaml, ROOT_MOC_FILENAME
+from .html_converter import (combine_fields_to_markdown, convert_html_to_markdown, configure_conversion_cache,
+                             conversion_stats, CLOZE_REGEX, CONVERSION_COUNTERS)
+from .state_builder import (sanitize_filename, get_note_index, YAML_AVAILABLE, yaml, ROOT_MOC_FILENAME,
+                            MOC_PAGE_FILENAME, moc_page_count, moc_page_of, moc_page_filename)
+from .sync_manifest import SyncManifest
+from .sync_progress import progress, SyncCancelled
+from .sync_log import log, errors
+from .sync_stats import stats
+from .config import MEDIA_LINK_COPY, MEDIA_LINK_HARDLINK, MEDIA_LINK_REFLINK, DEFAULT_MEDIA_WORKERS
 
 # --- Helper ---
 
@@ -28,111 +42,349 @@ def ensure_dir_exists(dir_path: Path):
     """Creates a directory if it doesn't exist."""
     dir_path.mkdir(parents=True, exist_ok=True)
 
+TMP_SUFFIX = ".obsidian-sync-tmp"
+
+def write_text_atomic(path: Path, content: str):
+    """Write *content* next to *path* and rename it into place, so readers (and a cancelled sync) never see half a file."""
+    tmp_path = f"{path}{TMP_SUFFIX}"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f: f.write(content); size = f.tell()
+        os.replace(tmp_path, path)
+        stats.count("files_written"); stats.count("bytes_written", size)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
 # --- Phase 3: Deletions & Folder Structure ---
 # (No changes needed here)
-def execute_deletions_and_folders(actions: Dict[str, Any], obsidian_base_path: Path, assets_rel_path: str):
-    print("Executing Phase 3: Deletions and Folder Creation (Note-Centric)...")
+def execute_deletions_and_folders(actions: Dict[str, Any], obsidian_base_path: Path, assets_rel_path: str,
+                                  manifest: Optional[SyncManifest] = None):
+    log.info("Executing Phase 3: Deletions and Folder Creation (Note-Centric)...")
     assets_abs_path = obsidian_base_path / assets_rel_path
     # 1. Create Folders
     folders_created = 0; folders_to_create = actions.get("folders_to_create", [])
     if folders_to_create:
-        mw.progress.start(label="Creating Folders...", max=len(folders_to_create), immediate=True)
+        progress.start(label="Creating Folders...", max=len(folders_to_create), immediate=True)
         for rel_path in folders_to_create:
+            progress.check_cancel()
             try: abs_path = obsidian_base_path / rel_path; ensure_dir_exists(abs_path); folders_created += 1
-            except Exception as e: print(f"Error creating folder {rel_path}: {e}")
-            mw.progress.update(label=f"Creating folder: {rel_path}", value=folders_created)
-        mw.progress.finish(); print(f"Created {folders_created} folders.")
+            except Exception as e: errors.record("Creating folders", rel_path, e)
+            if progress.due(): progress.update(label=f"Creating folder: {rel_path}", value=folders_created)
+        progress.finish(); log.info("Created %d folders.", folders_created)
     ensure_dir_exists(assets_abs_path)
     # 2. Delete Obsolete Note Files
     notes_deleted = 0; notes_to_delete = actions.get("notes_to_delete", [])
     if notes_to_delete:
-        mw.progress.start(label="Deleting Obsolete Notes...", max=len(notes_to_delete), immediate=True)
-        for note_action in notes_to_delete:
-            rel_path = note_action["target_rel_path"]; abs_path = obsidian_base_path / rel_path
-            try:
-                if abs_path.is_file(): abs_path.unlink(); notes_deleted += 1
-                else: print(f"Warning: Note file to delete not found: {abs_path}")
-                mw.progress.update(label=f"Deleting note: {rel_path}", value=notes_deleted)
-            except Exception as e: print(f"Error deleting note file {rel_path}: {e}")
-        mw.progress.finish(); print(f"Deleted {notes_deleted} obsolete note files.")
+        progress.start(label="Deleting Obsolete Notes...", max=len(notes_to_delete), immediate=True)
+        with (manifest.transaction() if manifest is not None else nullcontext()):
+            for note_action in notes_to_delete:
+                progress.check_cancel()
+                rel_path = note_action["target_rel_path"]; abs_path = obsidian_base_path / rel_path
+                try:
+                    if abs_path.is_file(): abs_path.unlink(); notes_deleted += 1
+                    else: log.debug("Note file to delete not found: %s", abs_path)
+                    if manifest is not None: manifest.remove(rel_path)
+                    if progress.due(): progress.update(label=f"Deleting note: {rel_path}", value=notes_deleted)
+                except Exception as e: errors.record("Deleting notes", rel_path, e)
+        progress.finish(); log.info("Deleted %d obsolete note files.", notes_deleted)
     # 3. Delete Obsolete Images
     images_deleted = 0; images_to_delete = actions.get("images_to_delete", set())
     if images_to_delete:
-        mw.progress.start(label="Deleting Obsolete Assets...", max=len(images_to_delete), immediate=True)
+        progress.start(label="Deleting Obsolete Assets...", max=len(images_to_delete), immediate=True)
         for img_filename in images_to_delete:
+            progress.check_cancel()
             abs_path = assets_abs_path / img_filename
             try:
                 if abs_path.is_file(): abs_path.unlink(); images_deleted += 1
-                else: print(f"Warning: Asset file to delete not found: {abs_path}")
-                mw.progress.update(label=f"Deleting asset: {img_filename}", value=images_deleted)
-            except Exception as e: print(f"Error deleting asset file {img_filename}: {e}")
-        mw.progress.finish(); print(f"Deleted {images_deleted} obsolete asset files.")
+                else: log.debug("Asset file to delete not found: %s", abs_path)
+                if manifest is not None: manifest.remove_media(img_filename)
+                if progress.due(): progress.update(label=f"Deleting asset: {img_filename}", value=images_deleted)
+            except Exception as e: errors.record("Deleting assets", img_filename, e)
+        progress.finish(); log.info("Deleted %d obsolete asset files.", images_deleted)
     # 4. Delete Obsolete MOC Files
     mocs_deleted = 0; mocs_to_delete = actions.get("mocs_to_delete", set())
     if mocs_to_delete:
-        mw.progress.start(label="Deleting Obsolete MOCs...", max=len(mocs_to_delete), immediate=True)
+        progress.start(label="Deleting Obsolete MOCs...", max=len(mocs_to_delete), immediate=True)
         for moc_rel_path in mocs_to_delete:
+            progress.check_cancel()
             abs_path = obsidian_base_path / moc_rel_path
             try:
                 if abs_path.is_file(): abs_path.unlink(); mocs_deleted += 1
-                else: print(f"Warning: MOC file to delete not found: {abs_path}")
-                mw.progress.update(label=f"Deleting MOC: {moc_rel_path}", value=mocs_deleted)
-            except Exception as e: print(f"Error deleting MOC file {moc_rel_path}: {e}")
-        mw.progress.finish(); print(f"Deleted {mocs_deleted} obsolete MOC files.")
+                else: log.debug("MOC file to delete not found: %s", abs_path)
+                if progress.due(): progress.update(label=f"Deleting MOC: {moc_rel_path}", value=mocs_deleted)
+            except Exception as e: errors.record("Deleting MOCs", moc_rel_path, e)
+        progress.finish(); log.info("Deleted %d obsolete MOC files.", mocs_deleted)
 
     # 5. Delete Obsolete Folders (Deferred)
-    print("Folder deletion logic is currently deferred.")
-    print("Phase 3 execution complete.")
+    log.debug("Folder deletion logic is currently deferred.")
+    log.info("Phase 3 execution complete.")
 
-# --- Phase 4: Content Conversion & File Writing (Note-Centric) ---
-# (No changes needed here)
-def copy_required_media(
-    required_media: Set[str], media_to_copy_set: Set[str],
-    anki_media_path: str, obsidian_assets_path: Path ):
-    """Copies all required media files (images, audio, video, etc.) to Obsidian assets folder."""
-    if not required_media: return
-    ensure_dir_exists(obsidian_assets_path)
-    for media_filename in required_media:
-        if media_filename not in media_to_copy_set: continue
-        source_path = Path(anki_media_path) / media_filename
-        dest_path = obsidian_assets_path / media_filename
-        if source_path.is_file():
-            if not dest_path.exists():
-                try: 
-                    shutil.copy2(source_path, dest_path)
-                    print(f"Copied media file: {media_filename}")
-                except Exception as e: 
-                    print(f"Error copying media {media_filename}: {e}")
-            media_to_copy_set.discard(media_filename)
-        else: 
-            print(f"Warning: Source media not found in Anki media: {source_path}")
-            media_to_copy_set.discard(media_filename)
-
-# Backwards compatibility alias
-copy_required_images = copy_required_media
+# --- Phase 4a: Media Copy (whole images_to_copy set, before note writes) ---
+MEDIA_REPORT_KEYS = ("copied", "linked", "reflinked", "updated", "present", "missing", "failed", "bytes_copied", "bytes_linked")
+_FICLONE = 0x40049409  # Linux ioctl: share the source's extents (btrfs, xfs, ...)
+
+def _try_reflink(src: str, dst: str) -> bool:
+    """Clone *src* to *dst* copy-on-write if the platform and filesystem support it."""
+    if sys.platform.startswith("linux"):
+        try: import fcntl
+        except ImportError: return False
+        try:
+            with open(src, "rb") as fsrc, open(dst, "xb") as fdst: fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            try: os.remove(dst)
+            except OSError: pass
+            return False
+        shutil.copystat(src, dst); return True
+    if sys.platform == "darwin":
+        try:
+            import ctypes
+            clonefile = ctypes.CDLL("/usr/lib/libSystem.dylib", use_errno=True).clonefile
+            return clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+        except (OSError, AttributeError): return False
+    return False
+
+def _transfer_media(src: str, dst: str, mode: str, same_device: bool) -> str:
+    """Put *src* at *dst*; returns "linked", "reflinked" or "copied"."""
+    if same_device and mode == MEDIA_LINK_HARDLINK:
+        try: os.link(src, dst); return "linked"
+        except OSError as e:
+            if e.errno == errno.EEXIST: raise
+    if same_device and mode in (MEDIA_LINK_HARDLINK, MEDIA_LINK_REFLINK) and _try_reflink(src, dst): return "reflinked"
+    shutil.copy2(src, dst); return "copied"
+
+def _same_device(a: str, b: str) -> bool:
+    try: return os.stat(a).st_dev == os.stat(b).st_dev
+    except OSError: return False
+
+def _record_media_stats(report: Dict[str, int]) -> Dict[str, int]:
+    stats.add({f"media_{k}": v for k, v in report.items()})
+    return report
 
+def execute_media_copy(actions: Dict[str, Any], obsidian_base_path: Path, assets_rel_path: str,
+                       workers: int = DEFAULT_MEDIA_WORKERS, link_mode: str = MEDIA_LINK_COPY,
+                       media_state: Optional[Dict[str, Any]] = None, manifest: Optional[SyncManifest] = None) -> Dict[str, int]:
+    """Copies actions["images_to_copy"] and ["images_to_update"] from collection.media to the vault's assets folder.
+
+    Sources come from *media_state* (see build_media_state) or, without one, from
+    a single os.scandir of collection.media; transfers run on a thread pool.
+    Updated assets are written next to the old copy and swapped in with os.replace.
+    With link_mode "hardlink" or "reflink" files on the same filesystem are linked
+    or cloned instead (falling back to a plain copy). Each transferred file's
+    source size/mtime is recorded in the *manifest*. Returns counts per outcome
+    and bytes copied/linked; names not found in collection.media count as missing.
+    """
+    report = dict.fromkeys(MEDIA_REPORT_KEYS, 0)
+    wanted = actions.get("images_to_copy", set()); updates = actions.get("images_to_update", set())
+    if media_state is not None: report["missing"] = len(media_state["missing"])
+    if not wanted and not updates: return _record_media_stats(report)
+    log.info("Executing Phase 4a: Media Copy (%d new, %d changed)...", len(wanted), len(updates))
+    media_dir = media_state["dir"] if media_state is not None else mw.col.media.dir(); assets_dir = str(obsidian_base_path / assets_rel_path)
+    ensure_dir_exists(Path(assets_dir))
+    if media_state is not None:
+        sources = media_state["sources"]
+    else:
+        try:
+            with os.scandir(media_dir) as it: listing = {e.name: e.path for e in it if e.name in wanted}
+        except OSError as e:
+            log.error("Cannot list Anki media folder %s: %s", media_dir, e); listing = {}
+        sources = {}
+        for name in wanted:
+            src = listing.get(name)
+            if src is None and name and os.path.basename(name) == name and name not in (".", ".."):
+                src = os.path.join(media_dir, name)  # e.g. differs only in case on a case-insensitive filesystem
+            try: st = os.stat(src) if src else None
+            except OSError: st = None
+            if st is not None and not os.path.isdir(src): sources[name] = (src, st.st_size, st.st_mtime_ns)
+    same_device = link_mode != MEDIA_LINK_COPY and _same_device(media_dir, assets_dir)
+    jobs, missing = [], []
+    for name in sorted(wanted | updates):
+        if name not in sources: missing.append(name); continue
+        dst = os.path.join(assets_dir, name)
+        if name in wanted and os.path.lexists(dst): report["present"] += 1; continue
+        jobs.append((name, dst, name in updates))
+    if media_state is None: report["missing"] = len(missing)
+    if missing: log.warning("%d media file(s) not found in Anki media, e.g. %s", len(missing), ", ".join(missing[:5]))
+    if not jobs: return _record_media_stats(report)
+
+    progress.start(label="Copying media...", max=len(jobs), immediate=True)
+    def run(job):
+        name, dst, replace = job
+        if not replace: return _transfer_media(sources[name][0], dst, link_mode, same_device), os.stat(dst).st_size
+        tmp = dst + TMP_SUFFIX
+        try: os.remove(tmp)
+        except FileNotFoundError: pass
+        outcome = _transfer_media(sources[name][0], tmp, link_mode, same_device)
+        os.replace(tmp, dst)
+        return outcome, os.stat(dst).st_size
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            if progress.cancelled():
+                for pending in futures: pending.cancel()
+                break
+            name, _, replace = futures[future]
+            try:
+                outcome, size = future.result()
+                report[outcome] += 1; report["bytes_copied" if outcome == "copied" else "bytes_linked"] += size
+                if replace: report["updated"] += 1
+                if manifest is not None: manifest.record_media(name, sources[name][1], sources[name][2])
+            except Exception as e:
+                report["failed"] += 1; errors.record("Copying media", name, e)
+            if progress.due(): progress.update(label=f"Copying media ({done}/{len(jobs)})...", value=done)
+    if manifest is not None: manifest.commit()
+    _record_media_stats(report)
+    progress.finish(); progress.check_cancel()
+    log.info("Phase 4a complete. Media: %(copied)d copied, %(linked)d hardlinked, %(reflinked)d reflinked "
+             "(%(updated)d replacing edited files), %(present)d already present, %(missing)d missing, "
+             "%(failed)d failed; %(bytes_copied)d bytes copied, %(bytes_linked)d bytes linked.", report)
+    return report
+
+# --- Phase 4: Content Conversion & File Writing (Note-Centric) ---
 def calculate_content_hash(content: str) -> str: return hashlib.md5(content.encode('utf-8')).hexdigest()
 
+def _file_has_content(abs_path: Path, content: str) -> bool:
+    try:
+        size = os.path.getsize(abs_path); stats.count("files_stat")
+        if size < len(content): return False  # UTF-8 is never shorter than the str
+        stats.count("files_opened"); stats.count("bytes_read", size)
+        with open(abs_path, 'r', encoding='utf-8') as f: return f.read() == content
+    except (OSError, UnicodeDecodeError): return False
+
+_NOTE_MOD_LINE = re.compile(r"^anki_note_mod: .*$", re.MULTILINE)
+
+def _unchanged_on_disk(abs_path: Path, rel_path: str, final_content: str, file_hash: str, content_hash: str,
+                       obs_note_data: Optional[Dict[str, Any]], manifest: Optional[SyncManifest]) -> Optional[str]:
+    """Whole-file hash of the note file at *abs_path* if it need not be rewritten, else None.
+
+    That is the case if it holds exactly *final_content*, or differs from it
+    only in anki_note_mod: a mod bump without any exported change (e.g. an
+    edit undone in the editor) is not worth a write. The file's anki_note_mod
+    then lags Anki's; the caller records the current one in the manifest.
+    """
+    entry = manifest.get_current(rel_path, abs_path) if manifest is not None else None
+    if entry is not None and entry[5] == file_hash: return file_hash
+    # Only read the file if the stored body hash already matches.
+    stored_hash = entry[2] if entry is not None else (obs_note_data or {}).get("content_hash")
+    if stored_hash != content_hash: return None
+    try:
+        stats.count("files_opened")
+        with open(abs_path, 'r', encoding='utf-8') as f: text = f.read()
+    except (OSError, UnicodeDecodeError): return None
+    stats.count("bytes_read", len(text))
+    if text == final_content: return file_hash
+    if _NOTE_MOD_LINE.sub("", text, 1) == _NOTE_MOD_LINE.sub("", final_content, 1): return calculate_content_hash(text)
+    return None
+
+CONVERSION_CHUNK_SIZE = 64   # notes per task sent to a conversion worker
+MIN_NOTES_FOR_POOL = 200     # below this, worker start-up costs more than it saves
+
+class _WorkerModule:
+    """Pickles as importlib.import_module(name).
+
+    Unpickled in a pool worker, it imports *name* there as a top-level module:
+    the worker must not import the add-on package, whose __init__ needs a
+    running Anki. Only the workers get the add-on folder on sys.path (see
+    _conversion_pool); Anki's own process never imports html_converter twice.
+    """
+    def __init__(self, name: str): self.name = name
+    def __reduce__(self): return importlib.import_module, (self.name,)
+
+class _WorkerFunction:
+    """Pickles as getattr(<module imported in the worker>, name): a picklable stand-in for module.name."""
+    def __init__(self, module: str, name: str): self.module, self.name = module, name
+    def __reduce__(self): return getattr, (_WorkerModule(self.module), self.name)
+
+def _conversion_pool(workers: int) -> ProcessPoolExecutor:
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=site.addsitedir, initargs=(addon_dir,))
+
+def iter_note_bodies(notes_to_process: List[Dict[str, Any]], workers: int = 1, cache_path: Optional[str] = None,
+                     cache_stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    """Yield the Markdown body of each note action, in order.
+
+    With workers > 1 the notes are converted in chunks on a process pool; if the
+    pool cannot start or breaks, the remaining notes are converted in-process.
+    Field conversions go through the conversion cache (on-disk tier at
+    *cache_path*, if given). Cache hit/miss and per-tier counters are added to *cache_stats*.
+    """
+    if cache_stats is None: cache_stats = {}
+    def add_stats(delta):
+        for k in CONVERSION_COUNTERS: cache_stats[k] = cache_stats.get(k, 0) + delta.get(k, 0)
+    jobs = [(d["relevant_fields"], d["note_type_name"], d["note_id"], d.get("card_id"))
+            for d in (a["anki_note_data"] for a in notes_to_process)]
+    done = 0
+    # A frozen Anki build would spawn the Anki binary itself as the worker, so it converts in-process.
+    if workers > 1 and len(jobs) >= MIN_NOTES_FOR_POOL and not getattr(sys, "frozen", False):
+        chunks = [jobs[i:i + CONVERSION_CHUNK_SIZE] for i in range(0, len(jobs), CONVERSION_CHUNK_SIZE)]
+        try:
+            convert = _WorkerFunction("html_converter", "convert_note_bodies")
+            with _conversion_pool(min(workers, len(chunks))) as pool:
+                try:
+                    for chunk, (bodies, delta, times) in zip(chunks, pool.map(convert, chunks, [cache_path] * len(chunks))):
+                        add_stats(delta)
+                        for job, seconds in zip(chunk, times): stats.note_time(job[2], seconds)
+                        for body in bodies: yield body; done += 1
+                except GeneratorExit:
+                    pool.shutdown(wait=False, cancel_futures=True)  # consumer stopped (cancelled sync)
+                    raise
+            return
+        except Exception as e:
+            log.warning("Process-pool conversion failed (%r); converting the remaining %d notes in-process.", e, len(jobs) - done)
+    cache = configure_conversion_cache(cache_path); before = conversion_stats()
+    try:
+        for fields, note_type_name, note_id, card_id in jobs[done:]:
+            start = time.perf_counter()
+            body = combine_fields_to_markdown(fields, note_type_name, note_id, card_id=card_id)
+            stats.note_time(note_id, time.perf_counter() - start)
+            yield body
+    finally:
+        cache.flush(); after = conversion_stats()
+        add_stats({k: after[k] - before[k] for k in CONVERSION_COUNTERS})
+
 def execute_note_writes(
-    actions: Dict[str, Any], obsidian_base_path: Path, assets_rel_path: str ):
-    print("Executing Phase 4: Note File Writing...")
+    actions: Dict[str, Any], obsidian_base_path: Path, assets_rel_path: str,
+    manifest: Optional[SyncManifest] = None, workers: int = 1, cache_path: Optional[str] = None ) -> Dict[str, int]:
+    """Writes created/updated notes; records each written file in *manifest* (committed at the end).
+
+    Files whose rendered content (frontmatter + body) is already on disk are
+    not rewritten, and unchanged notes that only moved are renamed in place.
+    Bodies are converted by iter_note_bodies on *workers* processes.
+    Returns {"written": n, "skipped": n} plus the conversion cache counters.
+    """
+    log.info("Executing Phase 4: Note File Writing...")
     notes_to_create = actions.get("notes_to_create", []); notes_to_update = actions.get("notes_to_update", [])
     notes_to_process = notes_to_create + notes_to_update
-    if not notes_to_process: print("No notes to create or update."); return
-    anki_media_path = mw.col.media.dir(); obsidian_assets_abs_path = obsidian_base_path / assets_rel_path
-    images_to_copy_set = actions.get("images_to_copy", set()).copy(); notes_written = 0
-    total_notes = len(notes_to_process); mw.progress.start(label="Writing Note Files...", max=total_notes, immediate=True)
-    for i, note_action in enumerate(notes_to_process):
+    if not notes_to_process: log.info("No notes to create or update."); return dict.fromkeys(("written", "skipped") + CONVERSION_COUNTERS, 0)
+    total_notes = len(notes_to_process); progress.start(label="Writing Note Files...", max=total_notes, immediate=True)
+    cancelled = False
+    with (manifest.transaction() if manifest is not None else nullcontext()):
+        cache_stats = dict.fromkeys(CONVERSION_COUNTERS, 0)
+        bodies = iter_note_bodies(notes_to_process, workers, cache_path, cache_stats)
+        # A cancel stops between notes; the files written so far stay recorded in the manifest.
+        try: write_stats = _write_notes(notes_to_process, bodies, obsidian_base_path, manifest)
+        except SyncCancelled: cancelled = True
+        finally: bodies.close()
+    progress.finish()
+    stats.add(cache_stats)
+    if cancelled: raise SyncCancelled()
+    log.info("Conversion cache: %(memory_hits)d memory hits, %(disk_hits)d disk hits, %(misses)d misses.", cache_stats)
+    log.info("Conversion tiers: %(plain_tier)d plain text, %(light_tier)d light HTML, %(full_tier)d full.", cache_stats)
+    return {**write_stats, **cache_stats}
+
+def _write_notes(notes_to_process, bodies, obsidian_base_path, manifest):
+    """Body of execute_note_writes, run inside the manifest transaction."""
+    notes_written = notes_skipped = 0
+    for i, (note_action, markdown_body) in enumerate(zip(notes_to_process, bodies)):
+        progress.check_cancel()
         anki_note_data = note_action["anki_note_data"]; target_rel_path = note_action["target_rel_path"]
         target_abs_path = obsidian_base_path / target_rel_path; note_id = anki_note_data["note_id"]
-        note_type_name = anki_note_data["note_type_name"]; fields = anki_note_data["relevant_fields"]
-        required_images = anki_note_data.get("required_images", set()); card_ids = anki_note_data.get("card_ids", [])
-        old_abs_path = None
-        if "obs_note_data" in note_action and note_action.get("needs_move", False):
-            old_rel_path = note_action["obs_note_data"]["obs_rel_path"]; old_abs_path = obsidian_base_path / old_rel_path
-            print(f"DEBUG: Note {note_id} needs move from {old_rel_path} to {target_rel_path}")
-        copy_required_media(required_images, images_to_copy_set, anki_media_path, obsidian_assets_abs_path)
-        markdown_body = combine_fields_to_markdown(fields, note_type_name, note_id)
+        card_ids = anki_note_data.get("card_ids", [])
+        old_abs_path = None; obs_note_data = note_action.get("obs_note_data")
+        if obs_note_data and note_action.get("needs_move", False):
+            old_rel_path = obs_note_data["obs_rel_path"]; old_abs_path = obsidian_base_path / old_rel_path
+            log.debug("Note %s moves from %s to %s", note_id, old_rel_path, target_rel_path)
         content_hash = calculate_content_hash(markdown_body)
         frontmatter_dict = {
             "anki_note_id": note_id,
@@ -150,19 +402,42 @@ def execute_note_writes(
         try:
             if not YAML_AVAILABLE: frontmatter_yaml = f"# YAML Frontmatter requires PyYAML library (missing)\n# anki_note_id: {note_id}\n"
             else: frontmatter_yaml = yaml.dump(frontmatter_dict, sort_keys=False, allow_unicode=True, default_flow_style=False)
-        except Exception as e: print(f"Error dumping YAML for {target_rel_path}: {e}"); frontmatter_yaml = f"# Error generating YAML: {e}\n"
+        except Exception as e: errors.record("Writing frontmatter", target_rel_path, e); frontmatter_yaml = f"# Error generating YAML: {e}\n"
         final_content = f"---\n{frontmatter_yaml}---\n\n{markdown_body}"
+        file_hash = calculate_content_hash(final_content)
         try:
-            if old_abs_path and old_abs_path.is_file(): print(f"DEBUG: Deleting old file for move: {old_abs_path}"); old_abs_path.unlink()
+            if old_abs_path:
+                disk_hash = None if target_abs_path.exists() else _unchanged_on_disk(
+                    old_abs_path, old_rel_path, final_content, file_hash, content_hash, obs_note_data, manifest)
+                if disk_hash:
+                    # Same bytes, new location: rename instead of rewriting.
+                    ensure_dir_exists(target_abs_path.parent); os.replace(old_abs_path, target_abs_path)
+                    if manifest is not None:
+                        manifest.remove(old_rel_path)
+                        manifest.record_file(target_rel_path, target_abs_path, note_id, anki_note_data["note_mod_time"], content_hash, disk_hash)
+                    notes_skipped += 1
+                    if progress.due(): progress.update(label=f"Moving note: {target_rel_path}", value=i + 1)
+                    continue
+                if manifest is not None: manifest.remove(old_rel_path)
+                if old_abs_path.is_file(): old_abs_path.unlink()
+            elif obs_note_data:
+                disk_hash = _unchanged_on_disk(target_abs_path, target_rel_path, final_content, file_hash, content_hash, obs_note_data, manifest)
+                if disk_hash:
+                    if manifest is not None: manifest.record_file(target_rel_path, target_abs_path, note_id, anki_note_data["note_mod_time"], content_hash, disk_hash)
+                    notes_skipped += 1
+                    if progress.due(): progress.update(label=f"Unchanged: {target_rel_path}", value=i + 1)
+                    continue
             ensure_dir_exists(target_abs_path.parent)
-            print(f"DEBUG: Attempting to write note to: {target_abs_path}") # <-- Added log
-            with open(target_abs_path, 'w', encoding='utf-8') as f: f.write(final_content)
-            print(f"DEBUG: Successfully wrote note to: {target_abs_path}") # <-- Added log
-            notes_written += 1; mw.progress.update(label=f"Writing note: {target_rel_path}", value=i + 1)
+            write_text_atomic(target_abs_path, final_content)
+            log.debug("Wrote %s", target_rel_path)
+            if manifest is not None: manifest.record_file(target_rel_path, target_abs_path, note_id, anki_note_data["note_mod_time"], content_hash, file_hash)
+            notes_written += 1
+            if progress.due(): progress.update(label=f"Writing note: {target_rel_path}", value=i + 1)
         except Exception as e:
-            print(f"ERROR: Failed to write note file {target_rel_path} to {target_abs_path}. Exception: {e}") # <-- Enhanced error log
-            mw.progress.update(label=f"Error writing: {target_rel_path}", value=i + 1)
-    mw.progress.finish(); print(f"Phase 4 complete. Wrote/Updated {notes_written} note files.")
+            errors.record("Writing notes", target_rel_path, e)
+    log.info("Phase 4 complete. Wrote/Updated %d note files, skipped %d unchanged.", notes_written, notes_skipped)
+    stats.add({"notes_written": notes_written, "notes_skipped": notes_skipped})
+    return {"written": notes_written, "skipped": notes_skipped}
 
 # --- Phase 5: Linking & MOC Generation (Hierarchical Root MOC) ---
 
@@ -178,22 +453,26 @@ def clean_moc_link_text(text: str) -> str:
     if len(text) > max_len: text = text[:max_len] + "..."
     return text or "Untitled Note"
 
+def note_display_text(note_id: int, note_data: Dict[str, Any]) -> str:
+    """MOC link text for a note record; computed once and kept in the record (records live across incremental syncs)."""
+    display_text = note_data.get("display_text")
+    if display_text is None:
+        note_type = note_data.get("note_type_name", ""); fields = note_data.get("relevant_fields", {})
+        if "Cloze" in note_type: display_text = fields.get("Title", "") or fields.get("Text") or fields.get("Content", "")
+        elif "Basic" in note_type: display_text = fields.get("Front", "")
+        else: first_field_name = next(iter(fields)) if fields else None; display_text = fields.get(first_field_name, f"Note_{note_id}")
+        display_text = note_data["display_text"] = clean_moc_link_text(display_text)
+    return display_text
+
 def get_note_display_text(note_id: int, anki_state: Dict[str, Any]) -> str:
-    for deck_path, deck_data in anki_state.items():
-        if deck_path == "_root_": continue
-        if note_id in deck_data.get("notes", {}):
-            note_data = deck_data["notes"][note_id]; note_type = note_data.get("note_type_name", "")
-            fields = note_data.get("relevant_fields", {}); display_text = ""
-            if "Cloze" in note_type: display_text = fields.get("Title", "") or fields.get("Text") or fields.get("Content", "")
-            elif "Basic" in note_type: display_text = fields.get("Front", "")
-            else: first_field_name = next(iter(fields)) if fields else None; display_text = fields.get(first_field_name, f"Note_{note_id}")
-            return clean_moc_link_text(display_text)
-    return f"Note_{note_id}"
+    note_data = get_note_index(anki_state).get(note_id)
+    return note_display_text(note_id, note_data) if note_data is not None else f"Note_{note_id}"
 
 # Helper function for numerical sorting of MOC links
+_MOC_NUMBER_PREFIX = re.compile(r'(\d+)\.')
 def get_moc_sort_key(note_tuple):
     display_text = note_tuple[0]
-    match = re.match(r'^(\d+)\.', display_text)
+    match = _MOC_NUMBER_PREFIX.match(display_text)
     if match:
         try:
             return int(match.group(1))
@@ -209,8 +488,10 @@ def _generate_root_moc_recursive(deck_path: str, anki_state: Dict[str, Any], cur
     lines = []
     deck_data = anki_state.get(deck_path)
     if not deck_data: return lines
+    deck_tree = anki_state["_root_"].get("deck_tree")
+    deck_info = deck_tree.exported.get(deck_path, deck_data) if deck_tree else deck_data
 
-    deck_name_part = deck_data.get("anki_deck_name", deck_path.split('/')[-1])
+    deck_name_part = deck_info.get("anki_deck_name", deck_path.split('/')[-1])
     heading_level = min(current_level + 1, 6) # Start at H2 for top-level
     heading_prefix = "#" * heading_level
     lines.append(f"{heading_prefix} {deck_name_part}") # Just the heading text
@@ -218,32 +499,49 @@ def _generate_root_moc_recursive(deck_path: str, anki_state: Dict[str, Any], cur
     # Add link to the deck's specific MOC *if* it has notes
     deck_has_notes = bool(deck_data.get("notes"))
     if deck_has_notes:
-        deck_moc_filename = deck_data.get("moc_filename", "_unknown_index.md")
+        deck_moc_filename = deck_info.get("moc_filename", "_unknown_index.md")
         moc_link = Path(deck_path).joinpath(deck_moc_filename).as_posix()
         # Add the link on the line below the heading
         lines.append(f"- [[{moc_link}|{deck_name_part} MOC]]") # Link to the deck MOC
 
     # Recursively add subdecks
-    subdeck_paths = sorted(list(deck_data.get("subdeck_paths", set())))
+    subdeck_paths = sorted(list(deck_info.get("subdeck_paths", set())))
     for sub_path in subdeck_paths:
         lines.extend(_generate_root_moc_recursive(sub_path, anki_state, current_level + 1))
 
     return lines
 
+def _moc_page_index(moc_filename: str, deck_moc_filename: str) -> Optional[int]:
+    """0-based page number if *moc_filename* is a page of the deck MOC *deck_moc_filename*."""
+    match = MOC_PAGE_FILENAME.fullmatch(moc_filename)
+    if match and moc_filename[:-len(match.group(1)) - 4] + ".md" == deck_moc_filename: return int(match.group(1)) - 1
+    return None
+
+def _deck_moc_pages(deck_data: Dict[str, Any], page_count: int) -> List[Dict[int, Any]]:
+    """The deck's notes split into *page_count* pages; memoized in deck_data for the other pages."""
+    cached = deck_data.get("moc_pages")
+    if cached is None or cached[0] != page_count:
+        pages = [{} for _ in range(page_count)]
+        for nid, note_data in deck_data.get("notes", {}).items(): pages[moc_page_of(nid, page_count)][nid] = note_data
+        cached = deck_data["moc_pages"] = (page_count, pages)
+    return cached[1]
+
 def generate_moc_content(
     moc_rel_path_str: str,
     anki_state: Dict[str, Any],
-    obsidian_base_path: Path # Unused but kept for signature consistency
+    obsidian_base_path: Path, # Unused but kept for signature consistency
+    page_size: int = 0
     ) -> str:
     content = []
     moc_rel_path = Path(moc_rel_path_str)
     is_root_moc = (moc_rel_path.name == ROOT_MOC_FILENAME)
+    deck_tree = anki_state["_root_"].get("deck_tree")
 
     if is_root_moc:
         # --- Root MOC (Hierarchical Headings + Links to Deck MOCs) ---
         content.append(f"# {anki_state['_root_']['anki_deck_name']}")
         content.append("")
-        top_level_deck_paths = sorted(list(anki_state["_root_"].get("subdeck_paths", set())))
+        top_level_deck_paths = sorted(deck_tree.root_paths if deck_tree else anki_state["_root_"].get("subdeck_paths", set()))
         if not top_level_deck_paths: content.append("- (No decks found)")
         else:
             for deck_path in top_level_deck_paths:
@@ -252,21 +550,38 @@ def generate_moc_content(
                 content.append("") # Add space between top-level deck sections
     else:
         # --- Deck/Subdeck MOC (Only Notes) ---
-        deck_rel_path_str = moc_rel_path.parent.as_posix()
-        if deck_rel_path_str == ".": deck_rel_path_str = ""
+        if deck_tree:
+            deck_rel_path_str = deck_tree.deck_path_for_moc(moc_rel_path.as_posix()) or ""
+        else:
+            deck_rel_path_str = moc_rel_path.parent.as_posix()
+            if deck_rel_path_str == ".": deck_rel_path_str = ""
 
         deck_data = anki_state.get(deck_rel_path_str)
-        if deck_data:
+        notes_in_deck = deck_data.get("notes", {}) if deck_data else {}
+        page_count = moc_page_count(len(notes_in_deck), page_size)
+        page = _moc_page_index(moc_rel_path.name, deck_data.get("moc_filename", "")) if deck_data else None
+        if deck_data and page_count and page is None:
+            # --- Index of a paginated deck MOC (links to its pages only) ---
             deck_name = deck_data.get("anki_deck_name", deck_rel_path_str.split('/')[-1])
-            # No main heading needed if it only lists notes? Or keep it? Let's keep it.
             content.append(f"# Notes in Deck: {deck_name}")
+            content.append("\n## Pages\n")
+            moc_dir = moc_rel_path.parent.as_posix()
+            for p in range(page_count):
+                page_link = moc_page_filename(moc_rel_path.name, p) if moc_dir == "." else f"{moc_dir}/{moc_page_filename(moc_rel_path.name, p)}"
+                content.append(f"- [[{page_link}|{deck_name} ({p + 1}/{page_count})]]")
+        elif deck_data:
+            deck_name = deck_data.get("anki_deck_name", deck_rel_path_str.split('/')[-1])
+            # No main heading needed if it only lists notes? Or keep it? Let's keep it.
+            if page is None: content.append(f"# Notes in Deck: {deck_name}")
+            else:
+                content.append(f"# Notes in Deck: {deck_name} ({page + 1}/{page_count})")
+                notes_in_deck = _deck_moc_pages(deck_data, page_count)[page] if page < page_count else {}
             content.append("\n## Notes\n")
             note_links = []
-            notes_in_deck = deck_data.get("notes", {})
             for note_id, note_data in notes_in_deck.items():
-                display_text = get_note_display_text(note_id, anki_state)
+                display_text = note_display_text(note_id, note_data)
                 note_filename = note_data.get("target_filename", f"UnknownNote_{note_id}.md")
-                note_rel_link = Path(deck_rel_path_str).joinpath(note_filename).as_posix()
+                note_rel_link = f"{deck_rel_path_str}/{note_filename}" if deck_rel_path_str else note_filename
                 note_links.append((display_text, f"- [[{note_rel_link}|{display_text}]]"))
             # Sort using the custom numerical key function
             note_links.sort(key=get_moc_sort_key)
@@ -281,30 +596,41 @@ def generate_moc_content(
 def execute_moc_generation(
     actions: Dict[str, Any],
     anki_state: Dict[str, Any],
-    obsidian_base_path: Path
+    obsidian_base_path: Path,
+    moc_page_size: int = 0,
+    manifest: Optional[SyncManifest] = None
     ):
-    """Handles creating/updating/deleting MOC files based on new rules."""
-    print("Executing Phase 5: MOC Generation (Hierarchical Root)...")
+    """Handles creating/updating/deleting MOC files based on new rules.
+
+    Each MOC written (or found up to date) is removed from the *manifest*'s
+    pending MOCs; the ones that fail or are never reached stay pending.
+    """
+    log.info("Executing Phase 5: MOC Generation (Hierarchical Root)...")
     mocs_to_create = actions.get("mocs_to_create", set())
     mocs_to_update = actions.get("mocs_to_update", set())
     mocs_to_process = mocs_to_create.union(mocs_to_update) # Files to write/overwrite
 
-    if not mocs_to_process: print("No MOC files need updating or creation."); return
+    if not mocs_to_process: log.info("No MOC files need updating or creation."); return
 
-    mocs_written = 0; total_mocs = len(mocs_to_process)
-    mw.progress.start(label="Generating MOC Files...", max=total_mocs, immediate=True)
+    mocs_written = mocs_unchanged = 0; total_mocs = len(mocs_to_process)
+    progress.start(label="Generating MOC Files...", max=total_mocs, immediate=True)
 
     for i, moc_rel_path in enumerate(mocs_to_process):
+        progress.check_cancel()
         target_abs_path = obsidian_base_path / moc_rel_path
-        mw.progress.update(label=f"Generating MOC: {moc_rel_path}", value=i)
+        if progress.due(): progress.update(label=f"Generating MOC: {moc_rel_path}", value=i)
         try:
-            moc_content = generate_moc_content(moc_rel_path, anki_state, obsidian_base_path)
-            ensure_dir_exists(target_abs_path.parent)
-            with open(target_abs_path, 'w', encoding='utf-8') as f: f.write(moc_content)
-            mocs_written += 1
+            moc_content = generate_moc_content(moc_rel_path, anki_state, obsidian_base_path, moc_page_size)
+            if _file_has_content(target_abs_path, moc_content): mocs_unchanged += 1
+            else:
+                ensure_dir_exists(target_abs_path.parent)
+                write_text_atomic(target_abs_path, moc_content)
+                mocs_written += 1
+            if manifest is not None: manifest.remove_pending_moc(moc_rel_path)
         except Exception as e:
-            print(f"Error generating or writing MOC file {moc_rel_path}: {e}")
-            mw.progress.update(label=f"Error MOC: {moc_rel_path}", value=i + 1)
+            errors.record("Generating MOCs", moc_rel_path, e)
 
-    mw.progress.finish()
-    print(f"Phase 5 complete. Wrote/Updated {mocs_written} MOC files.")
\ No newline at end of file
+    if manifest is not None: manifest.commit()
+    progress.finish()
+    stats.add({"mocs_written": mocs_written, "mocs_unchanged": mocs_unchanged})
+    log.info("Phase 5 complete. Wrote/Updated %d MOC files (%d already up to date).", mocs_written, mocs_unchanged)
\ No newline at end of file
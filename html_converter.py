@@ -3,12 +3,22 @@
 """
 Handles the conversion of Anki field HTML content to Obsidian-compatible Markdown.
 Uses BeautifulSoup to perfectly preserve tables, un-nest nested tables, and retain inline media.
+
+Deliberately free of Anki imports so it can run in conversion worker processes.
+
+Converted fields are memoized by a content-addressed ConversionCache: an
+in-memory LRU plus an optional SQLite tier that persists between syncs.
 """
 
+import os
 import re
 import html
-from typing import Optional, Dict, List, Tuple
-from aqt import mw
+import time
+import logging
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple, NamedTuple
 
 # --- Dependency Check ---
 try:
@@ -27,54 +37,108 @@ except ImportError:
         processed = re.sub('<[^>]+>', '', processed)
         return html.unescape(processed)
 
+# Same logger as sync_log.log; looked up by name since this module also runs outside the package
+log = logging.getLogger("obsidian_sync")
+
 # --- Regex Matchers ---
 CLOZE_REGEX = re.compile(r"\{\{c(\d+)::(.*?)(?:::(.*?))?\}\}", re.DOTALL)
 IMAGE_REGEX = re.compile(r'<img[^>]+src=["\']([^"\'>]+)["\'][^>]*>', re.IGNORECASE)
 AUDIO_REGEX = re.compile(r'\[sound:([^\]]+)\]', re.IGNORECASE)
 VIDEO_REGEX = re.compile(r'<video[^>]+src=["\']([^"\'>]+)["\'][^>]*>.*?</video>', re.IGNORECASE | re.DOTALL)
+EMBED_REGEX = re.compile(r'!\[\[.*?\]\]')
+
+# All media rules in one alternation: the leftmost reference wins, <video>/<img> before src=, src= before paste- names.
+# The leading lookahead lets the regex engine skip to candidate characters instead of trying every branch everywhere.
+_MEDIA_EXT = r'jpg|jpeg|png|gif|webp|svg|mp3|mp4|wav|ogg|webm'
+MEDIA_SCAN_REGEX = re.compile(
+    r'(?=[<\[sSpP])(?:(?P<video><video[^>]+src=["\'](?P<video_src>[^"\'>]+)["\'][^>]*>.*?</video>)'
+    r'|(?P<img><img[^>]+src=["\'](?P<img_src>[^"\'>]+)["\'][^>]*>)'
+    r'|\[sound:(?P<sound>[^\]]+)\]'
+    r'|src=["\'](?P<src>[^"\'\n]*?\.(?:' + _MEDIA_EXT + r'))["\']'
+    r'|(?P<paste>paste-[a-f0-9]+\.(?:jpg|jpeg|png|gif|webp|svg)))',
+    re.IGNORECASE | re.DOTALL)
+_MEDIA_KINDS = {"video": "video", "img": "image", "sound": "audio", "src": "src", "paste": "paste"}
+_EMBED_KINDS = frozenset(("video", "image", "audio"))
+
+# One alternative per math delimiter style; display-math groups are listed in _BLOCK_MATH_GROUPS.
+MATH_TOKEN_REGEX = re.compile(
+    r'\\\[(.*?)\\\]|\\\((.*?)\\\)|\[\$\$\](.*?)\[/\$\$\]|\[\$\](.*?)\[/\$\]'
+    r'|<anki-mathjax block="true">(.*?)</anki-mathjax>|<anki-mathjax>(.*?)</anki-mathjax>'
+    r'|\$\$(.*?)\$\$|\$(.*?)\$', re.DOTALL)
+_BLOCK_MATH_GROUPS = frozenset((1, 3, 5, 7))
+# Anything that could open or close a math span; must not occur outside or inside a span on the one-pass path.
+MATH_TRIGGER_REGEX = re.compile(r'\$|\\[][()]|anki-mathjax')
+MATH_PLACEHOLDER_REGEX = re.compile(r'MATHPLACEHOLDER\d+ENDMATH')
+EMBED_PLACEHOLDER_REGEX = re.compile(r'EMBEDPLACEHOLDER\d+ENDEMBED')
+STORE_PLACEHOLDER_REGEX = re.compile(r'TABLEPLACEHOLDER\d+ENDTABLE|MATHPLACEHOLDER\d+ENDMATH')
+
+class MediaRef(NamedTuple):
+    """One media reference found by scan_media; [start, end) is the span in the scanned HTML."""
+    kind: str   # "video" / "image" / "audio" are rewritten to embeds; "src" / "paste" are references only
+    src: str
+    start: int
+    end: int
+
+def scan_media(html_content: str) -> List[MediaRef]:
+    """Find every media reference in *html_content* in one left-to-right pass.
+
+    <video> elements, <img> tags and [sound:] tags are the spans the converter
+    turns into embeds. Other src="...ext" attributes (e.g. <source>) and bare
+    paste-<hash>.<ext> names are returned as references too, so the same scan
+    also decides which files a note needs.
+    """
+    if not html_content:
+        return []
+    refs = []
+    for m in MEDIA_SCAN_REGEX.finditer(html_content):
+        kind = m.lastgroup
+        src = m.group(kind + "_src") if kind in ("video", "img") else m.group(kind)
+        refs.append(MediaRef(_MEDIA_KINDS[kind], src, m.start(), m.end()))
+    return refs
+
+def is_local_media(src: str) -> bool:
+    return not src.startswith(('http:', 'https:', 'data:'))
 
-def extract_and_preserve_media(html_content: str) -> Tuple[str, List[Dict[str, str]]]:
-    """Extracts media references and converts them to Obsidian native wiki-embeds."""
+def extract_and_preserve_media(html_content: str, refs: Optional[List[MediaRef]] = None) -> Tuple[str, List[Dict[str, str]]]:
+    """Extracts media references and converts them to Obsidian native wiki-embeds.
+
+    *refs* may be passed if scan_media already ran on this exact string.
+    """
+    if refs is None:
+        refs = scan_media(html_content)
     media_items = []
-    content = html_content
-    
-    # Handle audio
-    for match in AUDIO_REGEX.finditer(content):
-        audio_file = match.group(1)
-        media_items.append({'type': 'audio', 'src': audio_file})
-        content = content.replace(match.group(0), f'![[{audio_file}]]')
-    
-    # Handle video
-    for match in VIDEO_REGEX.finditer(content):
-        video_src = match.group(1)
-        media_items.append({'type': 'video', 'src': video_src})
-        content = content.replace(match.group(0), f'![[{video_src}]]')
-    
-    # Handle standard images
-    def replace_img(match):
-        src = match.group(1)
-        if src.startswith('paste-') or src.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg')):
-            media_items.append({'type': 'image', 'src': src})
-        return f'![[{src}]]'
-        
-    content = IMAGE_REGEX.sub(replace_img, content)
-    return content, media_items
+    parts = []; pos = 0
+    for ref in refs:
+        if ref.kind not in _EMBED_KINDS:
+            continue
+        src = ref.src
+        if ref.kind != 'image' or src.startswith('paste-') or src.endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg')):
+            media_items.append({'type': ref.kind, 'src': src})
+        parts.append(html_content[pos:ref.start]); parts.append(f'![[{src}]]'); pos = ref.end
+    if not parts:
+        return html_content, media_items
+    parts.append(html_content[pos:])
+    return "".join(parts), media_items
 
 def convert_html_to_markdown(html_content: str, preserve_tables: bool = True, remove_hints: bool = True) -> str:
     if not html_content:
         return ""
+    cache = _conversion_cache
+    if cache is None:
+        return _convert_html_to_markdown(html_content, preserve_tables, remove_hints)
+    key = cache.key(html_content, preserve_tables, remove_hints)
+    markdown = cache.get(key)
+    if markdown is None:
+        markdown = _convert_html_to_markdown(html_content, preserve_tables, remove_hints)
+        cache.put(key, markdown)
+    return markdown
 
-    content = html_content
-    
-    # Override table preservation based on user config
-    if False:
-        preserve_tables = False
+def _protect_math_sequential(content: str, math_store: Dict[str, str]) -> str:
+    """Reference math handling: rewrite each delimiter style in turn, then protect $$...$$ and $...$.
 
-    table_store = {}
-    math_store = {}
-    embed_store = {}
-
-    # --- 1. Protect & Convert MathJax/LaTeX ---
+    Used when a field's delimiters nest, touch or stray, where the order of
+    these passes decides the result.
+    """
     content = re.sub(r'\\\[(.*?)\\\]', r'$$\1$$', content, flags=re.DOTALL)
     content = re.sub(r'\\\((.*?)\\\)', r'$\1$', content, flags=re.DOTALL)
     content = re.sub(r'\[\$\$\](.*?)\[/\$\$\]', r'$$\1$$', content, flags=re.DOTALL)
@@ -87,7 +151,263 @@ def convert_html_to_markdown(html_content: str, preserve_tables: bool = True, re
         math_store[ph] = m.group(0)
         return ph
     content = re.sub(r'\$\$.*?\$\$', save_math, content, flags=re.DOTALL)
-    content = re.sub(r'\$.*?\$', save_math, content, flags=re.DOTALL)
+    return re.sub(r'\$.*?\$', save_math, content, flags=re.DOTALL)
+
+def _protect_math(content: str, math_store: Dict[str, str]) -> str:
+    """Replace every math span with a MATHPLACEHOLDER, in one scan of the field.
+
+    *math_store* must be empty; it is filled with placeholder -> $...$ / $$...$$.
+
+    Produces exactly what _protect_math_sequential would, including placeholder
+    numbering (display math first, then inline). Fields where the two could
+    disagree are handed to _protect_math_sequential.
+    """
+    if "$" not in content and "\\" not in content and "anki-mathjax" not in content:
+        return content
+    spans = []  # (start, end, is_block, inner)
+    last_end = 0
+    for m in MATH_TOKEN_REGEX.finditer(content):
+        group = m.lastindex
+        inner = m.group(group)
+        is_block = group in _BLOCK_MATH_GROUPS
+        start, end = m.start(), m.end()
+        if (start == last_end and spans) or (not is_block and not inner) \
+                or (start and content[start - 1] in "\\[/") or content[end:end + 1] == "]" or inner.endswith("\\") \
+                or MATH_TRIGGER_REGEX.search(content, last_end, start) or MATH_TRIGGER_REGEX.search(inner):
+            return _protect_math_sequential(content, math_store)
+        spans.append((start, end, is_block, inner))
+        last_end = end
+    if MATH_TRIGGER_REGEX.search(content, last_end):
+        return _protect_math_sequential(content, math_store)
+    if not spans:
+        return content
+
+    # Placeholders are numbered display math first, then inline, as the sequential passes number them.
+    n_block = sum(1 for span in spans if span[2])
+    next_block, next_inline = 0, n_block
+    inline_store = {}
+    parts = []; pos = 0
+    for start, end, is_block, inner in spans:
+        if is_block:
+            ph = f"MATHPLACEHOLDER{next_block}ENDMATH"; next_block += 1; math_store[ph] = f"$${inner}$$"
+        else:
+            ph = f"MATHPLACEHOLDER{next_inline}ENDMATH"; next_inline += 1; inline_store[ph] = f"${inner}$"
+        parts.append(content[pos:start]); parts.append(ph); pos = end
+    parts.append(content[pos:])
+    math_store.update(inline_store)
+    return "".join(parts)
+
+# --- Tiered conversion ---
+# Fields made only of text, <b>, <i>, <br> and <div> (plus common entities) skip
+# BeautifulSoup and markdownify: _render_light reproduces markdownify's output
+# for exactly that subset. Everything else takes the full path.
+
+TIER_COUNTERS = ("plain_tier", "light_tier", "full_tier")
+tier_counters = dict.fromkeys(TIER_COUNTERS, 0)
+
+_LIGHT_TAG_REGEX = re.compile(r'<(/?)(b|i|br|div)(?:\s[^<>]*?)?\s*(/?)>', re.IGNORECASE)
+_LIGHT_ENTITY_REGEX = re.compile(r'&(?:(nbsp|amp|lt|gt|quot)|#([0-9]{1,7})|#[xX]([0-9a-fA-F]{1,6}));')
+_NAMED_ENTITIES = {"nbsp": "\xa0", "amp": "&", "lt": "<", "gt": ">", "quot": '"'}
+_NEWLINE_WHITESPACE_REGEX = re.compile(r'[\t \r\n]*[\r\n][\t \r\n]*')
+_WHITESPACE_REGEX = re.compile(r'[\t ]+')
+_CONTROL_CHAR_REGEX = re.compile(r'[\x00-\x08\x0b-\x1f\x7f-\x9f]')  # html.parser/bs4 rewrite some of these
+_EDGE_NEWLINES_REGEX = re.compile(r'^(\n*)((?:.*[^\n])?)(\n*)$', flags=re.DOTALL)
+
+class _LightNode:
+    __slots__ = ("name", "text", "children")
+
+    def __init__(self, name: Optional[str], text: str = ""):
+        self.name = name          # None for text nodes
+        self.text = text
+        self.children: List["_LightNode"] = []
+
+def _is_block(node: Optional[_LightNode]) -> bool:
+    return node is not None and node.name == "div"
+
+def _decode_light_text(text: str) -> Optional[str]:
+    """Decode the entities html.parser would; None if the text holds anything riskier."""
+    if "&" not in text:
+        return text
+    def decode(m):
+        if m.group(1):
+            return _NAMED_ENTITIES[m.group(1)]
+        cp = int(m.group(2)) if m.group(2) else int(m.group(3), 16)
+        if not (32 <= cp < 127 or 160 <= cp < 0xD800 or 0xE000 <= cp <= 0xFFFD):
+            raise ValueError(cp)
+        return chr(cp)
+    if "&" in _LIGHT_ENTITY_REGEX.sub("", text):
+        return None
+    try:
+        return _LIGHT_ENTITY_REGEX.sub(decode, text)
+    except ValueError:
+        return None
+
+def _parse_light_html(content: str) -> Optional[_LightNode]:
+    """Parse *content* into a tree if it only uses well-nested b/i/div tags and br."""
+    root = _LightNode("[document]")
+    stack = [root]; pos = 0; seen_plain_br = False
+    for m in _LIGHT_TAG_REGEX.finditer(content):
+        if pos < m.start():
+            text = _decode_light_text(content[pos:m.start()])
+            if text is None or "<" in content[pos:m.start()]:
+                return None
+            stack[-1].children.append(_LightNode(None, text))
+        closing, name, self_closing = m.group(1), m.group(2).lower(), m.group(3)
+        if name == "br":
+            # bs4 leaves a <br/> that follows a plain <br> open, swallowing what comes next.
+            if closing or (self_closing and seen_plain_br):
+                return None
+            seen_plain_br = seen_plain_br or not self_closing
+            stack[-1].children.append(_LightNode("br"))
+        elif self_closing:
+            return None
+        elif closing:
+            if stack[-1].name != name:
+                return None
+            stack.pop()
+        else:
+            node = _LightNode(name)
+            stack[-1].children.append(node); stack.append(node)
+        pos = m.end()
+    if len(stack) != 1:
+        return None
+    if pos < len(content):
+        text = _decode_light_text(content[pos:])
+        if text is None or "<" in content[pos:]:
+            return None
+        root.children.append(_LightNode(None, text))
+    return root
+
+def _render_light_text(text: str, prev: Optional[_LightNode], nxt: Optional[_LightNode], in_block: bool) -> str:
+    text = _WHITESPACE_REGEX.sub(' ', _NEWLINE_WHITESPACE_REGEX.sub('\n', text))
+    text = text.replace('*', r'\*').replace('_', r'\_')
+    if _is_block(prev) or (in_block and prev is None):
+        text = text.lstrip(' \t\r\n')
+    if _is_block(nxt) or (in_block and nxt is None):
+        text = text.rstrip()
+    return text
+
+def _render_light(node: _LightNode) -> str:
+    """markdownify's process_tag, for the document root and b/i/br/div."""
+    in_block = node.name == "div"
+    kids = node.children
+    strings = []
+    for i, el in enumerate(kids):
+        prev = kids[i - 1] if i else None
+        nxt = kids[i + 1] if i + 1 < len(kids) else None
+        if el.name is None:
+            if not el.text.strip() and ((in_block and (prev is None or nxt is None)) or _is_block(prev) or _is_block(nxt)):
+                continue
+            child = _render_light_text(el.text, prev, nxt, in_block)
+        else:
+            child = _render_light(el)
+        if child:
+            strings.append(child)
+
+    # Collapse newlines at child boundaries, as markdownify does.
+    joined = ['']
+    for child in strings:
+        leading, body, trailing = _EDGE_NEWLINES_REGEX.match(child).groups()
+        if joined[-1] and leading:
+            leading = '\n' * min(2, max(len(joined.pop()), len(leading)))
+        joined.extend((leading, body, trailing))
+    text = ''.join(joined)
+
+    if node.name in ("b", "i"):
+        mark = "**" if node.name == "b" else "*"
+        prefix = ' ' if text and text[0] == ' ' else ''
+        suffix = ' ' if text and text[-1] == ' ' else ''
+        text = text.strip()
+        return f"{prefix}{mark}{text}{mark}{suffix}" if text else ''
+    if node.name == "br":
+        return '  \n'
+    if node.name == "div":
+        text = text.strip()
+        return f"\n\n{text}\n\n" if text else ''
+    return text.strip('\n')
+
+def _convert_fast(content: str, math_store: Dict[str, str], remove_hints: bool) -> Optional[str]:
+    """Convert via the plain-text or light-HTML tier; None if the field needs the full path."""
+    if _CONTROL_CHAR_REGEX.search(content):
+        return None
+    plain = "<" not in content and "&" not in content
+    if not plain and _LIGHT_TAG_REGEX.sub("", content).find("<") != -1:
+        return None
+    embed_store = {}
+    content = _protect_embeds(content, embed_store)
+    # The full path sees embeds after BeautifulSoup re-escaped them; only take embeds that would not change.
+    if any(c in embed for embed in embed_store.values() for c in "<>&"):
+        return None
+    if plain:
+        tier_counters["plain_tier"] += 1
+        markdown = _WHITESPACE_REGEX.sub(' ', _NEWLINE_WHITESPACE_REGEX.sub('\n', content))
+        markdown = markdown.replace('*', r'\*').replace('_', r'\_').strip()
+    else:
+        root = _parse_light_html(content)
+        if root is None:
+            return None
+        tier_counters["light_tier"] += 1
+        markdown = _render_light(root).strip()
+    return _finish_markdown(markdown, embed_store, {}, math_store, remove_hints)
+
+def _protect_embeds(content: str, embed_store: Dict[str, str]) -> str:
+    """Turn media into Obsidian embeds and hide every embed behind a placeholder."""
+    # --- 3. Process Media (Images, Video, Audio) ---
+    content, _ = extract_and_preserve_media(content)
+
+    # --- 4. Protect Obsidian Embeds from Markdownify ---
+    # This guarantees that webp, jpg, pngs inside clozes or normal text do not get escaped
+    def save_embed(m):
+        ph = f"EMBEDPLACEHOLDER{len(embed_store)}ENDEMBED"
+        embed_store[ph] = m.group(0)
+        return ph
+    return EMBED_REGEX.sub(save_embed, content)
+
+def _finish_markdown(content: str, embed_store: Dict[str, str], table_store: Dict[str, str],
+                     math_store: Dict[str, str], remove_hints: bool) -> str:
+    """Steps shared by every tier once the HTML has become Markdown."""
+    # --- 6. Restore Obsidian Embeds ---
+    if embed_store:
+        content = EMBED_PLACEHOLDER_REGEX.sub(lambda m: embed_store.get(m.group(0), m.group(0)), content)
+
+    # --- 7. Process Clozes (Turn them into Obsidian Highlights) ---
+    def process_cloze(m):
+        text = m.group(2)
+        hint = m.group(3)
+        if remove_hints or not hint:
+            return f"=={text}=="
+        return f"=={text}== (*hint: {hint}*)"
+        
+    content = CLOZE_REGEX.sub(process_cloze, content)
+
+    # Clean up excessive newlines
+    content = re.sub(r'\n{3,}', '\n\n', content)
+    
+    # --- 8. Restore the intact HTML Tables & MathJax in one pass ---
+    # Math inside a table is restored with it; restored text is not scanned again.
+    if not (table_store or math_store):
+        return content
+    restore_math = lambda m: math_store.get(m.group(0), m.group(0))
+    def restore(m):
+        ph = m.group(0)
+        if ph in table_store:
+            return f"\n\n{MATH_PLACEHOLDER_REGEX.sub(restore_math, table_store[ph])}\n\n"
+        return math_store.get(ph, ph)
+    return STORE_PLACEHOLDER_REGEX.sub(restore, content)
+
+def _convert_html_to_markdown(html_content: str, preserve_tables: bool, remove_hints: bool, fast_paths: bool = True) -> str:
+    table_store = {}
+    math_store = {}
+    embed_store = {}
+
+    # --- 1. Protect & Convert MathJax/LaTeX ---
+    content = _protect_math(html_content, math_store)
+
+    if fast_paths and MARKDOWNIFY_AVAILABLE:
+        markdown = _convert_fast(content, math_store, remove_hints)
+        if markdown is not None:
+            return markdown
+    tier_counters["full_tier"] += 1
 
     # --- 2. Extract and Protect HTML Tables (If enabled) ---
     if preserve_tables and BS4_AVAILABLE:
@@ -105,16 +425,7 @@ def convert_html_to_markdown(html_content: str, preserve_tables: bool = True, re
                 table.extract()
         content = str(soup)
 
-    # --- 3. Process Media (Images, Video, Audio) ---
-    content, _ = extract_and_preserve_media(content)
-    
-    # --- 4. Protect Obsidian Embeds from Markdownify ---
-    # This guarantees that webp, jpg, pngs inside clozes or normal text do not get escaped
-    def save_embed(m):
-        ph = f"EMBEDPLACEHOLDER{len(embed_store)}ENDEMBED"
-        embed_store[ph] = m.group(0)
-        return ph
-    content = re.sub(r'!\[\[.*?\]\]', save_embed, content)
+    content = _protect_embeds(content, embed_store)
 
     # --- 5. Markdownify the remaining text ---
     if MARKDOWNIFY_AVAILABLE:
@@ -123,35 +434,15 @@ def convert_html_to_markdown(html_content: str, preserve_tables: bool = True, re
     else:
         content = html.unescape(re.sub(r'<[^>]+>', '', re.sub(r'<br\s*/?>', '\n', content))).strip()
 
-    # --- 6. Restore Obsidian Embeds ---
-    for ph, embed in embed_store.items():
-        content = content.replace(ph, embed)
+    return _finish_markdown(content, embed_store, table_store, math_store, remove_hints)
 
-    # --- 7. Process Clozes (Turn them into Obsidian Highlights) ---
-    def process_cloze(m):
-        text = m.group(2)
-        hint = m.group(3)
-        if remove_hints or not hint:
-            return f"=={text}=="
-        return f"=={text}== (*hint: {hint}*)"
-        
-    content = CLOZE_REGEX.sub(process_cloze, content)
+def combine_fields_to_markdown(fields: Dict[str, str], note_type_name: str, note_id: int, preserve_extra: bool = True,
+                               card_id: Optional[int] = None) -> str:
+    """Combines relevant fields into a single Markdown string.
 
-    # Clean up excessive newlines
-    content = re.sub(r'\n{3,}', '\n\n', content)
-    
-    # --- 8. Restore the intact HTML Tables & MathJax ---
-    if preserve_tables:
-        for ph, table_html in table_store.items():
-            content = content.replace(ph, f"\n\n{table_html}\n\n")
-            
-    for ph, math_str in math_store.items():
-        content = content.replace(ph, math_str)
-            
-    return content
-
-def combine_fields_to_markdown(fields: Dict[str, str], note_type_name: str, note_id: int, preserve_extra: bool = True) -> str:
-    """Combines relevant fields into a single Markdown string."""
+    *card_id* (the note's first card) is used for the Anki reference link;
+    falls back to the note id when not given.
+    """
     note_type_lower = note_type_name.lower()
     body_parts = []
 
@@ -204,21 +495,178 @@ def combine_fields_to_markdown(fields: Dict[str, str], note_type_name: str, note
         if fields.get("Extra") and preserve_extra:
             body_parts.append(f"## Extra\n{convert_html_to_markdown(fields['Extra'])}")
 
-    # Fetch Card ID (CID) dynamically from Anki Database
-    card_id = note_id
-    if mw and mw.col:
-        try:
-            # Get the first CID associated with this NID
-            fetched_cid = mw.col.db.scalar("SELECT id FROM cards WHERE nid = ? LIMIT 1", note_id)
-            if fetched_cid:
-                card_id = fetched_cid
-        except Exception:
-            pass
-
+    card_id = card_id or note_id
     anki_link = f"anki://x-callback-url/search?query=cid:{card_id}"
     footer = f"\n\n---\n*Anki Reference: [Card {card_id}]({anki_link})*"
     
     if not MARKDOWNIFY_AVAILABLE:
         footer += "\n*Note: HTML conversion limited due to missing 'markdownify' library.*"
 
-    return "\n\n".join(body_parts).strip() + footer
\ No newline at end of file
+    return "\n\n".join(body_parts).strip() + footer
+
+def convert_note_bodies(jobs: List[Tuple[Dict[str, str], str, int, Optional[int]]],
+                        cache_path: Optional[str] = None) -> Tuple[List[str], Dict[str, int], List[float]]:
+    """Render a chunk of (fields, note_type_name, note_id, card_id) jobs; used by conversion workers.
+
+    Returns the bodies, the conversion counters (cache and tiers) accumulated
+    while rendering them and each note's conversion time in seconds.
+    """
+    cache = configure_conversion_cache(cache_path)
+    before = conversion_stats()
+    bodies, times = [], []
+    for fields, note_type_name, note_id, card_id in jobs:
+        start = time.perf_counter()
+        bodies.append(combine_fields_to_markdown(fields, note_type_name, note_id, card_id=card_id))
+        times.append(time.perf_counter() - start)
+    cache.flush()
+    after = conversion_stats()
+    return bodies, {k: after[k] - before[k] for k in CONVERSION_COUNTERS}, times
+
+# --- Conversion cache ---
+
+CONVERTER_VERSION = 1            # bump whenever convert_html_to_markdown's output changes
+DEFAULT_CACHE_SIZE = 20000       # in-memory entries
+DISK_CACHE_MAX_ENTRIES = 200000  # oldest-used rows beyond this are pruned on flush
+CACHE_COUNTERS = ("memory_hits", "disk_hits", "misses")
+CONVERSION_COUNTERS = CACHE_COUNTERS + TIER_COUNTERS
+
+def _library_version(module_name: str) -> str:
+    try:
+        from importlib.metadata import version
+        return version(module_name)
+    except Exception:
+        return "?"
+
+# Anything that changes the output for a given input must be part of the key.
+_CACHE_STAMP = "|".join((
+    str(CONVERTER_VERSION),
+    _library_version("beautifulsoup4") if BS4_AVAILABLE else "-",
+    _library_version("markdownify") if MARKDOWNIFY_AVAILABLE else "-",
+))
+
+class ConversionCache:
+    """Converted Markdown keyed by sha1(stamp, options, field HTML).
+
+    Lookups go to an in-memory LRU first, then to the SQLite file at
+    *disk_path* (if any). New entries and disk hits are written back by
+    flush(), so each worker process touches the database once per chunk.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE, disk_path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.disk_path = disk_path
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._pending: Dict[str, str] = {}
+        self._touched: List[str] = []
+        self.counters = dict.fromkeys(CACHE_COUNTERS, 0)
+        self._conn = self._open_disk(disk_path) if disk_path else None
+
+    @staticmethod
+    def _open_disk(path: str) -> Optional[sqlite3.Connection]:
+        for attempt in (1, 2):
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS conversions (key TEXT PRIMARY KEY, markdown TEXT NOT NULL, used INTEGER NOT NULL)")
+                return conn
+            except sqlite3.DatabaseError as e:
+                log.warning("Conversion cache %s is unreadable (%s); %s.", path, e, "rebuilding it" if attempt == 1 else "using memory only")
+                for suffix in ("", "-journal", "-wal", "-shm"):
+                    try: os.remove(path + suffix)
+                    except OSError: pass
+            except OSError as e:
+                log.warning("Conversion cache %s cannot be opened (%s); using memory only.", path, e)
+                break
+        return None
+
+    @staticmethod
+    def key(html_content: str, preserve_tables: bool, remove_hints: bool) -> str:
+        h = hashlib.sha1(f"{_CACHE_STAMP}|{int(preserve_tables)}{int(remove_hints)}|".encode("utf-8"))
+        h.update(html_content.encode("utf-8", "surrogatepass"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        markdown = self._memory.get(key)
+        if markdown is not None:
+            self._memory.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return markdown
+        if self._conn is not None:
+            try:
+                row = self._conn.execute("SELECT markdown FROM conversions WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                self.counters["disk_hits"] += 1
+                self._touched.append(key)
+                self._remember(key, row[0])
+                return row[0]
+        self.counters["misses"] += 1
+        return None
+
+    def put(self, key: str, markdown: str):
+        self._remember(key, markdown)
+        if self._conn is not None:
+            self._pending[key] = markdown
+
+    def _remember(self, key: str, markdown: str):
+        self._memory[key] = markdown
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters, memory_entries=len(self._memory))
+
+    def reset_counters(self):
+        self.counters = dict.fromkeys(CACHE_COUNTERS, 0)
+
+    def flush(self):
+        """Write new entries and refresh last-used stamps of disk hits; prune the oldest rows."""
+        if self._conn is None or not (self._pending or self._touched):
+            return
+        now = int(time.time())
+        try:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO conversions VALUES (?, ?, ?)",
+                                       ((k, v, now) for k, v in self._pending.items()))
+                self._conn.executemany("UPDATE conversions SET used = ? WHERE key = ?", ((now, k) for k in self._touched))
+                if self._pending and self._conn.execute("SELECT COUNT(*) FROM conversions").fetchone()[0] > DISK_CACHE_MAX_ENTRIES:
+                    self._conn.execute("DELETE FROM conversions WHERE key NOT IN "
+                                       "(SELECT key FROM conversions ORDER BY used DESC LIMIT ?)", (DISK_CACHE_MAX_ENTRIES,))
+        except sqlite3.Error as e:
+            log.warning("Could not update conversion cache %s: %s", self.disk_path, e)
+        self._pending.clear(); self._touched.clear()
+
+    def clear(self):
+        self._memory.clear(); self._pending.clear(); self._touched.clear()
+        if self._conn is not None:
+            with self._conn: self._conn.execute("DELETE FROM conversions")
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close(); self._conn = None
+
+_conversion_cache: Optional[ConversionCache] = ConversionCache()
+
+def configure_conversion_cache(disk_path: Optional[str] = None, maxsize: int = DEFAULT_CACHE_SIZE) -> ConversionCache:
+    """Return the process-wide cache, re-opening it if the disk tier or size changed.
+
+    The in-memory tier survives between syncs as long as the settings stay the same.
+    """
+    global _conversion_cache
+    cache = _conversion_cache
+    if cache is not None and cache.disk_path == disk_path and cache.maxsize == maxsize:
+        return cache
+    if cache is not None:
+        cache.close()
+    _conversion_cache = ConversionCache(maxsize, disk_path)
+    return _conversion_cache
+
+def conversion_stats() -> Dict[str, int]:
+    """Cache counters of the process-wide cache plus how often each conversion tier ran."""
+    stats = _conversion_cache.stats() if _conversion_cache else dict.fromkeys(CACHE_COUNTERS, 0)
+    stats.update(tier_counters)
+    return stats
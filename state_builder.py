@@ -7,14 +7,16 @@ Excludes user-selected decks and intelligently names files based on complex Note
 
 import os
 import re
+import stat
+import zlib
 import hashlib
 import html
-from typing import Dict, List, Any, Set, Optional
+from typing import Dict, List, Any, Set, Optional, Tuple, Iterable
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from anki.collection import Collection
 from anki.notes import Note
-from aqt import mw
 
 # Dependency Check
 try:
@@ -24,7 +26,12 @@ except ImportError:
     yaml = None
     YAML_AVAILABLE = False
 
-from .config import get_excluded_decks, get_filename_suffix
+from .config import SyncSettings, load_settings, get_filename_suffix, DEFAULT_SCAN_WORKERS
+from .sync_manifest import SyncManifest
+from .sync_progress import progress
+from .sync_log import log, errors
+from .sync_stats import stats
+from .html_converter import scan_media, is_local_media
 
 # Constants
 INVALID_FILENAME_CHARS = r'[<>:"/\\|?*\x00-\x1f]|(?<!^)\.$|\s$'
@@ -43,31 +50,15 @@ def sanitize_filename(name: str) -> str:
     return sanitized or "anki_note"
 
 def get_note_media(note: Note) -> Set[str]:
+    """Files referenced by the note's fields, found with the converter's own media scanner."""
     media = set()
-    img_regex = re.compile(r'<img.*?src=["\'](.*?)["\']', re.IGNORECASE)
-    audio_regex = re.compile(r'\[sound:([^\]]+)\]', re.IGNORECASE)
-    video_regex = re.compile(r'<video.*?src=["\'](.*?)["\']', re.IGNORECASE | re.DOTALL)
-    paste_img_regex = re.compile(r'(paste-[a-f0-9]+\.(?:jpg|jpeg|png|gif|webp|svg))', re.IGNORECASE)
-    general_media_regex = re.compile(r'src=["\'](.*?\.(?:jpg|jpeg|png|gif|webp|svg|mp3|mp4|wav|ogg|webm))["\']', re.IGNORECASE)
-    
     for field_value in note.values():
-        if field_value:
-            for match in img_regex.finditer(field_value):
-                src = match.group(1)
-                if src and not src.startswith(('http:', 'https:', 'data:')): media.add(src)
-            for match in audio_regex.finditer(field_value):
-                media.add(match.group(1))
-            for match in video_regex.finditer(field_value):
-                src = match.group(1)
-                if src and not src.startswith(('http:', 'https:', 'data:')): media.add(src)
-            for match in paste_img_regex.finditer(field_value):
-                media.add(match.group(1))
-            for match in general_media_regex.finditer(field_value):
-                src = match.group(1)
-                if src and not src.startswith(('http:', 'https:', 'data:')): media.add(src)
+        for ref in scan_media(field_value):
+            if ref.kind in ("audio", "paste") or (ref.src and is_local_media(ref.src)):
+                media.add(ref.src)
     return media
 
-def determine_note_filename(note: Note, note_type: Dict) -> str:
+def determine_note_filename(note: Note, note_type: Dict, suffix_cfg: Optional[str] = None) -> str:
     filename_base = ""
     note_type_name = note_type.get('name', '').lower()
 
@@ -118,7 +109,8 @@ def determine_note_filename(note: Note, note_type: Dict) -> str:
     sanitized_base = sanitize_filename(cleaned_text)
 
     # Filename suffix strategy
-    suffix_cfg = get_filename_suffix()
+    if suffix_cfg is None:
+        suffix_cfg = get_filename_suffix()
     if suffix_cfg == "none":
         return f"{sanitized_base}.md"
     elif suffix_cfg and suffix_cfg != "nid":
@@ -137,69 +129,37 @@ def determine_note_filename(note: Note, note_type: Dict) -> str:
     # "nid" or fallback
     return f"{sanitized_base}_{note.id}.md"
 
-def build_anki_state(col: Collection) -> Dict[str, Any]:
-    anki_state = {"_root_": {"anki_deck_id": None, "anki_deck_name": "Anki Collection", "notes": {}, "subdeck_paths": set(), "moc_filename": ROOT_MOC_FILENAME}}
-    deck_map = {}
-    deck_parents = {}
-    
-    excluded_decks = get_excluded_decks()
-    all_decks = col.decks.all_names_and_ids()
+# Notes fetched per keyset page in bulk extraction mode.
+BULK_CHUNK_SIZE = 2000
 
-    def is_excluded(deck_name: str) -> bool:
-        for ex in excluded_decks:
-            # Exact match: exclude only this deck (children remain exportable).
-            if deck_name == ex:
-                return True
-            # Explicit subtree wildcard "Parent::" excludes the whole subtree,
-            # but a bare "Parent" no longer blocks its subdecks.
-            if ex.endswith("::") and deck_name.startswith(ex):
-                return True
-        return False
-
-    for deck in all_decks:
-        # Always register the deck path so notes can resolve their location,
-        # even for excluded decks (their non-excluded children still need it).
-        parts = deck.name.split("::")
-        current_path_parts = []
-        parent_id = None
-        excluded = is_excluded(deck.name)
-        
-        for i, part_name in enumerate(parts):
-            sanitized_part_name = sanitize_filename(part_name)
-            current_path_parts.append(sanitized_part_name)
-            sanitized_path = "/".join(current_path_parts)
-            
-            partial_name = "::".join(parts[:i+1])
-            current_deck_id = next((d.id for d in all_decks if d.name == partial_name), None)
-            
-            if current_deck_id is not None:
-                deck_map[current_deck_id] = sanitized_path
-                if parent_id is not None: 
-                    deck_parents[current_deck_id] = parent_id
-                # Only exportable (non-excluded) decks become folders in Obsidian.
-                if not excluded and sanitized_path not in anki_state:
-                     anki_state[sanitized_path] = {
-                        "anki_deck_id": current_deck_id, "anki_deck_name": part_name,
-                        "sanitized_deck_name": sanitized_part_name, "notes": {},
-                        "subdeck_paths": set(), "moc_filename": f"_{sanitized_part_name}_index.md"}
-                # Link subdecks only between non-excluded decks. If the parent is
-                # excluded (not in anki_state), promote the deck to the root level
-                # so it stays reachable in the MOC hierarchy.
-                if not excluded:
-                    parent_path = deck_map.get(parent_id) if parent_id is not None else None
-                    if parent_path and parent_path in anki_state:
-                        anki_state[parent_path]["subdeck_paths"].add(sanitized_path)
-                    else:
-                        anki_state["_root_"]["subdeck_paths"].add(sanitized_path)
-                parent_id = current_deck_id
-
-    note_ids = col.find_notes("")
-    processed_note_ids = set()
-    total_notes = len(note_ids)
-    
-    mw.progress.start(label="Building Anki State...", max=total_notes, immediate=True)
+class _NoteRow:
+    """Read-only stand-in for anki.notes.Note built straight from a `notes` table row.
 
-    for i, nid in enumerate(note_ids):
+    Exposes only what determine_note_filename / get_note_media need, so the bulk
+    extraction path can reuse them without a backend round-trip per note.
+    """
+    __slots__ = ("id", "mod", "tags", "_fields", "_ords")
+
+    def __init__(self, nid: int, mod: int, tags: str, flds: str, ords: Dict[str, int]):
+        self.id = nid
+        self.mod = mod
+        self.tags = tags.split()
+        self._fields = flds.split("\x1f")
+        if len(self._fields) < len(ords):
+            self._fields.extend([""] * (len(ords) - len(self._fields)))
+        self._ords = ords
+
+    def __getitem__(self, key: str) -> str:
+        return self._fields[self._ords[key]]
+
+    def values(self) -> List[str]:
+        return list(self._fields)
+
+def _iter_notes_per_note(col: Collection):
+    """Legacy extraction: four backend round-trips per note."""
+    processed_note_ids = set()
+    for i, nid in enumerate(col.find_notes("")):
+        if i % 100 == 0: progress.check_cancel(); progress.update(value=i)
         if nid in processed_note_ids: continue
         try:
             note = col.get_note(nid)
@@ -207,82 +167,721 @@ def build_anki_state(col: Collection) -> Dict[str, Any]:
             if not note_type: continue
             card_ids = note.card_ids()
             if not card_ids: continue
-            
             card0 = col.get_card(card_ids[0])
-            deck_id = card0.did
-            deck_path = deck_map.get(deck_id)
-
-            # Only process if deck hasn't been excluded
-            if deck_path and deck_path in anki_state:
-                target_filename = determine_note_filename(note, note_type)
-                relevant_fields = {f['name']: note[f['name']] for f in note_type['flds']}
-                
-                anki_state[deck_path]["notes"][nid] = {
-                    "note_id": nid, "card_id": card_ids[0], "note_mod_time": note.mod,
-                    "note_type_name": note_type['name'], "relevant_fields": relevant_fields,
-                    "target_filename": target_filename, "required_images": get_note_media(note),
-                    "card_ids": card_ids,
-                    # Card scheduling metadata — read-only for now, will support write-back
-                    "tags": list(note.tags),
-                    "card_reps": card0.reps,
-                    "card_lapses": card0.lapses,
-                    "card_ivl": card0.ivl,
-                    "card_due": card0.due,
-                    "card_ease": card0.factor,
-                    "card_queue": card0.queue,
-                }
-                processed_note_ids.add(nid)
+            sched = (card0.reps, card0.lapses, card0.ivl, card0.due, card0.factor, card0.queue)
         except Exception:
-            pass
-            
-        if i % 100 == 0: mw.progress.update(value=i)
+            continue
+        processed_note_ids.add(nid)
+        yield note, note_type, card_ids, card0.did, sched
+
+# Upper bound for `IN (...)` lists; SQLite's default variable limit is 999.
+_SQL_IN_CHUNK = 500
+
+def _iter_note_pages(col: Collection, chunk_size: int, nids: Optional[List[int]]):
+    """Yield (note rows, card rows) per page: keyset pages over all notes, or *nids* in IN-chunks."""
+    note_cols = "SELECT id, mid, mod, tags, flds FROM notes"
+    card_cols = "SELECT nid, id, did, reps, lapses, ivl, due, factor, queue FROM cards"
+    if nids is None:
+        last_nid = -1
+        while True:
+            rows = col.db.all(f"{note_cols} WHERE id > ? ORDER BY id LIMIT ?", last_nid, chunk_size)
+            if not rows: return
+            first_nid, last_nid = rows[0][0], rows[-1][0]
+            yield rows, col.db.all(f"{card_cols} WHERE nid BETWEEN ? AND ? ORDER BY nid, ord, id", first_nid, last_nid)
+    else:
+        for i in range(0, len(nids), _SQL_IN_CHUNK):
+            chunk = nids[i:i + _SQL_IN_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            yield (col.db.all(f"{note_cols} WHERE id IN ({marks}) ORDER BY id", *chunk),
+                   col.db.all(f"{card_cols} WHERE nid IN ({marks}) ORDER BY nid, ord, id", *chunk))
+
+def _iter_notes_bulk(col: Collection, chunk_size: int = BULK_CHUNK_SIZE, nids: Optional[List[int]] = None):
+    """Bulk extraction: paged set queries over the notes/cards tables.
+
+    Each page costs two queries regardless of its size; note types are fetched
+    once per model id. With *nids* only those notes are read.
+    """
+    note_types: Dict[int, Optional[Tuple[Dict, Dict[str, int]]]] = {}
+    done = 0
+    for rows, card_rows in _iter_note_pages(col, chunk_size, nids):
+        # Cards come back ordered by ord, so the first one seen is card_ids[0].
+        cards_by_nid: Dict[int, Tuple[List[int], int, Tuple]] = {}
+        for nid, cid, did, reps, lapses, ivl, due, factor, queue in card_rows:
+            entry = cards_by_nid.get(nid)
+            if entry is None: cards_by_nid[nid] = ([cid], did, (reps, lapses, ivl, due, factor, queue))
+            else: entry[0].append(cid)
+
+        for nid, mid, mod, tags, flds in rows:
+            cards = cards_by_nid.get(nid)
+            if not cards: continue
+            if mid not in note_types:
+                note_type = col.models.get(mid)
+                note_types[mid] = (note_type, {f['name']: f.get('ord', idx) for idx, f in enumerate(note_type['flds'])}) if note_type else None
+            cached = note_types[mid]
+            if not cached: continue
+            note_type, ords = cached
+            card_ids, did, sched = cards
+            yield _NoteRow(nid, mod, tags, flds, ords), note_type, card_ids, did, sched
+
+        done += len(rows)
+        progress.check_cancel(); progress.update(value=done)
+
+class _ExclusionNode:
+    __slots__ = ("children", "exact", "subtree")
+
+    def __init__(self):
+        self.children: Dict[str, "_ExclusionNode"] = {}
+        self.exact = False
+        self.subtree = False
+
+class ExclusionTrie:
+    """Prefix trie over `::`-separated deck names for the exclusion rules.
+
+    "Parent" excludes exactly that deck (its children remain exportable);
+    "Parent::" excludes every deck below Parent. Lookup is O(depth) instead of
+    a scan over the whole exclusion list.
+    """
+
+    def __init__(self, excluded_decks: Iterable[str]):
+        self._root = _ExclusionNode()
+        for ex in excluded_decks:
+            if not ex: continue
+            subtree = ex.endswith("::")
+            node = self._root
+            for part in (ex[:-2] if subtree else ex).split("::"):
+                node = node.children.setdefault(part, _ExclusionNode())
+            if subtree: node.subtree = True
+            else: node.exact = True
+
+    def is_excluded(self, deck_name: str) -> bool:
+        parts = deck_name.split("::")
+        node = self._root
+        for i, part in enumerate(parts):
+            node = node.children.get(part)
+            if node is None: return False
+            if node.subtree and i < len(parts) - 1: return True
+        return node.exact
+
+class DeckTree:
+    """Index over the collection's deck hierarchy, built once per sync.
+
+    Holds name->id and id->sanitized-path maps for every deck (excluded ones
+    too, so notes of their exportable children still resolve) and, in
+    `exported`, the folder entries that become part of the vault keyed by
+    sanitized path, parents before children.
+    """
+
+    def __init__(self, decks: Iterable[Tuple[str, int]], excluded_decks: Iterable[str] = ()):
+        self.exclusions = ExclusionTrie(excluded_decks)
+        self.name_to_id: Dict[str, int] = {}
+        self.id_to_path: Dict[int, str] = {}
+        self.exported: Dict[str, Dict[str, Any]] = {}
+        self.root_paths: Set[str] = set()
+        self._sanitized: Dict[str, str] = {}
+        self._name_paths: Dict[str, str] = {}
+
+        for name, did in decks:
+            self.name_to_id.setdefault(name, did)
+        # Sorting the split names puts every parent before its children.
+        for name in sorted(self.name_to_id, key=lambda n: n.split("::")):
+            did = self.name_to_id[name]
+            path = self._path_for_name(name)
+            self.id_to_path[did] = path
+            # Only exportable (non-excluded) decks become folders in Obsidian.
+            if self.exclusions.is_excluded(name) or path in self.exported: continue
+            part_name = name.rsplit("::", 1)[-1]
+            sanitized_part_name = self.sanitize(part_name)
+            # Link subdecks only between exported decks. If the nearest existing
+            # parent is excluded, promote the deck to the root level so it
+            # stays reachable in the MOC hierarchy.
+            parent_path = None
+            parent_id = self._parent_id(name)
+            if parent_id is not None and self.id_to_path[parent_id] in self.exported:
+                parent_path = self.id_to_path[parent_id]
+                self.exported[parent_path]["subdeck_paths"].add(path)
+            else:
+                self.root_paths.add(path)
+            self.exported[path] = {
+                "anki_deck_id": did, "anki_deck_name": part_name,
+                "sanitized_deck_name": sanitized_part_name, "parent_path": parent_path,
+                "subdeck_paths": set(), "moc_filename": f"_{sanitized_part_name}_index.md"}
+
+    @classmethod
+    def from_collection(cls, col: Collection, excluded_decks: Iterable[str]) -> "DeckTree":
+        return cls(((d.name, d.id) for d in col.decks.all_names_and_ids()), excluded_decks)
+
+    def sanitize(self, name: str) -> str:
+        """Memoized sanitize_filename for deck name parts."""
+        cached = self._sanitized.get(name)
+        if cached is None:
+            cached = self._sanitized[name] = sanitize_filename(name)
+        return cached
+
+    def _path_for_name(self, name: str) -> str:
+        path = self._name_paths.get(name)
+        if path is None:
+            parent, sep, part = name.rpartition("::")
+            path = f"{self._path_for_name(parent)}/{self.sanitize(part)}" if sep else self.sanitize(part)
+            self._name_paths[name] = path
+        return path
+
+    def _parent_id(self, name: str) -> Optional[int]:
+        parent, sep, _ = name.rpartition("::")
+        while sep:
+            if parent in self.name_to_id: return self.name_to_id[parent]
+            parent, sep, _ = parent.rpartition("::")
+        return None
+
+    def is_excluded(self, deck_name: str) -> bool:
+        return self.exclusions.is_excluded(deck_name)
+
+    def path_of(self, deck_id: int) -> Optional[str]:
+        """Sanitized folder path of *deck_id*, or None if it is unknown or excluded."""
+        path = self.id_to_path.get(deck_id)
+        return path if path in self.exported else None
+
+    def moc_rel_path(self, deck_path: str) -> str:
+        return f"{deck_path}/{self.exported[deck_path]['moc_filename']}"
+
+    def deck_path_for_moc(self, moc_rel_path: str) -> Optional[str]:
+        deck_path = moc_rel_path.rpartition("/")[0]
+        return deck_path if deck_path in self.exported else None
+
+# ═══════════════════ Paginated deck MOCs ═══════════════════
+# A deck with more than mocPageSize notes gets a small index (its usual MOC
+# file) linking to pages "_<Deck>_index_001.md", ... A note's page depends
+# only on its nid and the page count, which is a power of two, so one note
+# changing rewrites one page; only crossing a power of two re-deals the deck.
+
+MOC_PAGE_FILENAME = re.compile(r'_.*_index_(\d{3,})\.md')
+
+def moc_page_count(note_count: int, page_size: int) -> int:
+    """Number of pages for a deck MOC, or 0 if the deck keeps a single MOC file."""
+    if page_size <= 0 or note_count <= page_size: return 0
+    pages = 2
+    while pages * page_size < note_count: pages *= 2
+    return pages
+
+def moc_page_of(note_id: int, page_count: int) -> int:
+    return zlib.crc32(note_id.to_bytes(8, "little", signed=True)) % page_count
+
+def moc_page_filename(moc_filename: str, page: int) -> str:
+    return f"{moc_filename[:-3]}_{page + 1:03d}.md"
+
+def _note_record(note: Note, note_type: Dict, card_ids: List[int], sched: Tuple, suffix_cfg: str) -> Dict[str, Any]:
+    """The per-note entry stored under anki_state[deck_path]["notes"][nid]."""
+    reps, lapses, ivl, due, factor, queue = sched
+    return {
+        "note_id": note.id, "card_id": card_ids[0], "note_mod_time": note.mod,
+        "note_type_name": note_type['name'],
+        "relevant_fields": {f['name']: note[f['name']] for f in note_type['flds']},
+        "target_filename": determine_note_filename(note, note_type, suffix_cfg),
+        "required_images": get_note_media(note),
+        "card_ids": card_ids,
+        # Card scheduling metadata — read-only for now, will support write-back
+        "tags": list(note.tags),
+        "card_reps": reps,
+        "card_lapses": lapses,
+        "card_ivl": ivl,
+        "card_due": due,
+        "card_ease": factor,
+        "card_queue": queue,
+    }
+
+def _iter_note_entries(note_iter, deck_tree: DeckTree, suffix_cfg: str):
+    """Yield (nid, deck_id, record, card count); record is None for notes in excluded decks
+    and for notes whose record could not be built (recorded in `errors`)."""
+    for note, note_type, card_ids, deck_id, sched in note_iter:
+        record = None
+        # Only build a record if the deck hasn't been excluded
+        if deck_tree.path_of(deck_id):
+            try: record = _note_record(note, note_type, card_ids, sched, suffix_cfg)
+            except Exception as e: errors.record("Reading notes", note.id, e)
+        yield note.id, deck_id, record, len(card_ids)
+
+# ═══════════════════ Incremental extraction ═══════════════════
+
+class AnkiStateCache:
+    """Note entries kept in memory between syncs of one collection/profile.
+
+    `entries` maps nid -> (first card's deck id, record or None if excluded or
+    unreadable, card count). Every note with cards has an entry, so the card
+    counts add up to the cards table. The watermarks are the highest notes.mod / cards.mod seen at
+    the last extraction; anything modified at or after them is re-read.
+    """
+
+    def __init__(self, signature: Tuple):
+        self.signature = signature
+        self.entries: Dict[int, Tuple[int, Optional[Dict[str, Any]], int]] = {}
+        self.note_watermark: Optional[int] = None
+        self.card_watermark: Optional[int] = None
+        self.deck_signature: Optional[Tuple] = None
+        self.deck_tree: Optional[DeckTree] = None
+
+_state_caches: Dict[Tuple, AnkiStateCache] = {}
+
+def clear_anki_state_cache():
+    """Forget all cached note entries; the next incremental sync does a full extraction."""
+    _state_caches.clear()
+
+def _notetypes_signature(col: Collection) -> Tuple:
+    # Renaming/reordering fields changes every record of a note type without touching notes.mod.
+    return tuple(sorted((m.get('id'), m.get('mod', 0)) for m in col.models.all()))
+
+def _decks_signature(col: Collection) -> Optional[Tuple]:
+    """Fingerprint of the decks table, so renames and moves trigger a DeckTree rebuild."""
+    try:
+        return tuple(col.db.first("SELECT count(), max(mtime_secs), total(id) FROM decks"))
+    except Exception:
+        return None  # Pre-2.1.28 schema without a decks table: always rebuild.
+
+def _incremental_entries(col: Collection, settings: SyncSettings, deck_tree: Optional[DeckTree]):
+    """Bring the cached entries for *col* up to date; return (deck_tree, entries)."""
+    cache_key = (getattr(col, "path", None), settings.profile)
+    signature = (settings.filename_suffix, _notetypes_signature(col))
+    cache = _state_caches.get(cache_key)
+    if cache is None or cache.signature != signature:
+        cache = _state_caches[cache_key] = AnkiStateCache(signature)
+
+    deck_signature = (_decks_signature(col), settings.excluded_decks)
+    tree_changed = deck_tree is not None or deck_signature[0] is None or cache.deck_signature != deck_signature
+    if deck_tree is None:
+        deck_tree = DeckTree.from_collection(col, settings.excluded_decks) if tree_changed else cache.deck_tree
 
-    mw.progress.finish()
+    # Read the watermarks before the data: edits racing with this sync are re-read next time.
+    note_watermark = col.db.scalar("SELECT max(mod) FROM notes")
+    card_watermark = col.db.scalar("SELECT max(mod) FROM cards")
+    current_nids = set(col.db.list("SELECT id FROM notes"))
+    entries = cache.entries
+
+    if cache.note_watermark is None:
+        to_fetch = current_nids
+        entries.clear()
+    else:
+        to_fetch = set(col.db.list("SELECT id FROM notes WHERE mod >= ?", cache.note_watermark))
+        to_fetch.update(col.db.list("SELECT nid FROM cards WHERE mod >= ?", cache.card_watermark))
+        for nid in entries.keys() - current_nids: del entries[nid]
+        to_fetch |= current_nids - entries.keys()
+        # Notes skipped while their deck was excluded need a record now; unreadable ones are retried.
+        to_fetch.update(nid for nid, (did, record, _) in entries.items() if record is None and deck_tree.path_of(did))
+        to_fetch &= current_nids
+
+    progress.start(label="Building Anki State...", max=len(to_fetch), immediate=True)
+    fetched = set()
+    note_iter = _iter_notes_bulk(col, nids=sorted(to_fetch))
+    for nid, deck_id, record, n_cards in _iter_note_entries(note_iter, deck_tree, settings.filename_suffix):
+        entries[nid] = (deck_id, record, n_cards)
+        fetched.add(nid)
+    missing = sorted(to_fetch - fetched)
+    for i in range(0, len(missing), _SQL_IN_CHUNK):
+        chunk = missing[i:i + _SQL_IN_CHUNK]
+        for nid, did, n_cards in col.db.all(
+                f"SELECT nid, did, count() FROM cards WHERE nid IN ({','.join('?' * len(chunk))}) GROUP BY nid", *chunk):
+            entries[nid] = (did, None, n_cards)  # Cards but no note type: keep its cards counted.
+            fetched.add(nid); errors.record("Reading notes", nid, LookupError("note type not found"))
+    for nid in to_fetch - fetched:
+        entries.pop(nid, None)  # Lost its cards.
+    progress.finish()
+    stats.add({"notes_fetched": len(to_fetch), "notes_reused": len(entries) - len(fetched)})
+
+    # Card deletions (e.g. Empty Cards) touch neither notes.mod nor cards.mod.
+    if cache.note_watermark is not None and sum(n for _, _, n in entries.values()) != col.db.scalar(
+            "SELECT count() FROM cards WHERE nid IN (SELECT id FROM notes)"):
+        cache.note_watermark = None
+        return _incremental_entries(col, settings, deck_tree)
+
+    cache.note_watermark, cache.card_watermark = note_watermark or 0, card_watermark or 0
+    cache.deck_signature, cache.deck_tree = deck_signature, deck_tree
+    return deck_tree, entries
+
+def build_anki_state(col: Collection, bulk: bool = True, deck_tree: Optional[DeckTree] = None,
+                     settings: Optional[SyncSettings] = None, incremental: Optional[bool] = None) -> Dict[str, Any]:
+    """Build the deck-path -> notes mapping for the whole collection.
+
+    With *bulk* (the default) notes, first cards and note types are read with
+    set-based SQL over `col.db`; otherwise the per-note Note/Card API is used.
+    With *incremental* (default: the profile's incrementalExtraction setting,
+    bulk mode only) records from the previous sync are reused and only notes
+    modified since then are re-read. All modes produce the same `anki_state`
+    shape. The DeckTree used is kept in `anki_state["_root_"]["deck_tree"]`
+    for the diff and MOC phases, and an nid -> record index in
+    `anki_state["_root_"]["note_index"]`.
+    """
+    if settings is None:
+        settings = load_settings()
+    if incremental is None:
+        incremental = settings.incremental_extraction
+    incremental = incremental and bulk
+
+    if incremental:
+        deck_tree, entries = _incremental_entries(col, settings, deck_tree)
+        note_entries = ((nid, *entries[nid]) for nid in sorted(entries))
+    else:
+        if deck_tree is None:
+            deck_tree = DeckTree.from_collection(col, settings.excluded_decks)
+        total_notes = col.db.scalar("SELECT count() FROM notes") or 0
+        stats.count("notes_fetched", total_notes)
+        progress.start(label="Building Anki State...", max=total_notes, immediate=True)
+        note_iter = _iter_notes_bulk(col) if bulk else _iter_notes_per_note(col)
+        note_entries = _iter_note_entries(note_iter, deck_tree, settings.filename_suffix)
+
+    anki_state = {"_root_": {"anki_deck_id": None, "anki_deck_name": "Anki Collection", "notes": {},
+                             "subdeck_paths": set(deck_tree.root_paths), "moc_filename": ROOT_MOC_FILENAME,
+                             "deck_tree": deck_tree}}
+    for path, deck in deck_tree.exported.items():
+        anki_state[path] = {
+            "anki_deck_id": deck["anki_deck_id"], "anki_deck_name": deck["anki_deck_name"],
+            "sanitized_deck_name": deck["sanitized_deck_name"], "notes": {},
+            "subdeck_paths": set(deck["subdeck_paths"]), "moc_filename": deck["moc_filename"]}
+
+    note_index = anki_state["_root_"]["note_index"] = {}
+    for nid, deck_id, record, _ in note_entries:
+        deck_path = deck_tree.path_of(deck_id)
+        if deck_path and record is not None:
+            anki_state[deck_path]["notes"][nid] = record
+            note_index[nid] = record
+
+    if not incremental: progress.finish()
     return anki_state
 
+def get_note_index(anki_state: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    """nid -> note record for every exported note (built by build_anki_state, or here for hand-made states)."""
+    root = anki_state["_root_"]
+    if "note_index" not in root:
+        root["note_index"] = {nid: record for path, deck in anki_state.items() if path != "_root_"
+                              for nid, record in deck.get("notes", {}).items()}
+    return root["note_index"]
+
+# Bytes read per step while looking for the closing frontmatter marker.
+FRONTMATTER_READ_CHUNK = 4096
+
+# Keys the add-on writes itself; only these are handled by the fast parser.
+_OWN_FRONTMATTER_KEY = re.compile(r'(anki_[a-z_]+|content_hash):(?: (.*))?')
+_PLAIN_INT = re.compile(r'-?(?:0|[1-9][0-9]*)')
+# Plain (unquoted) scalars without whitespace or YAML indicators (":" and "#"
+# are fine inside, e.g. hierarchical tags like "Geo::Maps").
+_PLAIN_SCALAR = re.compile(r'-?(?![\s\ufeff])[\w.\u0080-\U0010ffff][^\'"\[\]{},&*!|>%@`\s\ufeff]*(?<!:)')
+# Characters YAML rejects or treats as line breaks inside scalars.
+_YAML_NON_PRINTABLE = re.compile('[^\x09\x0A\x0D\x20-\x7E\xA0-\u2027\u202A-\uD7FF\uE000-\uFEFE\uFF00-\uFFFD\U00010000-\U0010ffff]')
+_UNPARSED = object()
+
+def _parse_own_scalar(raw: str):
+    if raw == "[]": return []
+    if len(raw) >= 2 and raw[0] == raw[-1] == "'":
+        inner = raw[1:-1]
+        if "'" in inner.replace("''", ""): return _UNPARSED
+        return inner.replace("''", "'")
+    if not _PLAIN_SCALAR.fullmatch(raw): return _UNPARSED
+    # Let YAML's own implicit resolvers decide whether a plain scalar is a str.
+    for tag, regexp in yaml.resolver.Resolver.yaml_implicit_resolvers.get(raw[0], ()):
+        if regexp.match(raw):
+            return int(raw) if tag.endswith(":int") and _PLAIN_INT.fullmatch(raw) else _UNPARSED
+    return raw
+
+def _parse_own_frontmatter(block: str) -> Optional[Dict[str, Any]]:
+    """Fast parser for the flat frontmatter written by the executor (via yaml.dump).
+
+    Returns None whenever the block contains anything outside that fixed schema,
+    so the caller can fall back to yaml.safe_load.
+    """
+    if not YAML_AVAILABLE or _YAML_NON_PRINTABLE.search(block): return None
+    result: Dict[str, Any] = {}
+    list_key = None
+    for line in block.split("\n"):
+        line = line.rstrip("\r")
+        if not line: continue
+        if line.startswith("- "):
+            if list_key is None: return None
+            value = _parse_own_scalar(line[2:])
+            if value is _UNPARSED: return None
+            if result[list_key] is None: result[list_key] = []
+            result[list_key].append(value)
+            continue
+        m = _OWN_FRONTMATTER_KEY.fullmatch(line)
+        if not m or m.group(1) in result: return None
+        key, raw = m.groups()
+        if raw is None:
+            # "key:" alone is null unless a block sequence follows.
+            result[key] = None; list_key = key
+            continue
+        value = _parse_own_scalar(raw)
+        if value is _UNPARSED: return None
+        result[key] = value; list_key = None
+    return result or None
+
+def parse_frontmatter_block(block: str) -> Optional[Dict[str, Any]]:
+    """Parse the text between the frontmatter markers, fast path first."""
+    block = block.strip()
+    parsed = _parse_own_frontmatter(block)
+    if parsed is not None: return parsed
+    if not YAML_AVAILABLE: return None
+    try:
+        return yaml.safe_load(block)
+    except yaml.YAMLError:
+        return None
+
+def read_frontmatter_block(path) -> Optional[str]:
+    """Return the raw frontmatter of the file at *path*, reading only up to the closing '---'."""
+    with open(path, 'rb') as f:
+        buf = bytearray(f.read(FRONTMATTER_READ_CHUNK))
+        stats.count("files_opened")
+        if not buf.startswith(b'---'): stats.count("bytes_read", len(buf)); return None
+        search_from = 3
+        while True:
+            end = buf.find(b'---', search_from)
+            if end != -1: stats.count("bytes_read", len(buf)); return buf[3:end].decode('utf-8')
+            chunk = f.read(FRONTMATTER_READ_CHUNK)
+            if not chunk: stats.count("bytes_read", len(buf)); return None
+            # Keep a 2-byte overlap so a marker split across reads is still found.
+            search_from = max(3, len(buf) - 2)
+            buf += chunk
+
+def read_note_frontmatter(path) -> Optional[Dict[str, Any]]:
+    block = read_frontmatter_block(path)
+    return parse_frontmatter_block(block) if block is not None else None
+
 def parse_yaml_frontmatter(content: str) -> Optional[Dict[str, Any]]:
     if not content.startswith('---') or not YAML_AVAILABLE: return None
     end_marker = content.find('---', 3)
     if end_marker == -1: return None
-    try: 
-        return yaml.safe_load(content[3:end_marker].strip())
-    except yaml.YAMLError: 
-        return None
+    return parse_frontmatter_block(content[3:end_marker])
 
-def build_obsidian_state(target_dir_str: str) -> Dict[str, Any]:
-    state = {"base_path": Path(target_dir_str).resolve(), "folders": set(), "note_files": {}, "moc_files": set(), "asset_files": set(), "assets_folder_rel": "assets"}
-    if not YAML_AVAILABLE or not state["base_path"].is_dir(): return state
-    
-    assets_folder_abs = state["base_path"] / state["assets_folder_rel"]
-    for root, dirs, files in os.walk(state["base_path"]):
-        root_path = Path(root)
-        rel_root_path_str = str(root_path.relative_to(state["base_path"])).replace('\\', '/')
-        if rel_root_path_str == ".": rel_root_path_str = ""
-        
-        dirs[:] = [d for d in dirs if d not in ('.obsidian', '.git')]
-        for dir_name in dirs:
-            if root_path == state["base_path"] and dir_name == state["assets_folder_rel"]: continue
-            state["folders"].add(os.path.join(rel_root_path_str, dir_name).replace('\\', '/'))
-            
-        for filename in files:
-            abs_file_path = root_path / filename
-            rel_file_path_str = os.path.join(rel_root_path_str, filename).replace('\\', '/')
-            
-            if root_path == assets_folder_abs: 
-                state["asset_files"].add(filename); continue
-            if filename == ROOT_MOC_FILENAME or (filename.startswith("_") and filename.endswith("_index.md")): 
-                state["moc_files"].add(rel_file_path_str); continue
-                
-            if filename.endswith(".md"):
+def _scan_vault(base_path: str, assets_folder_rel: str, state: Dict[str, Any]) -> List[Tuple[str, str, os.stat_result]]:
+    """Walk the vault with os.scandir, filling folders/MOCs/assets into *state*.
+
+    Returns (rel_path, abs_path, stat) for every candidate note file. Stat
+    results come from the DirEntry, which is free on Windows and one call
+    elsewhere.
+    """
+    note_candidates = []
+    stack = [("", base_path)]
+    while stack:
+        rel_dir, abs_dir = stack.pop()
+        in_assets = rel_dir == assets_folder_rel
+        try:
+            entries = list(os.scandir(abs_dir))
+        except OSError:
+            continue
+        for entry in entries:
+            name = entry.name
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if name in ('.obsidian', '.git'): continue
+                if not (rel_dir == "" and name == assets_folder_rel):
+                    state["folders"].add(rel_path)
+                # Like os.walk, list symlinked folders but do not descend into them.
+                if not entry.is_symlink(): stack.append((rel_path, entry.path))
+                continue
+
+            if in_assets:
+                state["asset_files"].add(name); continue
+            if name == ROOT_MOC_FILENAME or (name.startswith("_") and name.endswith("_index.md")) or MOC_PAGE_FILENAME.fullmatch(name):
+                state["moc_files"].add(rel_path); continue
+            if name.endswith(".md"):
                 try:
-                    with open(abs_file_path, 'r', encoding='utf-8') as f: frontmatter = parse_yaml_frontmatter(f.read())
-                    if frontmatter and "anki_note_id" in frontmatter:
-                        nid = frontmatter.get("anki_note_id")
-                        if isinstance(nid, int):
-                            state["note_files"][rel_file_path_str] = {
-                                "abs_path": abs_file_path, "anki_note_id": nid,
-                                "anki_note_mod": frontmatter.get("anki_note_mod"), "content_hash": frontmatter.get("content_hash")
-                            }
-                except Exception:
+                    note_candidates.append((rel_path, entry.path, entry.stat()))
+                except OSError:
                     pass
-    return state
\ No newline at end of file
+    return note_candidates
+
+_READ_FAILED = object()
+
+def _read_note_frontmatter_safe(abs_path: str):
+    try:
+        return read_note_frontmatter(abs_path)
+    except Exception:
+        return _READ_FAILED
+
+def build_obsidian_state(target_dir_str: str, manifest: Optional[SyncManifest] = None,
+                         workers: int = DEFAULT_SCAN_WORKERS) -> Dict[str, Any]:
+    """Scan the vault folder for note files, MOCs, folders and assets.
+
+    With a *manifest*, note files whose size and mtime match their manifest
+    entry are taken from it without being opened; everything else is parsed
+    and the manifest refreshed (and committed) at the end of the scan.
+    Frontmatter reads are spread over a pool of *workers* threads, which
+    mostly helps on high-latency (network/cloud-synced) drives.
+    """
+    state = {"base_path": Path(target_dir_str).resolve(), "folders": set(), "note_files": {}, "moc_files": set(), "asset_files": set(), "assets_folder_rel": "assets"}
+    if not YAML_AVAILABLE or not state["base_path"].is_dir(): return state
+
+    candidates = _scan_vault(str(state["base_path"]), state["assets_folder_rel"], state)
+
+    entries: Dict[str, Tuple] = {}
+    to_read = []
+    for rel_path, abs_path, st in candidates:
+        entry = manifest.get(rel_path, st.st_size, st.st_mtime_ns) if manifest is not None else None
+        if entry is not None: entries[rel_path] = entry[:3]
+        else: to_read.append((rel_path, abs_path, st))
+    stats.add({"files_stat": len(candidates), "manifest_hits": len(entries), "frontmatter_reads": len(to_read)})
+
+    if to_read:
+        paths = [abs_path for _, abs_path, _ in to_read]
+        if workers > 1 and len(to_read) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(to_read))) as pool:
+                frontmatters = list(pool.map(_read_note_frontmatter_safe, paths, chunksize=64))
+        else:
+            frontmatters = [_read_note_frontmatter_safe(p) for p in paths]
+        for (rel_path, _, st), frontmatter in zip(to_read, frontmatters):
+            if frontmatter is _READ_FAILED:
+                # Unreadable right now: skip it and leave it out of the manifest so it is retried.
+                entries[rel_path] = (None, None, None)
+                if manifest is not None: manifest.remove(rel_path)
+                continue
+            nid = frontmatter.get("anki_note_id") if isinstance(frontmatter, dict) else None
+            if not isinstance(nid, int): nid = None
+            note_mod = frontmatter.get("anki_note_mod") if nid is not None else None
+            content_hash = frontmatter.get("content_hash") if nid is not None else None
+            entries[rel_path] = (nid, note_mod, content_hash)
+            if manifest is not None:
+                # Unmanaged files are recorded too (nid None) so they are not re-read.
+                manifest.record(rel_path, nid, note_mod, content_hash, st.st_size, st.st_mtime_ns)
+
+    base_path = state["base_path"]
+    for rel_path, _, _ in candidates:
+        nid, note_mod, content_hash = entries[rel_path]
+        if nid is not None:
+            state["note_files"][rel_path] = {
+                "abs_path": base_path / rel_path, "anki_note_id": nid,
+                "anki_note_mod": note_mod, "content_hash": content_hash
+            }
+    if manifest is not None:
+        manifest.prune({rel_path for rel_path, _, _ in candidates})
+        manifest.prune_media(state["asset_files"])
+        manifest.commit()
+    return state
+
+def build_partial_obsidian_state(target_dir_str: str, manifest: SyncManifest, note_ids: Set[int],
+                                 anki_state: Dict[str, Any]) -> Dict[str, Any]:
+    """Vault state covering only *note_ids*, for calculate_diff(..., only_note_ids=note_ids).
+
+    Note files are located through the manifest instead of a vault scan (and
+    re-parsed only if their size/mtime changed). Folders, MOCs and assets are
+    looked up just for the decks those notes are in now or were in before,
+    so the cost follows the number of notes, not the size of the vault.
+    """
+    state = {"base_path": Path(target_dir_str).resolve(), "folders": set(), "note_files": {}, "moc_files": set(), "asset_files": set(), "assets_folder_rel": "assets"}
+    base_path = state["base_path"]
+    if not YAML_AVAILABLE or not base_path.is_dir(): return state
+
+    deck_paths = {path for path, deck in anki_state.items() if path != "_root_" and not deck["notes"].keys().isdisjoint(note_ids)}
+    for rel_path, entry in manifest.paths_for_notes(note_ids).items():
+        abs_path = base_path / rel_path
+        current = manifest.get_current(rel_path, abs_path)
+        stats.count("files_stat"); stats.count("manifest_hits" if current is not None else "frontmatter_reads")
+        if current is None:
+            try: st = os.stat(abs_path); frontmatter = read_note_frontmatter(abs_path)
+            except Exception: manifest.remove(rel_path); continue
+            nid = frontmatter.get("anki_note_id") if isinstance(frontmatter, dict) else None
+            if not isinstance(nid, int): nid = None
+            current = (nid, frontmatter.get("anki_note_mod") if nid else None, frontmatter.get("content_hash") if nid else None)
+            manifest.record(rel_path, *current, st.st_size, st.st_mtime_ns)
+        if current[0] is not None:
+            state["note_files"][rel_path] = {"abs_path": abs_path, "anki_note_id": current[0],
+                                             "anki_note_mod": current[1], "content_hash": current[2]}
+            deck_paths.add(rel_path.rpartition("/")[0])
+
+    for deck_path in deck_paths:
+        if not deck_path: continue
+        try:
+            with os.scandir(base_path / deck_path) as it:
+                state["moc_files"].update(f"{deck_path}/{e.name}" for e in it
+                                          if e.name.startswith("_") and (e.name.endswith("_index.md") or MOC_PAGE_FILENAME.fullmatch(e.name)))
+            state["folders"].add(deck_path)
+        except OSError:
+            pass
+    if (base_path / ROOT_MOC_FILENAME).is_file(): state["moc_files"].add(ROOT_MOC_FILENAME)
+
+    assets_dir = base_path / state["assets_folder_rel"]
+    note_index = get_note_index(anki_state)
+    for nid in note_ids:
+        for name in (note_index[nid].get("required_images", ()) if nid in note_index else ()):
+            if os.path.lexists(assets_dir / name): state["asset_files"].add(name)
+    manifest.commit()
+    return state
+
+MEDIA_HASH_SAMPLE = 64 * 1024
+
+def fast_media_hash(path) -> Optional[str]:
+    """blake2b over the size and the first and last 64 KiB of *path* (the whole file if smaller)."""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            digest = hashlib.blake2b(str(size).encode("ascii"), digest_size=16)
+            digest.update(f.read(MEDIA_HASH_SAMPLE))
+            if size > 2 * MEDIA_HASH_SAMPLE: f.seek(size - MEDIA_HASH_SAMPLE)
+            digest.update(f.read())
+        stats.count("files_opened"); stats.count("bytes_read", min(size, 2 * MEDIA_HASH_SAMPLE))
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+def build_media_state(media_dir: str, anki_state: Dict[str, Any], obsidian_state: Dict[str, Any],
+                      manifest: Optional[SyncManifest] = None, note_ids: Optional[Set[int]] = None) -> Dict[str, Any]:
+    """Find the collection.media files the exported notes need and which vault copies are stale.
+
+    collection.media is listed once; only required files are stat'ed. An asset
+    already in the vault is stale when its source's size/mtime differ from the
+    manifest record. If only the mtime moved, the sampled hashes of source and
+    vault copy decide. Assets the manifest does not know yet (exported by an
+    older version) are compared by size once and then recorded.
+
+    With *note_ids* only the media of those notes is considered.
+
+    Returns {"dir", "sources": {name: (abs_path, size, mtime_ns)}, "changed", "missing"}.
+    """
+    required: Set[str] = set()
+    if note_ids is not None:
+        note_index = get_note_index(anki_state)
+        for nid in note_ids:
+            if nid in note_index: required.update(note_index[nid].get("required_images", ()))
+    else:
+        for deck_path, deck_data in anki_state.items():
+            if deck_path == "_root_": continue
+            for note_data in deck_data.get("notes", {}).values():
+                required.update(note_data.get("required_images", ()))
+    media_state = {"dir": media_dir, "sources": {}, "changed": set(), "missing": set()}
+    if not required: return media_state
+    try:
+        with os.scandir(media_dir) as it: listing = {e.name: e.path for e in it if e.name in required}
+    except OSError as e:
+        log.error("Cannot list Anki media folder %s: %s", media_dir, e); listing = {}
+
+    assets_dir = os.path.join(str(obsidian_state.get("base_path", "")), obsidian_state.get("assets_folder_rel", "assets"))
+    exported = obsidian_state.get("asset_files", set())
+    for name in required:
+        src = listing.get(name)
+        if src is None and name and os.path.basename(name) == name and name not in (".", ".."):
+            src = os.path.join(media_dir, name)  # e.g. differs only in case on a case-insensitive filesystem
+        try:
+            st = os.stat(src) if src else None
+        except OSError:
+            st = None
+        stats.count("files_stat")
+        if st is None or not stat.S_ISREG(st.st_mode):
+            media_state["missing"].add(name); continue
+        media_state["sources"][name] = (src, st.st_size, st.st_mtime_ns)
+        if name not in exported: continue
+        entry = manifest.get_media(name) if manifest is not None else None
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns: continue
+        dst = os.path.join(assets_dir, name)
+        if entry is None:
+            try: unchanged = os.stat(dst).st_size == st.st_size
+            except OSError: unchanged = False
+            fast_hash = None
+        elif entry[0] == st.st_size:
+            fast_hash = fast_media_hash(src)
+            unchanged = fast_hash is not None and fast_hash == (entry[2] or fast_media_hash(dst))
+        else:
+            unchanged = False
+        if unchanged:
+            if manifest is not None: manifest.record_media(name, st.st_size, st.st_mtime_ns, fast_hash)
+        else:
+            media_state["changed"].add(name)
+    if manifest is not None: manifest.commit()
+    if media_state["changed"]: log.info("Media edited in Anki since last export: %d", len(media_state["changed"]))
+    return media_state
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""
+Logging and per-sync error collection.
+
+Every module logs through `log` (the "obsidian_sync" logger), which writes
+to Anki's console/stdout. The level comes from the "logLevel" setting and
+defaults to WARNING, so a normal sync prints nothing; INFO shows the phase
+summaries, DEBUG every file. Log calls use %-style arguments so per-file
+messages cost nothing unless DEBUG is on.
+
+Failures on single files do not stop a sync. Instead of printing each one,
+the phases hand them to `errors`, and the sync summary lists them grouped by
+phase (errors.summary()).
+"""
+
+import logging
+import sys
+import threading
+from typing import Dict, List, Tuple
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+DEFAULT_LOG_LEVEL = "WARNING"
+
+log = logging.getLogger("obsidian_sync")
+
+
+def configure_logging(level: str = DEFAULT_LOG_LEVEL):
+    """Attach the console handler (once) and set the level by name."""
+    if not log.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("Obsidian Sync: %(message)s"))
+        log.addHandler(handler)
+        log.propagate = False
+    log.setLevel(level if level in LOG_LEVELS else DEFAULT_LOG_LEVEL)
+
+
+class SyncErrors:
+    """Thread-safe collection of the per-file failures of one sync."""
+
+    EXAMPLES_PER_PHASE = 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_phase: Dict[str, List[Tuple[str, str]]] = {}
+
+    def reset(self):
+        with self._lock: self._by_phase = {}
+
+    def record(self, phase: str, item, error: BaseException):
+        message = f"{type(error).__name__}: {error}"
+        with self._lock: self._by_phase.setdefault(phase, []).append((str(item), message))
+        log.debug("%s failed for %s: %s", phase, item, message)
+
+    def __len__(self) -> int:
+        with self._lock: return sum(len(items) for items in self._by_phase.values())
+
+    def summary(self) -> str:
+        """One line per phase with a few examples; empty if nothing failed."""
+        with self._lock: by_phase = {phase: list(items) for phase, items in self._by_phase.items()}
+        if not by_phase: return ""
+        lines = [f"{sum(len(items) for items in by_phase.values())} error(s):"]
+        for phase, items in by_phase.items():
+            lines.append(f"  {phase}: {len(items)}")
+            lines.extend(f"    {item}: {message}" for item, message in items[:self.EXAMPLES_PER_PHASE])
+            if len(items) > self.EXAMPLES_PER_PHASE: lines.append(f"    ... and {len(items) - self.EXAMPLES_PER_PHASE} more")
+        return "\n".join(lines)
+
+
+errors = SyncErrors()
+configure_logging()
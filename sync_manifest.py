@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent manifest of the note files the add-on has written to the vault.
+
+Maps each note file's vault-relative path to the Anki note id, note mod time
+and content hash recorded in its frontmatter, together with the file's size
+and mtime at the time it was recorded. For files the executor wrote or
+verified it also keeps a hash of the whole file (frontmatter + body).
+build_obsidian_state trusts entries whose size and mtime still match, so an
+unchanged vault is scanned with stat() alone. Any other file is re-parsed and
+its entry refreshed.
+
+A second table records, for each asset exported to the vault, the size and
+mtime of its source in collection.media when it was copied (plus a sampled
+content hash once one has been computed). A source whose stat no longer
+matches was edited in Anki and is copied again.
+
+A third table lists the MOC files a sync queued for rewriting but has not yet
+written. A sync cancelled (or failing) between the note writes and the MOC
+phase leaves them there, and the next sync rewrites them even though its own
+diff no longer sees the notes as changed.
+
+The meta table also keeps a fingerprint of the deck structure the last
+completed full sync exported (see sync_pipeline.deck_structure), so auto-sync
+can tell, even right after Anki starts, whether a targeted sync is enough.
+
+Stored as SQLite in the add-on's user_files folder (one file per sync target).
+A corrupt database is discarded and rebuilt from the next full scan.
+"""
+
+import os
+import hashlib
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Optional, Set, Tuple
+
+from .config import get_user_files_dir
+from .sync_log import log
+
+SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS note_files (
+    rel_path TEXT PRIMARY KEY,
+    nid INTEGER,
+    mod INTEGER,
+    content_hash TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    file_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS media_files (
+    name TEXT PRIMARY KEY,
+    src_size INTEGER NOT NULL,
+    src_mtime_ns INTEGER NOT NULL,
+    fast_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS pending_mocs (rel_path TEXT PRIMARY KEY);
+"""
+
+# (nid, mod, content_hash, size, mtime_ns, file_hash)
+ManifestEntry = Tuple[Optional[int], Optional[int], Optional[str], int, int, Optional[str]]
+# (src_size, src_mtime_ns, fast_hash)
+MediaEntry = Tuple[int, int, Optional[str]]
+
+
+def manifest_path_for(vault_path: str) -> Optional[str]:
+    """Return the manifest file used for *vault_path*, or None if there is no data dir."""
+    data_dir = get_user_files_dir()
+    if not data_dir:
+        return None
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(vault_path)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(data_dir, f"manifest_{key}.sqlite")
+
+
+class SyncManifest:
+    """rel_path -> (nid, mod, content_hash, size, mtime_ns, file_hash), kept in memory and in SQLite.
+
+    Writes are buffered in an open SQLite transaction until commit() (or the
+    end of a `with manifest.transaction():` block), so a sync that dies
+    half-way leaves the last committed manifest intact.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        version = self._conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if version is None or int(version[0]) != SCHEMA_VERSION:
+            self._conn.execute("DROP TABLE note_files")
+            self._conn.execute("DROP TABLE media_files")
+            self._conn.execute("DROP TABLE pending_mocs")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+            self._conn.commit()
+        self._entries: Dict[str, ManifestEntry] = {}
+        self._media: Dict[str, MediaEntry] = {}
+        self._pending_mocs: Set[str] = set()
+        self._load()
+
+    @classmethod
+    def open(cls, path: Optional[str]) -> Optional["SyncManifest"]:
+        """Open (or create) the manifest at *path*; rebuild it from scratch if corrupt."""
+        if not path:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            return cls(path)
+        except sqlite3.DatabaseError as e:
+            log.warning("Sync manifest %s is unreadable (%s); rebuilding it.", path, e)
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                try: os.remove(path + suffix)
+                except OSError: pass
+            return cls(path)
+
+    def _load(self):
+        self._entries = {
+            row[0]: tuple(row[1:])
+            for row in self._conn.execute("SELECT rel_path, nid, mod, content_hash, size, mtime_ns, file_hash FROM note_files")
+        }
+        self._media = {
+            row[0]: tuple(row[1:])
+            for row in self._conn.execute("SELECT name, src_size, src_mtime_ns, fast_hash FROM media_files")
+        }
+        self._pending_mocs = {row[0] for row in self._conn.execute("SELECT rel_path FROM pending_mocs")}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, rel_path: str, size: int, mtime_ns: int) -> Optional[ManifestEntry]:
+        """Return the entry for *rel_path* if the file still has the recorded size and mtime."""
+        entry = self._entries.get(rel_path)
+        if entry is not None and entry[3] == size and entry[4] == mtime_ns:
+            return entry
+        return None
+
+    def paths_for_notes(self, nids: Set[int]) -> Dict[str, ManifestEntry]:
+        """rel_path -> entry for every recorded file belonging to one of *nids*."""
+        return {rel_path: entry for rel_path, entry in self._entries.items() if entry[0] in nids}
+
+    def get_current(self, rel_path: str, abs_path) -> Optional[ManifestEntry]:
+        """Like get(), taking size/mtime from the file on disk (None if it is missing)."""
+        if rel_path not in self._entries:
+            return None
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            return None
+        return self.get(rel_path, st.st_size, st.st_mtime_ns)
+
+    def record(self, rel_path: str, nid: Optional[int], mod: Optional[int], content_hash: Optional[str],
+               size: int, mtime_ns: int, file_hash: Optional[str] = None):
+        entry = (nid, mod, content_hash, size, mtime_ns, file_hash)
+        if self._entries.get(rel_path) == entry:
+            return
+        self._entries[rel_path] = entry
+        self._conn.execute("INSERT OR REPLACE INTO note_files VALUES (?, ?, ?, ?, ?, ?, ?)", (rel_path, *entry))
+
+    def record_file(self, rel_path: str, abs_path, nid: Optional[int], mod: Optional[int], content_hash: Optional[str],
+                    file_hash: Optional[str] = None):
+        """Record a file the executor just wrote or verified, taking size/mtime from disk."""
+        st = os.stat(abs_path)
+        self.record(rel_path, nid, mod, content_hash, st.st_size, st.st_mtime_ns, file_hash)
+
+    def remove(self, rel_path: str):
+        if self._entries.pop(rel_path, None) is not None:
+            self._conn.execute("DELETE FROM note_files WHERE rel_path = ?", (rel_path,))
+
+    def prune(self, keep: Set[str]):
+        """Drop entries for files that no longer exist in the vault."""
+        for rel_path in [p for p in self._entries if p not in keep]:
+            self.remove(rel_path)
+
+    def get_media(self, name: str) -> Optional[MediaEntry]:
+        return self._media.get(name)
+
+    def record_media(self, name: str, src_size: int, src_mtime_ns: int, fast_hash: Optional[str] = None):
+        """Record the stat of the collection.media file that *name* in the assets folder was copied from."""
+        entry = (src_size, src_mtime_ns, fast_hash)
+        if self._media.get(name) == entry:
+            return
+        self._media[name] = entry
+        self._conn.execute("INSERT OR REPLACE INTO media_files VALUES (?, ?, ?, ?)", (name, *entry))
+
+    def remove_media(self, name: str):
+        if self._media.pop(name, None) is not None:
+            self._conn.execute("DELETE FROM media_files WHERE name = ?", (name,))
+
+    def prune_media(self, keep: Set[str]):
+        """Drop media entries for assets that are no longer in the vault."""
+        for name in [n for n in self._media if n not in keep]:
+            self.remove_media(name)
+
+    def note_ids(self) -> Set[int]:
+        """Every note id with a recorded file."""
+        return {entry[0] for entry in self._entries.values() if entry[0] is not None}
+
+    @staticmethod
+    def read_deck_structure(path: Optional[str]) -> Optional[str]:
+        """The deck structure fingerprint stored at *path*, read without loading the manifest."""
+        if not path or not os.path.isfile(path):
+            return None
+        try:
+            conn = sqlite3.connect(path)
+            try: row = conn.execute("SELECT value FROM meta WHERE key = 'deck_structure'").fetchone()
+            finally: conn.close()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    def record_deck_structure(self, fingerprint: str):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('deck_structure', ?)", (fingerprint,))
+
+    def pending_mocs(self) -> Set[str]:
+        return set(self._pending_mocs)
+
+    def record_pending_mocs(self, rel_paths: Set[str]):
+        """Remember MOCs that must be rewritten; committed at once so a cancelled sync keeps them."""
+        new = set(rel_paths) - self._pending_mocs
+        if not new:
+            return
+        self._pending_mocs |= new
+        self._conn.executemany("INSERT OR REPLACE INTO pending_mocs VALUES (?)", [(p,) for p in new])
+        self._conn.commit()
+
+    def remove_pending_moc(self, rel_path: str):
+        """The MOC at *rel_path* has been written (or already had the right content)."""
+        if rel_path in self._pending_mocs:
+            self._pending_mocs.discard(rel_path)
+            self._conn.execute("DELETE FROM pending_mocs WHERE rel_path = ?", (rel_path,))
+
+    def prune_pending_mocs(self, keep: Set[str]):
+        """Drop pending MOCs that a full sync no longer expects (e.g. of deleted decks)."""
+        for rel_path in [p for p in self._pending_mocs if p not in keep]:
+            self.remove_pending_moc(rel_path)
+
+    def clear(self):
+        """Forget everything; the next vault scan re-reads every file."""
+        self._entries.clear()
+        self._media.clear()
+        self._pending_mocs.clear()
+        self._conn.execute("DELETE FROM note_files")
+        self._conn.execute("DELETE FROM media_files")
+        self._conn.execute("DELETE FROM pending_mocs")
+        self._conn.execute("DELETE FROM meta WHERE key = 'deck_structure'")
+        self._conn.commit()
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+        self._load()
+
+    @contextmanager
+    def transaction(self):
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        else:
+            self.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+
+def rebuild_manifest(vault_path: str):
+    """Discard the manifest for *vault_path* so the next sync re-parses the whole vault."""
+    manifest = SyncManifest.open(manifest_path_for(vault_path))
+    if manifest is not None:
+        manifest.clear()
+        manifest.close()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+The sync pipeline without any UI: extract -> scan -> diff -> execute.
+
+sync_vault is the full sync behind "Sync Now"; sync_notes is the targeted
+sync of a few notes used by auto-sync. Both run on a worker thread and only
+talk to the user through sync_progress, so they also run headless (see
+benchmarks/). Phases are timed into sync_stats.stats.
+"""
+
+import time
+import hashlib
+from typing import Any, Dict, Optional, Set
+
+from .config import SyncSettings, get_conversion_cache_path
+from .state_builder import build_obsidian_state, build_partial_obsidian_state, build_media_state, get_note_index
+from .diff_calculator import calculate_diff
+from .executor import execute_deletions_and_folders, execute_media_copy, execute_note_writes, execute_moc_generation
+from .sync_manifest import SyncManifest, manifest_path_for
+from .sync_progress import progress
+from .sync_log import errors
+from .sync_stats import stats
+
+
+def deck_structure(anki_state: Dict[str, Any]) -> str:
+    """Fingerprint of the exported deck paths and their MOC names; a targeted sync is only valid while it is unchanged."""
+    decks = sorted(f"{path}\t{deck.get('moc_filename')}" for path, deck in anki_state.items() if path != "_root_")
+    return hashlib.sha1("\n".join(decks).encode("utf-8")).hexdigest()
+
+
+def needs_full_sync(anki_state: Dict[str, Any], obsidian_path: str, manifest_path: Optional[str] = None) -> bool:
+    """True unless the last completed full sync of *obsidian_path* exported the same deck structure."""
+    manifest_path = manifest_path or manifest_path_for(obsidian_path)
+    if not manifest_path: return False  # No manifest at all: sync_notes reports it.
+    return SyncManifest.read_deck_structure(manifest_path) != deck_structure(anki_state)
+
+
+def sync_vault(anki_state: Dict[str, Any], media_dir: str, obsidian_path: str, settings: SyncSettings,
+               start_time: float, manifest_path: Optional[str] = None) -> str:
+    """Full sync of an extracted *anki_state*: scan the vault, diff and write. Returns the summary for the user."""
+    manifest = SyncManifest.open(manifest_path or manifest_path_for(obsidian_path))
+    try:
+        with stats.phase("vault_scan"): obsidian_state = build_obsidian_state(obsidian_path, manifest, workers=settings.scan_workers)
+        assets_rel_path = obsidian_state.get("assets_folder_rel", "assets")
+        with stats.phase("media_scan"): media_state = build_media_state(media_dir, anki_state, obsidian_state, manifest)
+        progress.check_cancel()
+
+        with stats.phase("diff"):
+            actions = calculate_diff(anki_state, obsidian_state, media_state, moc_page_size=settings.moc_page_size,
+                                     pending_mocs=manifest.pending_mocs() if manifest is not None else None)
+        if manifest is not None:
+            # Saved before any note is written: if the sync stops short of the MOC phase, the next one finishes it.
+            queued_mocs = actions["mocs_to_create"] | actions["mocs_to_update"]
+            manifest.prune_pending_mocs(queued_mocs); manifest.record_pending_mocs(queued_mocs)
+        deck_count = sum(1 for k in anki_state if k != "_root_")
+        card_count = sum(
+            len(note_data.get("card_ids", []))
+            for deck_data in anki_state.values()
+            if isinstance(deck_data, dict)
+            for note_data in deck_data.get("notes", {}).values()
+        )
+        if not any(v for k, v in actions.items() if isinstance(v, (list, set)) and v):
+            if manifest is not None: manifest.record_deck_structure(deck_structure(anki_state))
+            return (
+                f"Obsidian sync complete. No changes detected.\n\n"
+                f"Scanned {deck_count} deck(s) / {card_count} card(s)."
+            )
+
+        with stats.phase("deletions_and_folders"):
+            execute_deletions_and_folders(actions, obsidian_state["base_path"], assets_rel_path, manifest)
+        with stats.phase("media_copy"):
+            media_stats = execute_media_copy(actions, obsidian_state["base_path"], assets_rel_path,
+                                             workers=settings.media_workers, link_mode=settings.media_link_mode,
+                                             media_state=media_state, manifest=manifest)
+        with stats.phase("note_writes"):
+            write_stats = execute_note_writes(actions, obsidian_state["base_path"], assets_rel_path, manifest,
+                                              workers=settings.conversion_workers,
+                                              cache_path=get_conversion_cache_path() if settings.persistent_conversion_cache else None)
+        with stats.phase("mocs"):
+            execute_moc_generation(actions, anki_state, obsidian_state["base_path"], moc_page_size=settings.moc_page_size,
+                                   manifest=manifest)
+        if manifest is not None: manifest.record_deck_structure(deck_structure(anki_state))
+
+        # --- Build summary statistics ---
+        notes_created = len(actions.get("notes_to_create", []))
+        notes_updated = len(actions.get("notes_to_update", []))
+        notes_deleted = len(actions.get("notes_to_delete", []))
+        return (
+            f"Obsidian sync finished successfully in {time.time() - start_time:.2f} seconds.\n\n"
+            f"Exported {deck_count} deck(s) / {card_count} card(s).\n"
+            f"Notes: {notes_created} created, {notes_updated} updated, {notes_deleted} deleted.\n"
+            f"Writes skipped (content unchanged): {write_stats['skipped']}.\n"
+            f"Conversion cache: {write_stats['memory_hits'] + write_stats['disk_hits']} hit(s), {write_stats['misses']} miss(es).\n"
+            f"Media: {media_stats['copied']} copied, {media_stats['linked'] + media_stats['reflinked']} linked "
+            f"({media_stats['updated']} replacing files edited in Anki), "
+            f"{media_stats['missing']} missing ({(media_stats['bytes_copied'] + media_stats['bytes_linked']) / 1e6:.1f} MB)."
+            + (f"\n\n{errors.summary()}" if errors else "")
+        )
+    finally:
+        if manifest is not None: manifest.close()
+
+
+def sync_notes(anki_state: Dict[str, Any], media_dir: str, obsidian_path: str, settings: SyncSettings,
+               note_ids: Set[int], manifest_path: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """Targeted sync of *note_ids* (see auto_sync). Returns counts, or None without a sync manifest.
+
+    Notes with a file in the vault but no longer in *anki_state* are synced
+    too, so deletions that fired no hook (e.g. from an AnkiWeb sync) are
+    still removed.
+    """
+    manifest = SyncManifest.open(manifest_path or manifest_path_for(obsidian_path))
+    if manifest is None: return None
+    try:
+        note_ids = note_ids | (manifest.note_ids() - get_note_index(anki_state).keys())
+        with stats.phase("vault_scan"): obsidian_state = build_partial_obsidian_state(obsidian_path, manifest, note_ids, anki_state)
+        assets_rel_path = obsidian_state["assets_folder_rel"]
+        with stats.phase("media_scan"): media_state = build_media_state(media_dir, anki_state, obsidian_state, manifest, note_ids=note_ids)
+        with stats.phase("diff"):
+            actions = calculate_diff(anki_state, obsidian_state, media_state, moc_page_size=settings.moc_page_size,
+                                     only_note_ids=note_ids, pending_mocs=manifest.pending_mocs())
+        manifest.record_pending_mocs(actions["mocs_to_create"] | actions["mocs_to_update"])
+        counts = {k: len(actions[k]) for k in ("notes_to_create", "notes_to_update", "notes_to_delete")}
+        if not any(v for k, v in actions.items() if isinstance(v, (list, set)) and v): return counts
+
+        base_path = obsidian_state["base_path"]
+        with stats.phase("deletions_and_folders"): execute_deletions_and_folders(actions, base_path, assets_rel_path, manifest)
+        with stats.phase("media_copy"):
+            execute_media_copy(actions, base_path, assets_rel_path, workers=settings.media_workers,
+                               link_mode=settings.media_link_mode, media_state=media_state, manifest=manifest)
+        with stats.phase("note_writes"):
+            # A handful of notes: converting in-process beats starting the conversion pool
+            execute_note_writes(actions, base_path, assets_rel_path, manifest, workers=1,
+                                cache_path=get_conversion_cache_path() if settings.persistent_conversion_cache else None)
+        with stats.phase("mocs"):
+            execute_moc_generation(actions, anki_state, base_path, moc_page_size=settings.moc_page_size, manifest=manifest)
+        return counts
+    finally:
+        manifest.close()
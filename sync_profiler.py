@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in profiling of a sync ("Sync with Profiling", or any sync while the
+OBSIDIAN_SYNC_PROFILE environment variable is set, or benchmarks/profile_sync.py
+headless).
+
+Each pipeline step is run through SyncProfiler.run(), which profiles it with
+cProfile on whatever thread it runs on; the profiles are merged into one
+`sync.prof` (open with snakeviz, pstats, ...). Meanwhile a sampling thread
+records the stacks of those threads every few milliseconds into
+`sync.collapsed`, one "frame;frame;frame count" line per stack, the input
+format of flamegraph.pl and speedscope. The sampler can only look while it
+holds the GIL, so calls that release it (file I/O) are over-represented;
+sync.prof is the better guide to CPU time. `slowest_notes.json` lists the notes
+whose Markdown conversion took longest (from sync_stats), with their deck,
+field size and number of tables and math spans, to find pathological notes.
+`summary.txt` holds the top functions by cumulative time.
+
+cProfile only sees the threads it runs on, so a profiled sync uses one scan,
+media and conversion worker (see profiled_settings()).
+"""
+
+import cProfile
+import dataclasses
+import io
+import json
+import os
+import pstats
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import SyncSettings, get_user_files_dir
+from .state_builder import get_note_index
+from .sync_log import log
+from .sync_stats import stats
+
+PROFILE_ENV_VAR = "OBSIDIAN_SYNC_PROFILE"
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+KEEP_PROFILES = 10       # older profile folders are removed
+SUMMARY_LINES = 40
+
+
+def profiling_requested() -> bool:
+    return os.environ.get(PROFILE_ENV_VAR, "") not in ("", "0")
+
+
+def profiled_settings(settings: SyncSettings) -> SyncSettings:
+    """Run every phase on the profiled threads: no worker threads or processes."""
+    return dataclasses.replace(settings, scan_workers=1, media_workers=1, conversion_workers=1)
+
+
+def get_profiles_dir() -> Optional[str]:
+    data_dir = get_user_files_dir()
+    return os.path.join(data_dir, "profiles") if data_dir else None
+
+
+class SyncProfiler:
+    def __init__(self, out_root: Optional[str] = None):
+        self.out_root = out_root or get_profiles_dir()
+        self._lock = threading.Lock()
+        self._profiles: List[cProfile.Profile] = []
+        self._threads: Dict[int, str] = {}
+        self._samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._sample, name="obsidian-sync-sampler", daemon=True)
+        self._sampler.start()
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Call fn(*args, **kwargs) under cProfile and the sampler."""
+        ident = threading.get_ident()
+        profile = cProfile.Profile()
+        with self._lock: self._threads[ident] = threading.current_thread().name
+        profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._lock:
+                self._threads.pop(ident, None)
+                self._profiles.append(profile)
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            with self._lock: threads = dict(self._threads)
+            if not threads: continue
+            frames = sys._current_frames()
+            for ident, thread_name in threads.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(thread_name)
+                    self._samples[";".join(reversed(stack))] += 1
+
+    def finish(self, anki_state: Optional[Dict[str, Any]] = None, top_notes: int = 20) -> Optional[str]:
+        """Stop sampling and write the profile folder; returns its path."""
+        self._stop.set()
+        if self._sampler is not None: self._sampler.join()
+        if not self.out_root: return None
+        out_dir = base = os.path.join(self.out_root, time.strftime("%Y%m%d-%H%M%S"))
+        n = 1
+        while os.path.exists(out_dir): n += 1; out_dir = f"{base}-{n}"
+        try:
+            os.makedirs(out_dir)
+            with self._lock: profiles = list(self._profiles)
+            if profiles:
+                merged = pstats.Stats(profiles[0])
+                for profile in profiles[1:]: merged.add(profile)
+                merged.dump_stats(os.path.join(out_dir, "sync.prof"))
+                text = io.StringIO()
+                pstats.Stats(os.path.join(out_dir, "sync.prof"), stream=text).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+                with open(os.path.join(out_dir, "summary.txt"), "w", encoding="utf-8") as f: f.write(text.getvalue())
+            with open(os.path.join(out_dir, "sync.collapsed"), "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in self._samples.most_common())
+            with open(os.path.join(out_dir, "slowest_notes.json"), "w", encoding="utf-8") as f:
+                json.dump(self.slowest_notes(anki_state, top_notes), f, indent=2, ensure_ascii=False)
+            self._prune()
+        except OSError as e:
+            log.warning("Could not write profile to %s: %s", out_dir, e)
+            return None
+        log.info("Sync profile written to %s", out_dir)
+        return out_dir
+
+    @staticmethod
+    def slowest_notes(anki_state: Optional[Dict[str, Any]], top: int) -> List[Dict[str, Any]]:
+        slowest = stats.slowest_notes()[:top]
+        note_index = get_note_index(anki_state) if anki_state else {}
+        wanted = {nid for nid, _ in slowest}
+        decks = {nid: path for path, deck in (anki_state or {}).items() if path != "_root_"
+                 for nid in wanted.intersection(deck.get("notes", {}))}
+        rows = []
+        for note_id, seconds in slowest:
+            row = {"note_id": note_id, "conversion_ms": round(seconds * 1000, 3)}
+            record = note_index.get(note_id)
+            if record is not None:
+                html = "".join(value or "" for value in record.get("relevant_fields", {}).values())
+                row.update(deck=decks.get(note_id), filename=record.get("target_filename"),
+                           note_type=record.get("note_type_name"), html_chars=len(html),
+                           tables=html.lower().count("<table"),
+                           math_spans=sum(html.count(m) for m in ("\\(", "\\[", "<anki-mathjax")))
+            rows.append(row)
+        return rows
+
+    def _prune(self):
+        try: folders = sorted(e.path for e in os.scandir(self.out_root) if e.is_dir())
+        except OSError: return
+        for path in folders[:-KEEP_PROFILES]: shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+Thread-safe progress reporting and cancellation for the sync pipeline.
+
+The phases call `progress.start/update/finish` the way they used to call
+mw.progress. On Anki's main thread the calls go straight to mw.progress;
+from the background sync threads they are handed to the main thread with
+mw.taskman.run_on_main, and updates that pile up before the main thread
+gets to them are merged into one. Nested start()/finish() pairs share the
+dialog of the outermost one (an inner start() only resets its bar).
+Updates are rate-limited to `updates_per_second`; calls in between are
+dropped (each update carries the full label/value, so the next one catches
+up). Hot loops check due() first so they do not even build the label.
+
+begin()/end() bracket one sync run; a second begin() while a run is active
+returns False, so manual and automatic syncs never overlap. A quiet run
+(auto-sync) shows no progress dialog at all.
+
+Cancellation: closing the progress dialog (which is modal, so it is the
+only way in) sets a flag; the pipeline calls check_cancel() between items,
+which raises SyncCancelled on the worker thread.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from aqt import mw
+
+DEFAULT_UPDATES_PER_SECOND = 10
+
+
+class SyncCancelled(Exception):
+    """Raised by check_cancel() once the user asked the running sync to stop."""
+
+
+class SyncProgress:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._depth = 0
+        self._pending: Dict[str, Any] = {}
+        self._scheduled = False
+        self._running = False
+        self._quiet = False
+        self._interval = 1.0 / DEFAULT_UPDATES_PER_SECOND
+        self._next_update = 0.0
+
+    def begin(self, quiet: bool = False, updates_per_second: int = DEFAULT_UPDATES_PER_SECOND) -> bool:
+        """Mark a sync as running; False if one already is."""
+        with self._lock:
+            if self._running: return False
+            self._running, self._quiet = True, quiet
+            self._interval, self._next_update = 1.0 / max(1, updates_per_second), 0.0
+        self._cancel.clear()
+        return True
+
+    def end(self):
+        self.finish_all()
+        with self._lock: self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @staticmethod
+    def _on_main(fn: Callable[[], None]):
+        if threading.current_thread() is threading.main_thread(): fn()
+        else: mw.taskman.run_on_main(fn)
+
+    def start(self, label: str = "", max: int = 0, immediate: bool = True):
+        with self._lock:
+            self._depth += 1
+            outermost = self._depth == 1
+        if self._quiet: return
+        if outermost: self._on_main(lambda: mw.progress.start(label=label, max=max, immediate=immediate))
+        else: self.update(label=label, value=0, max=max, force=True)
+
+    def due(self) -> bool:
+        """True if an update() now would reach the dialog."""
+        return not self._quiet and time.monotonic() >= self._next_update
+
+    def update(self, label: str = None, value: int = None, max: int = None, force: bool = False):
+        if self._quiet: return
+        now = time.monotonic()
+        if not force and now < self._next_update: return
+        self._next_update = now + self._interval
+        with self._lock:
+            if label is not None: self._pending["label"] = label
+            if value is not None: self._pending["value"] = value
+            if max is not None: self._pending["max"] = max
+            if self._scheduled: return
+            self._scheduled = True
+        self._on_main(self._flush)
+
+    def _flush(self):
+        with self._lock:
+            kwargs, self._pending, self._scheduled = self._pending, {}, False
+        want_cancel = getattr(mw.progress, "want_cancel", None)
+        if want_cancel and want_cancel(): self._cancel.set()
+        if kwargs: mw.progress.update(**kwargs)
+
+    def finish(self):
+        with self._lock:
+            if self._depth == 0: return
+            self._depth -= 1
+            last = self._depth == 0
+        if last and not self._quiet: self._on_main(mw.progress.finish)
+
+    def finish_all(self):
+        """Close the dialog however many phases were left open (e.g. by an exception)."""
+        with self._lock:
+            depth, self._depth = self._depth, 0
+        if depth and not self._quiet: self._on_main(mw.progress.finish)
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancel(self):
+        if self._cancel.is_set(): raise SyncCancelled()
+
+
+progress = SyncProgress()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-sync instrumentation: wall/CPU time per phase, file and byte counters,
+a histogram of per-note conversion times and the slowest notes.
+
+One sync runs at a time, so the phases record into the module-level `stats`
+(reset when a sync starts, like sync_log.errors) from whichever thread they
+run on. At the end the sync writes a JSON report to the add-on's user_files
+folder (sync_report.json) and appends it to sync_report_history.jsonl,
+which keeps the last HISTORY_LIMIT syncs so regressions between versions
+show up side by side.
+
+CPU time is this process's (all threads); conversions running in the
+conversion process pool are only visible in the per-note times.
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import get_sync_report_path, get_addon_version
+from .sync_log import log, errors
+
+HISTORY_LIMIT = 200
+SLOWEST_NOTES = 20
+# Upper bounds (ms) of the conversion-time histogram buckets; a last bucket holds everything slower.
+CONVERSION_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# counter name pairs (hits, misses) reported as hit rates
+HIT_RATES = {
+    "extraction": (("notes_reused",), ("notes_fetched",)),
+    "vault_scan": (("manifest_hits",), ("frontmatter_reads",)),
+    "conversion_cache": (("memory_hits", "disk_hits"), ("misses",)),
+}
+
+
+class SyncStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, kind: str = "full"):
+        with self._lock:
+            self.kind = kind
+            self.started = time.time()
+            self._start_wall = time.perf_counter()
+            self._start_cpu = time.process_time()
+            self.phases: Dict[str, Dict[str, float]] = {}
+            self.counters: Counter = Counter()
+            self._histogram = [0] * (len(CONVERSION_BUCKETS_MS) + 1)
+            self._slowest: List[Tuple[float, int]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block; repeated phases of the same name add up."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self._lock:
+                totals = self.phases.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0})
+                totals["wall_s"] += wall; totals["cpu_s"] += cpu
+
+    def count(self, name: str, n: int = 1):
+        with self._lock: self.counters[name] += n
+
+    def add(self, counts: Dict[str, int]):
+        with self._lock: self.counters.update({k: v for k, v in counts.items() if isinstance(v, int)})
+
+    def note_time(self, note_id: int, seconds: float):
+        """Record one note's Markdown conversion time."""
+        ms = seconds * 1000
+        bucket = next((i for i, bound in enumerate(CONVERSION_BUCKETS_MS) if ms <= bound), len(CONVERSION_BUCKETS_MS))
+        with self._lock:
+            self._histogram[bucket] += 1; self.counters["conversion_us"] += int(seconds * 1e6)
+            if len(self._slowest) < SLOWEST_NOTES: heapq.heappush(self._slowest, (seconds, note_id))
+            elif seconds > self._slowest[0][0]: heapq.heapreplace(self._slowest, (seconds, note_id))
+
+    def slowest_notes(self) -> List[Tuple[int, float]]:
+        """(note id, seconds) of the slowest conversions, slowest first."""
+        with self._lock: return [(nid, s) for s, nid in sorted(self._slowest, reverse=True)]
+
+    def to_dict(self, outcome: str = "ok", **extra) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            phases = {name: {k: round(v, 4) for k, v in t.items()} for name, t in self.phases.items()}
+            histogram = list(self._histogram)
+        labels = [f"<={b}ms" for b in CONVERSION_BUCKETS_MS] + [f">{CONVERSION_BUCKETS_MS[-1]}ms"]
+        hit_rates = {}
+        for name, (hits, misses) in HIT_RATES.items():
+            h = sum(counters.get(k, 0) for k in hits); total = h + sum(counters.get(k, 0) for k in misses)
+            if total: hit_rates[name] = round(h / total, 4)
+        return {
+            "version": get_addon_version(), "kind": self.kind, "outcome": outcome,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "wall_s": round(time.perf_counter() - self._start_wall, 4),
+            "cpu_s": round(time.process_time() - self._start_cpu, 4),
+            "phases": phases, "counters": counters, "hit_rates": hit_rates,
+            "conversion_ms_histogram": dict(zip(labels, histogram)),
+            "slowest_notes": [{"note_id": nid, "ms": round(s * 1000, 3)} for nid, s in self.slowest_notes()],
+            "errors": len(errors), **extra,
+        }
+
+    def write_report(self, outcome: str = "ok", path: Optional[str] = None, **extra) -> Optional[str]:
+        """Write sync_report.json and append to the rolling history; returns the report path."""
+        path = path or get_sync_report_path()
+        if not path: return None
+        report = self.to_dict(outcome, **extra)
+        history_path = os.path.splitext(path)[0] + "_history.jsonl"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+            try:
+                with open(history_path, encoding="utf-8") as f: history = f.read().splitlines()[-(HISTORY_LIMIT - 1):]
+            except FileNotFoundError:
+                history = []
+            history.append(json.dumps(report, separators=(",", ":")))
+            with open(history_path, "w", encoding="utf-8") as f: f.write("\n".join(history) + "\n")
+        except OSError as e:
+            log.warning("Could not write sync report %s: %s", path, e)
+            return None
+        log.info("Sync report written to %s", path)
+        return path
+
+
+stats = SyncStats()
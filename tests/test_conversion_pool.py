@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""
+Converting note bodies on the spawn process pool (conversionWorkers > 1)
+gives the same Markdown as in-process, without putting the add-on folder on
+Anki's sys.path or importing html_converter a second time.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import fake_anki
+
+mw = fake_anki.install()
+executor = fake_anki.addon_module("executor")
+state_builder = fake_anki.addon_module("state_builder")
+
+
+def _note_actions(n):
+    state_builder.clear_anki_state_cache()
+    col = fake_anki.make_collection(n, table_every=7, math_every=5)
+    mw.col = col
+    state = state_builder.build_anki_state(col, incremental=False)
+    return [{"anki_note_data": record} for path, deck in state.items() if path != "_root_" for record in deck["notes"].values()]
+
+
+def _bodies(actions, workers):
+    executor.configure_conversion_cache(None).clear()
+    return list(executor.iter_note_bodies(actions, workers=workers))
+
+
+def test_pool_matches_in_process_and_leaves_the_parent_alone(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(executor.log, "warning", lambda *args: warnings.append(args))
+    actions = _note_actions(executor.MIN_NOTES_FOR_POOL + 50)
+    expected = _bodies(actions, 1)
+    path_before = list(sys.path)
+    assert _bodies(actions, 2) == expected
+    assert warnings == []  # no fallback to in-process conversion
+    assert sys.path == path_before
+    assert "html_converter" not in sys.modules
+
+
+def test_frozen_build_converts_in_process(monkeypatch):
+    actions = _note_actions(executor.MIN_NOTES_FOR_POOL + 50)
+    monkeypatch.setattr(sys, "frozen", True, raising=False)
+    monkeypatch.setattr(executor, "_conversion_pool", lambda workers: (_ for _ in ()).throw(AssertionError("pool started")))
+    assert _bodies(actions, 2) == _bodies(actions, 1)
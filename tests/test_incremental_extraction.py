@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Incremental extraction (incrementalExtraction): a note that cannot be read
+must not force every later sync back to a full re-extraction.
+
+Runs build_anki_state against benchmarks/fake_anki:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import fake_anki
+
+mw = fake_anki.install()
+config = fake_anki.addon_module("config")
+state_builder = fake_anki.addon_module("state_builder")
+sync_log = fake_anki.addon_module("sync_log")
+stats = fake_anki.addon_module("sync_stats").stats
+
+N_NOTES = 500
+
+
+@pytest.fixture
+def col():
+    state_builder.clear_anki_state_cache(); sync_log.errors.reset()
+    col = fake_anki.make_collection(N_NOTES, n_decks=5)
+    mw.col = col
+    return col
+
+
+def _extract(col):
+    stats.reset("full")
+    anki_state = state_builder.build_anki_state(
+        col, settings=config.SyncSettings(incremental_extraction=True, scan_workers=1))
+    return anki_state, stats.counters["notes_fetched"]
+
+
+def _at_watermark(col):
+    """Notes an unchanged collection re-reads anyway: the watermark comparison is inclusive."""
+    return len(set(col.db.list("SELECT id FROM notes WHERE mod = (SELECT max(mod) FROM notes)"))
+               | set(col.db.list("SELECT nid FROM cards WHERE mod = (SELECT max(mod) FROM cards)")))
+
+
+def _exported(anki_state):
+    return set(anki_state["_root_"]["note_index"])
+
+
+def test_unreadable_note_keeps_the_cache(col, monkeypatch):
+    bad_nid = col.db.list("SELECT id FROM notes ORDER BY id")[7]
+    note_record = state_builder._note_record
+    def failing_record(note, *args):
+        if note.id == bad_nid: raise ValueError("broken note")
+        return note_record(note, *args)
+    monkeypatch.setattr(state_builder, "_note_record", failing_record)
+
+    anki_state, fetched = _extract(col)
+    assert fetched == N_NOTES and bad_nid not in _exported(anki_state)
+    assert "Reading notes" in sync_log.errors.summary()
+
+    anki_state, fetched = _extract(col)
+    assert fetched == _at_watermark(col) + 1  # Only the unreadable note is retried.
+    assert len(_exported(anki_state)) == N_NOTES - 1
+
+    monkeypatch.setattr(state_builder, "_note_record", note_record)
+    anki_state, fetched = _extract(col)
+    assert fetched == _at_watermark(col) + 1 and bad_nid in _exported(anki_state)
+
+
+def test_note_without_note_type_keeps_the_cache(col):
+    orphan_nid = col.db.list("SELECT id FROM notes ORDER BY id")[3]
+    col._conn.execute("UPDATE notes SET mid = ? WHERE id = ?", (999_999, orphan_nid))
+
+    _, fetched = _extract(col)
+    assert fetched == N_NOTES
+    anki_state, fetched = _extract(col)
+    assert fetched == _at_watermark(col) + 1
+    assert orphan_nid not in _exported(anki_state) and len(_exported(anki_state)) == N_NOTES - 1
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+Paginated deck MOCs (mocPageSize): which MOC files a sync writes when the
+page size is switched on/off or changes, and when a single note is edited.
+
+Runs the real pipeline against benchmarks/fake_anki and a temporary vault:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import fake_anki
+
+mw = fake_anki.install()
+config = fake_anki.addon_module("config")
+state_builder = fake_anki.addon_module("state_builder")
+diff_calculator = fake_anki.addon_module("diff_calculator")
+sync_manifest = fake_anki.addon_module("sync_manifest")
+sync_pipeline = fake_anki.addon_module("sync_pipeline")
+sync_progress = fake_anki.addon_module("sync_progress")
+
+N_NOTES = 200
+
+
+class Vault:
+    """One generated single-deck collection and the vault it is synced into."""
+
+    def __init__(self, tmp_path):
+        state_builder.clear_anki_state_cache()
+        self.col = fake_anki.make_collection(N_NOTES, n_decks=1)
+        mw.col = self.col
+        self.path = str(tmp_path / "vault"); os.makedirs(self.path)
+        self.manifest_path = str(tmp_path / "manifest.sqlite")
+        self.deck_path = next(p for p, deck in self.anki_state().items() if p != "_root_" and deck["notes"])
+
+    @staticmethod
+    def settings(page_size):
+        return config.SyncSettings(moc_page_size=page_size, scan_workers=1, media_workers=1, conversion_workers=1,
+                                   persistent_conversion_cache=False)
+
+    def anki_state(self):
+        return state_builder.build_anki_state(self.col, settings=self.settings(0))
+
+    def sync(self, page_size):
+        sync_pipeline.sync_vault(self.anki_state(), "", self.path, self.settings(page_size), time.time(),
+                                 manifest_path=self.manifest_path)
+
+    def diff(self, page_size):
+        anki_state = self.anki_state()
+        manifest = sync_manifest.SyncManifest.open(self.manifest_path)
+        try: obsidian_state = state_builder.build_obsidian_state(self.path, manifest, workers=1)
+        finally: manifest.close()
+        return diff_calculator.calculate_diff(anki_state, obsidian_state, moc_page_size=page_size)
+
+    @property
+    def index_rel_path(self):
+        return self.anki_state()["_root_"]["deck_tree"].moc_rel_path(self.deck_path)
+
+    def read(self, rel_path):
+        with open(os.path.join(self.path, rel_path), encoding="utf-8") as f: return f.read()
+
+    def page_files(self):
+        folder = os.path.join(self.path, os.path.dirname(self.index_rel_path))
+        index_name = os.path.basename(self.index_rel_path)[:-3]
+        return sorted(f for f in os.listdir(folder) if f.startswith(index_name + "_"))
+
+    def edit_note(self, nid):
+        mod = self.col.db.scalar("SELECT max(mod) FROM notes") + 1
+        self.col._conn.execute("UPDATE notes SET flds = replace(flds, 'Question', 'Edited question'), mod = ? WHERE id = ?", (mod, nid))
+
+
+@pytest.fixture
+def vault(tmp_path):
+    return Vault(tmp_path)
+
+
+def _note_links(text):
+    return [line for line in text.splitlines() if line.startswith("- [[") and "_index_" not in line]
+
+
+def test_turning_pagination_on_and_off_rewrites_the_index(vault):
+    vault.sync(0)
+    assert len(_note_links(vault.read(vault.index_rel_path))) == N_NOTES
+
+    vault.sync(20)  # no note edits in between
+    pages = vault.page_files()
+    assert len(pages) == 16
+    index = vault.read(vault.index_rel_path)
+    assert "## Pages" in index and not _note_links(index)
+    assert sum(len(_note_links(vault.read(os.path.join(os.path.dirname(vault.index_rel_path), p)))) for p in pages) == N_NOTES
+
+    vault.sync(0)
+    assert vault.page_files() == []
+    index = vault.read(vault.index_rel_path)
+    assert "## Pages" not in index and len(_note_links(index)) == N_NOTES
+
+
+def test_unchanged_vault_with_unchanged_page_size_writes_no_mocs(vault):
+    vault.sync(20)
+    actions = vault.diff(20)
+    assert not actions["mocs_to_create"] and not actions["mocs_to_update"] and not actions["mocs_to_delete"]
+
+
+def test_page_count_doubling_redeals_every_page(vault):
+    vault.sync(25)  # 200 notes -> 8 pages
+    assert len(vault.page_files()) == 8
+
+    actions = vault.diff(10)  # -> 32 pages
+    assert vault.index_rel_path in actions["mocs_to_update"]
+    assert len(actions["mocs_to_create"]) == 24 and len(actions["mocs_to_update"] - {vault.index_rel_path, state_builder.ROOT_MOC_FILENAME}) == 8
+
+    vault.sync(10)
+    pages = vault.page_files()
+    assert len(pages) == 32
+    assert vault.read(vault.index_rel_path).count("_index_") == 32
+    folder = os.path.dirname(vault.index_rel_path)
+    links = [link for p in pages for link in _note_links(vault.read(os.path.join(folder, p)))]
+    assert len(links) == len(set(links)) == N_NOTES
+
+
+def test_single_note_edit_rewrites_exactly_one_page(vault):
+    vault.sync(20)
+    nid = vault.col.db.scalar("SELECT id FROM notes WHERE flds LIKE 'Question%' LIMIT 1")
+    vault.edit_note(nid)
+
+    actions = vault.diff(20)
+    folder = os.path.dirname(vault.index_rel_path)
+    page = f"{folder}/{state_builder.moc_page_filename(os.path.basename(vault.index_rel_path), state_builder.moc_page_of(nid, 16))}"
+    assert actions["mocs_to_update"] - {state_builder.ROOT_MOC_FILENAME} == {page}
+    assert not actions["mocs_to_create"] and not actions["mocs_to_delete"]
+
+    before = {p: vault.read(os.path.join(folder, p)) for p in vault.page_files()}
+    vault.sync(20)
+    changed = [p for p in vault.page_files() if vault.read(os.path.join(folder, p)) != before[p]]
+    assert [f"{folder}/{p}" for p in changed] == [page]
+
+
+@pytest.mark.parametrize("page_size", [0, 20])
+def test_mocs_skipped_by_a_cancelled_sync_are_written_by_the_next_one(vault, monkeypatch, page_size):
+    vault.sync(page_size)
+    nid = vault.col.db.scalar("SELECT id FROM notes WHERE flds LIKE 'Question%' LIMIT 1")
+    vault.edit_note(nid)
+
+    def cancelled(*args, **kwargs): raise sync_progress.SyncCancelled()
+    monkeypatch.setattr(sync_pipeline, "execute_moc_generation", cancelled)
+    with pytest.raises(sync_progress.SyncCancelled): vault.sync(page_size)
+    monkeypatch.undo()
+
+    # The note file was renamed, so this diff alone no longer sees the deck as changed.
+    vault.sync(page_size)
+    folder = os.path.dirname(vault.index_rel_path)
+    mocs = [vault.index_rel_path] + [f"{folder}/{p}" for p in vault.page_files()]
+    links = [link for moc in mocs for link in _note_links(vault.read(moc))]
+    assert len(links) == N_NOTES and sum("Edited question" in link for link in links) == 1
+    assert not vault.diff(page_size)["mocs_to_update"]
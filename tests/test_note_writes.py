@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+Note writes: a note whose mod time changed without any exported change is
+not rewritten, and is not queued again by the next sync.
+
+Runs the real pipeline against benchmarks/fake_anki and a temporary vault:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import fake_anki
+
+mw = fake_anki.install()
+config = fake_anki.addon_module("config")
+state_builder = fake_anki.addon_module("state_builder")
+sync_pipeline = fake_anki.addon_module("sync_pipeline")
+stats = fake_anki.addon_module("sync_stats").stats
+
+N_NOTES = 100
+SETTINGS = config.SyncSettings(scan_workers=1, media_workers=1, conversion_workers=1, persistent_conversion_cache=False)
+
+
+@pytest.fixture
+def vault(tmp_path):
+    col = fake_anki.make_collection(N_NOTES, n_decks=4)
+    mw.col = col
+    path = str(tmp_path / "vault"); os.makedirs(path)
+    manifest_path = str(tmp_path / "manifest.sqlite")
+
+    def sync():
+        stats.reset("full")
+        anki_state = state_builder.build_anki_state(col, settings=SETTINGS, incremental=False)
+        sync_pipeline.sync_vault(anki_state, "", path, SETTINGS, time.time(), manifest_path=manifest_path)
+        return dict(stats.counters)
+
+    sync()
+    return col, path, sync
+
+
+def _files(path):
+    return {os.path.join(d, f): os.stat(os.path.join(d, f)).st_mtime_ns for d, _, fs in os.walk(path) for f in fs}
+
+
+def test_mod_only_bump_skips_the_write_and_is_not_requeued(vault):
+    col, path, sync = vault
+    nids = col.db.list("SELECT id FROM notes ORDER BY id LIMIT 10")
+    mod = col.db.scalar("SELECT max(mod) FROM notes") + 1
+    col._conn.executemany("UPDATE notes SET mod = ? WHERE id = ?", [(mod, nid) for nid in nids])
+    before = _files(path)
+
+    counters = sync()
+    assert counters.get("notes_written", 0) == 0 and counters["notes_skipped"] == len(nids)
+    assert _files(path) == before
+
+    counters = sync()
+    assert "notes_skipped" not in counters and "notes_written" not in counters
+
+
+def test_field_edit_is_still_written(vault):
+    col, path, sync = vault
+    nid = col.db.scalar("SELECT id FROM notes WHERE flds LIKE '%</b>%' LIMIT 1")
+    mod = col.db.scalar("SELECT max(mod) FROM notes") + 1
+    col._conn.execute("UPDATE notes SET flds = replace(flds, '</b>', '</b> edited'), mod = ? WHERE id = ?", (mod, nid))
+
+    counters = sync()
+    assert counters["notes_written"] == 1
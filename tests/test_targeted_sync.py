@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""
+Targeted sync (auto-sync's sync_notes): when it falls back to a full sync,
+and deletions that reach the collection without naming their notes.
+
+Runs the real pipeline against benchmarks/fake_anki and a temporary vault:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import fake_anki
+
+mw = fake_anki.install()
+config = fake_anki.addon_module("config")
+state_builder = fake_anki.addon_module("state_builder")
+sync_pipeline = fake_anki.addon_module("sync_pipeline")
+
+N_NOTES = 100
+SETTINGS = config.SyncSettings(scan_workers=1, media_workers=1, conversion_workers=1, persistent_conversion_cache=False)
+
+
+@pytest.fixture
+def vault(tmp_path):
+    col = fake_anki.make_collection(N_NOTES, n_decks=4)
+    mw.col = col
+    path = str(tmp_path / "vault"); os.makedirs(path)
+    return col, path, str(tmp_path / "manifest.sqlite")
+
+
+def _anki_state(col):
+    return state_builder.build_anki_state(col, settings=SETTINGS, incremental=False)
+
+
+def _note_files(path):
+    return {f for _, _, files in os.walk(path) for f in files if not f.startswith("_")}
+
+
+def test_full_sync_needed_until_the_deck_structure_is_recorded(vault):
+    col, path, manifest_path = vault
+    assert sync_pipeline.needs_full_sync(_anki_state(col), path, manifest_path)  # never synced
+
+    sync_pipeline.sync_vault(_anki_state(col), "", path, SETTINGS, time.time(), manifest_path=manifest_path)
+    assert not sync_pipeline.needs_full_sync(_anki_state(col), path, manifest_path)
+
+    nid = col.db.scalar("SELECT id FROM notes LIMIT 1")
+    col._conn.execute("UPDATE cards SET did = ? WHERE nid = ?", (col.decks.add("Added deck"), nid))
+    assert sync_pipeline.needs_full_sync(_anki_state(col), path, manifest_path)
+
+
+def test_targeted_sync_removes_notes_deleted_without_a_hook(vault):
+    col, path, manifest_path = vault
+    sync_pipeline.sync_vault(_anki_state(col), "", path, SETTINGS, time.time(), manifest_path=manifest_path)
+    before = _note_files(path)
+    assert len(before) == N_NOTES
+
+    nid = col.db.scalar("SELECT id FROM notes LIMIT 1")
+    col._conn.execute("DELETE FROM cards WHERE nid = ?", (nid,)); col._conn.execute("DELETE FROM notes WHERE id = ?", (nid,))
+    counts = sync_pipeline.sync_notes(_anki_state(col), "", path, SETTINGS, set(), manifest_path=manifest_path)
+    assert counts["notes_to_delete"] == 1
+    assert len(_note_files(path)) == N_NOTES - 1 and _note_files(path) < before